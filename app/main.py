@@ -7,9 +7,13 @@ load_dotenv()
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from app.routers import user_routes, habit_routes, record_routes, excel_routes
+from app.routers import user_routes, habit_routes, record_routes, excel_routes, stats_routes, analytics_routes, sync_routes
 from app.database.config import engine, Base
 from app.models import models
+from app.services import response_cache
+from app.services.auth import token_cache, user_cache
+from app.services.hashing import password_hasher
+from app.services.throttle import login_throttle
 
 # Aquí importo todas las dependencias necesarias de FastAPI,
 # mis rutas personalizadas (users, habits y records),
@@ -25,9 +29,13 @@ app = FastAPI(title="Habit Tracker API", version="1.0")
 # Incluyo las rutas que he definido en otros archivos (users, habits, records y excel),
 # para que estén disponibles en la API.
 app.include_router(user_routes.router)
+app.include_router(habit_routes.service_router)
 app.include_router(habit_routes.router)
 app.include_router(record_routes.router)
 app.include_router(excel_routes.router)
+app.include_router(stats_routes.router)
+app.include_router(analytics_routes.router)
+app.include_router(sync_routes.router)
 
 # Configuro CORS para permitir que mi frontend pueda comunicarse con esta API
 app.add_middleware(
@@ -43,6 +51,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],  # Cursor de /records/habit/{id} y ETag de las respuestas cacheables
 )
 
 # Creo la carpeta para archivos estáticos si no existe
@@ -57,9 +66,21 @@ def root():
     return {"message": "Bienvenido a la Habit Tracker API funcionando correctamente"}
 
 # Creo otra ruta (GET /health) que sirve como punto de verificación de salud del servicio.
+# También muestra el estado del pool de hash de contraseñas (procesos, cola, pendientes y rechazos).
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "password_hashing": password_hasher.stats()}
+
+# Contadores del proceso: límite de intentos de login y registro (permitidos y
+# rechazados por ámbito), pool de hash y cachés de respuestas y de autenticación.
+@app.get("/metrics")
+def metrics():
+    return {
+        "throttle": login_throttle.stats(),
+        "password_hashing": password_hasher.stats(),
+        "response_cache": response_cache.cache.stats(),
+        "auth_cache": {"tokens": token_cache.stats(), "users": user_cache.stats()},
+    }
 
 
 
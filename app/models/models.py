@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Date, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Text, JSON, LargeBinary, Boolean, Date, ForeignKey, DateTime, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database.config import Base
@@ -20,6 +20,12 @@ class User(Base):
 
 class Habit(Base):
     __tablename__ = "habits"
+    # Cambios de los hábitos de un usuario para GET /sync y hábitos pendientes para GET /habits/due
+    __table_args__ = (
+        Index("ix_habits_user_id_change_seq", "user_id", "change_seq"),
+        Index("ix_habits_user_id_next_due_date", "user_id", "next_due_date"),
+        Index("ix_habits_next_due_date", "next_due_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), index=True, nullable=False)
@@ -28,12 +34,21 @@ class Habit(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
+    change_seq = Column(BigInteger, default=0, nullable=False)  # Secuencia del último cambio (ver app/services/sync.py)
+    next_due_date = Column(Date, nullable=True)  # Próxima fecha en que toca (ver app/services/schedule.py)
     
     owner = relationship("User", back_populates="habits")
     records = relationship("Record", back_populates="habit")
 
 class Record(Base):
     __tablename__ = "records"
+    # Índice compuesto (habit_id, date): único para permitir el upsert de /records/bulk
+    # y ordenado para leer rangos de fechas de un hábito sin ordenar todo su historial
+    # El índice (habit_id, change_seq) sirve a GET /sync
+    __table_args__ = (
+        Index("ix_records_habit_id_date", "habit_id", "date", unique=True),
+        Index("ix_records_habit_id_change_seq", "habit_id", "change_seq"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     habit_id = Column(Integer, ForeignKey("habits.id"), nullable=False)
@@ -41,6 +56,7 @@ class Record(Base):
     completed = Column(Boolean, default=False, nullable=False)
     notes = Column(String(255), nullable=True) # Se mantiene nullable=True y se añade longitud
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    change_seq = Column(BigInteger, default=0, nullable=False)  # Secuencia del último cambio (ver app/services/sync.py)
     
     habit = relationship("Habit", back_populates="records")
 
@@ -49,6 +65,8 @@ class Record(Base):
 # Modelo para almacenar datos cargados desde Excel
 class ExcelData(Base):
     __tablename__ = "excel_data"
+    # Índice para paginar por cursor (uploaded_at, id) sin OFFSET
+    __table_args__ = (Index("ix_excel_data_uploaded_at_id", "uploaded_at", "id"),)
     
     id = Column(Integer, primary_key=True, index=True)
     # Campos genéricos que pueden adaptarse según tu Excel
@@ -60,4 +78,100 @@ class ExcelData(Base):
     column5 = Column(String(255), nullable=True)
     # Metadatos del registro
     uploaded_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    file_name = Column(String(255), nullable=True)  # Nombre del archivo de origen
\ No newline at end of file
+    file_name = Column(String(255), nullable=True, index=True)  # Nombre del archivo de origen (indexado para borrar por archivo)
+    sheet_name = Column(String(255), nullable=True)  # Hoja del libro de la que proviene la fila
+    job_id = Column(String(32), nullable=True, index=True)  # Trabajo de carga que insertó la fila (para deshacerla si falla)
+
+# Registro de los archivos cargados, identificados por el hash de su contenido
+class ExcelUpload(Base):
+    __tablename__ = "excel_uploads"
+    # El mismo contenido con la misma selección de hojas solo se carga una vez
+    __table_args__ = (UniqueConstraint("content_hash", "sheets", name="uq_excel_uploads_hash_sheets"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), index=True, nullable=False)  # SHA-256 del archivo
+    sheets = Column(String(255), nullable=False, default="")  # Hojas pedidas ("" = primera, "*" = todas)
+    file_name = Column(String(255), nullable=False)  # Nombre original del archivo
+    stored_name = Column(String(255), nullable=False)  # Nombre en disco (<hash><extensión>)
+    size_bytes = Column(BigInteger, nullable=False)
+    status = Column(String(20), nullable=False)  # queued, completed o failed
+    job_id = Column(String(32), nullable=True)  # Último trabajo que procesó el archivo
+    rows_inserted = Column(Integer, nullable=True)
+    columns = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+# Conteo de filas de excel_data por archivo, mantenido al insertar
+# para no recorrer la tabla completa con COUNT(*) en cada consulta
+class ExcelFileCount(Base):
+    __tablename__ = "excel_file_counts"
+    
+    file_name = Column(String(255), primary_key=True)
+    row_count = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+# Índice de los archivos guardados en la carpeta uploads, para listarlos
+# sin recorrer el directorio en cada petición
+class UploadedFile(Base):
+    __tablename__ = "uploaded_files"
+    
+    stored_name = Column(String(255), primary_key=True)  # Nombre en disco
+    file_name = Column(String(255), nullable=False, index=True)  # Nombre original
+    content_hash = Column(String(64), nullable=True)
+    size_bytes = Column(BigInteger, nullable=False)
+    modified_at = Column(DateTime, nullable=False, index=True)
+
+# Rachas de cada hábito, mantenidas al crear o actualizar registros
+# para poder leerlas sin recorrer el historial completo
+class HabitStreak(Base):
+    __tablename__ = "habit_streaks"
+    
+    habit_id = Column(Integer, ForeignKey("habits.id"), primary_key=True)
+    unit = Column(String(10), nullable=False)  # day, week o month, según la frecuencia del hábito
+    current_streak = Column(Integer, nullable=False, default=0)  # Racha que termina en last_period
+    longest_streak = Column(Integer, nullable=False, default=0)
+    last_period = Column(Integer, nullable=True)  # Último periodo con el hábito completado
+    last_completed_date = Column(Date, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+# Totales de registros por hábito y periodo (día, semana, mes y todo el historial),
+# mantenidos al escribir registros para que las estadísticas no recorran la tabla records
+class CompletionRollup(Base):
+    __tablename__ = "completion_rollups"
+    # Las estadísticas de un usuario se leen por (usuario, periodo, inicio del periodo)
+    __table_args__ = (Index("ix_completion_rollups_user_period", "user_id", "period", "period_start"),)
+    
+    habit_id = Column(Integer, ForeignKey("habits.id"), primary_key=True)
+    period = Column(String(10), primary_key=True)  # day, week, month o all
+    period_start = Column(Date, primary_key=True)  # Primer día del periodo (lunes para las semanas)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    total_records = Column(Integer, nullable=False, default=0)
+    completed_records = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+# Calendario de un hábito en un año: un bit por día (1 = completado),
+# mantenido al escribir registros para servir el mapa de calor sin leer los registros
+class HabitYearBitmap(Base):
+    __tablename__ = "habit_year_bitmaps"
+    
+    habit_id = Column(Integer, ForeignKey("habits.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    bits = Column(LargeBinary(46), nullable=False)  # 366 bits; el bit del día N está en el byte N // 8, posición N % 8
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+# Contadores monótonos; "user:<id>" numera los cambios de hábitos y registros de cada usuario para GET /sync
+class SyncCounter(Base):
+    __tablename__ = "sync_counters"
+    
+    name = Column(String(50), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+# Cubetas de tokens del límite de intentos de login y registro (THROTTLE_BACKEND=database),
+# compartidas por todos los workers; ver app/services/throttle.py
+class ThrottleBucket(Base):
+    __tablename__ = "throttle_buckets"
+    
+    key = Column(String(320), primary_key=True)  # "<ámbito>:<ip o correo>"
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False, index=True)  # Segundos desde epoch de la última recarga
\ No newline at end of file
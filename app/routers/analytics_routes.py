@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import logging
+from app.database.config import get_db
+from app.schemas import schemas
+from app.services import analytics
+from app.services.auth import CurrentUser, get_current_user, require_user
+
+# Configuro el sistema de logs para registrar información, advertencias y errores
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Defino el router de analítica, con el prefijo /analytics
+# Exige un usuario autenticado, que solo puede ver sus propias métricas
+router = APIRouter(prefix="/analytics", tags=["analytics"], dependencies=[Depends(get_current_user)])
+
+# -------------------- MÉTRICAS DE UN USUARIO --------------------
+@router.get("/users/{user_id}", response_model=schemas.UserAnalytics)
+def get_user_analytics(user_id: int, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Obtener las métricas del historial completo de un usuario: tasas global y
+    móviles (7 y 30 días), mejor día de la semana, tendencia de las últimas
+    semanas y, por hábito, su constancia.
+    """
+    require_user(current_user, user_id)
+    try:
+        return analytics.user_analytics(db, user_id)
+
+    except Exception as e:
+        logger.error(f"Error al calcular analítica: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+# -------------------- SERIE DE TASAS MÓVILES --------------------
+@router.get("/users/{user_id}/rolling", response_model=List[schemas.RollingRate])
+def get_user_rolling(
+    user_id: int,
+    days: int = Query(90, ge=1, le=3660),
+    habit_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Obtener la tasa móvil de 7 y 30 días de cada uno de los últimos días.
+
+    - **days**: Días de la serie (por defecto 90)
+    - **habit_id**: Limitar la serie a un hábito activo del usuario (opcional)
+    """
+    require_user(current_user, user_id)
+    try:
+        series = analytics.rolling_series(db, user_id, days, habit_id)
+        if series is None:
+            logger.warning(f"Hábito {habit_id} no encontrado entre los hábitos activos del usuario {user_id}")
+            raise HTTPException(status_code=404, detail="Hábito no encontrado")
+        return series
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error al calcular serie móvil: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
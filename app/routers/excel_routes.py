@@ -5,187 +5,443 @@ ingresandolos en base de datos y comunicación en tiempo real vía WebSocket.
 """
 
 import os  # Para manejo de archivos y rutas
+import io  # Para armar cada bloque del CSV exportado
+import csv  # Para exportar en formato CSV
+import json  # Para exportar en formato NDJSON
+import base64  # Para codificar los cursores de paginación
+import uuid  # Para nombrar los archivos temporales y los trabajos
 import asyncio  # Para operaciones asíncronas y manejo de WebSockets
-from typing import Dict, List # Para anotaciones de tipos
+from typing import Dict, List, Optional, Tuple # Para anotaciones de tipos
 from datetime import datetime # Para manejar fechas y horas
-from fastapi import APIRouter, UploadFile, File, WebSocket, WebSocketDisconnect, Depends, HTTPException # FastAPI y dependencias
-from fastapi.responses import JSONResponse # Para respuestas JSON personalizadas
+from fastapi import APIRouter, UploadFile, File, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query # FastAPI y dependencias
+from fastapi.responses import JSONResponse, StreamingResponse # Para respuestas JSON personalizadas y exportaciones
+from fastapi.concurrency import run_in_threadpool # Para no bloquear el event loop con el sistema de archivos
+from sqlalchemy import select, or_, and_ # Para consultas por cursor
 from sqlalchemy.orm import Session # Para manejar sesiones de base de datos
-import pandas as pd # Para procesamiento de datos en Excel
 
-from app.database.config import get_db # Función para obtener la sesión de DB
-from app.models.models import ExcelData # Modelo para almacenar datos de Excel
+from app.database.config import get_db, SessionLocal # Sesión de DB (y sesiones propias para exportar)
+from app.models.models import ExcelData, ExcelUpload, UploadedFile # Modelos para los datos de Excel y los archivos cargados
+from app.services.excel_reader import spool_upload # Para guardar la subida en disco por bloques
+from app.services.excel_jobs import ( # Cola de trabajos en segundo plano
+    job_manager, JobQueueFull, FINISHED_STATUSES, JOB_QUEUED, JOB_FAILED
+)
+from app.services.upload_registry import ( # Registro de archivos por hash de contenido
+    normalize_sheets, claim_upload, reclaim_upload, attach_job, upload_result
+)
+from app.services.progress_broker import progress_broker # Canal pub/sub del progreso
+from app.services.auth import get_current_user # Usuario autenticado de la petición
+from app.services.excel_counts import count_rows, ensure_counts # Conteo de filas por archivo
+from app.services.excel_purge import max_row_id # Límite de los borrados en segundo plano
+from app.services.upload_files import ( # Índice de los archivos de la carpeta uploads
+    SORT_COLUMNS, register_file, unregister_files, list_files, reconcile_upload_dir
+)
+from app.services.columnar_ingest import ( # Carga de CSV, Parquet y Arrow
+    COLUMNAR_EXTENSIONS, is_columnar_file, requires_pyarrow, pyarrow_available
+)
 
 # Inicializo el router con un prefijo y etiqueta para organizar los endpoints
-router = APIRouter(prefix="/excel", tags=["Excel Upload"])
+# Todas las rutas exigen un usuario autenticado (el WebSocket recibe el token en ?token=)
+router = APIRouter(prefix="/excel", tags=["Excel Upload"], dependencies=[Depends(get_current_user)])
 
 # Directorio donde se guardarán temporalmente los archivos subidos
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Variable global para almacenar el progreso actual (0-100)
-# En producción, considera usar Redis o una base de datos para múltiples workers
-upload_progress: Dict[str, float] = {"current": 0.0}
+# Extensiones de Excel aceptadas
+EXCEL_EXTENSIONS = ('.xls', '.xlsx')
 
+# Filas que se leen de la base de datos por cada bloque exportado
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXCEL_EXPORT_CHUNK_SIZE", "5000"))
 
-@router.post("/upload_excel")
-async def upload_excel(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db)
-):
+# Columnas que se devuelven de excel_data (en /data y en /export)
+DATA_COLUMNS = [
+    ExcelData.id,
+    ExcelData.column1,
+    ExcelData.column2,
+    ExcelData.column3,
+    ExcelData.column4,
+    ExcelData.column5,
+    ExcelData.file_name,
+    ExcelData.sheet_name,
+    ExcelData.uploaded_at,
+]
+DATA_FIELDS = [column.key for column in DATA_COLUMNS]
+
+# Segundos tras los que una subida en cola sin trabajo asociado se da por abandonada
+STALE_UPLOAD_SECONDS = 300
+
+
+def _is_abandoned(upload: ExcelUpload) -> bool:
     """
-    Endpoint POST para subir un archivo Excel (.xls o .xlsx).
+    Indico si una subida registrada ya no tiene quién la procese
+    (por ejemplo, si el servidor se reinició a mitad del trabajo).
+    """
+    if upload.status == JOB_FAILED:
+        return True
+    if upload.status != JOB_QUEUED:
+        return False
+    if upload.job_id is not None:
+        return job_manager.get(upload.job_id) is None
+    return (datetime.utcnow() - upload.created_at).total_seconds() > STALE_UPLOAD_SECONDS
+
+
+@router.on_event("startup")
+async def index_upload_dir():
+    """
+    Al arrancar, sincronizo el índice de archivos con la carpeta uploads y
+    reconstruyo los conteos de filas si faltan (fuera del event loop).
+    """
+    def reconcile():
+        db = SessionLocal()
+        try:
+            reconcile_upload_dir(db, UPLOAD_DIR)
+            try:
+                ensure_counts(db)
+            except Exception as e:
+                # Otro worker pudo reconstruirlos a la vez; /data sigue funcionando
+                db.rollback()
+                print(f"No se pudieron reconstruir los conteos de excel_data: {str(e)}")
+        finally:
+            db.close()
     
-    Flujo:
-    1. Valida que el archivo sea Excel
-    2. Guarda el archivo temporalmente
-    3. Lee el Excel con pandas
-    4. Procesa e inserta las filas en la base de datos
-    5. Actualiza el progreso en tiempo real
+    await run_in_threadpool(reconcile)
+
+
+async def _store_upload(db: Session, temp_path: str, upload: ExcelUpload, only_if_missing: bool = False):
+    """Muevo la subida temporal a su nombre definitivo y la anoto en el índice de archivos."""
+    stored_path = os.path.join(UPLOAD_DIR, upload.stored_name)
     
-    Args:
-        file: Archivo Excel subido por el usuario
-        db: Sesión de base de datos (inyectada por FastAPI)
+    def store():
+        if only_if_missing and os.path.exists(stored_path):
+            return
+        os.replace(temp_path, stored_path)
+        register_file(db, stored_path, upload.file_name, upload.content_hash)
     
+    await run_in_threadpool(store)
+
+
+def _remove_files(file_paths: List[str]) -> int:
+    """Elimino los archivos que existan (se ejecuta en el threadpool)."""
+    removed = 0
+    for file_path in file_paths:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            removed += 1
+    return removed
+
+
+def _previous_result(upload: ExcelUpload) -> Dict:
+    """Resultado de una subida ya registrada: el trabajo en curso o la carga anterior."""
+    job = job_manager.get(upload.job_id) if upload.job_id else None
+    if job is not None:
+        return {**job, "content_hash": upload.content_hash}
+    return upload_result(upload)
+
+
+def _claim(db: Session, file_name: str, size: int, content_hash: str, sheets_key: str) -> Tuple[ExcelUpload, Optional[Dict]]:
+    """
+    Registro una subida, o me quedo con una fallida o abandonada (se ejecuta en el threadpool).
+
     Returns:
-        JSON con el resultado del proceso
+        Tupla (registro, resultado anterior o None si esta petición debe procesarla)
+    """
+    upload, created = claim_upload(db, content_hash, sheets_key, file_name, size, JOB_QUEUED)
+    if created or (_is_abandoned(upload) and reclaim_upload(db, upload, file_name, JOB_QUEUED)):
+        return upload, None
+    return upload, _previous_result(upload)
+
+
+def _attach(db: Session, uploads: List[ExcelUpload], job_id: str) -> List[Tuple[str, str]]:
+    """Asocio las subidas al trabajo y devuelvo sus rutas y nombres (se ejecuta en el threadpool)."""
+    attach_job(db, uploads, job_id)
+    return [(os.path.join(UPLOAD_DIR, upload.stored_name), upload.file_name) for upload in uploads]
+
+
+async def _enqueue_uploads(
+    files: List[UploadFile],
+    batch_size: Optional[int],
+    streaming: Optional[bool],
+    sheets: Optional[str],
+    db: Session,
+    allow_columnar: bool = True,
+):
     """
+    Guardo los archivos subidos en disco y encolo los nuevos como un solo trabajo.
     
-    # Reinicio el progreso al iniciar una nueva carga
-    upload_progress["current"] = 0.0
+    Cada archivo se guarda como <hash><extensión>. Si su contenido ya se cargó
+    (o se está cargando) con la misma selección de hojas, no se vuelve a
+    procesar y se devuelve el resultado anterior.
+    """
     
-    # Valido que el archivo sea Excel
-    if not file.filename.endswith(('.xls', '.xlsx')):
-        return JSONResponse(
-            status_code=400,
-            content={"error": "El archivo debe ser .xls o .xlsx"}
-        )
+    # Valido el formato de cada archivo
+    for file in files:
+        if is_columnar_file(file.filename) and allow_columnar:
+            if sheets is not None:
+                return JSONResponse(
+                    status_code=400,
+                    content={"error": "El parámetro sheets solo aplica a archivos Excel"}
+                )
+            if requires_pyarrow(file.filename) and not pyarrow_available():
+                return JSONResponse(
+                    status_code=400,
+                    content={"error": "El servidor no tiene pyarrow instalado para leer Parquet o Arrow"}
+                )
+        elif not file.filename.endswith(EXCEL_EXTENSIONS):
+            allowed = EXCEL_EXTENSIONS + (COLUMNAR_EXTENSIONS if allow_columnar else ())
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Formato no soportado ({', '.join(allowed)}): {file.filename}"}
+            )
     
-    # Guardo el archivo temporalmente en el servidor
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
+    sheets_key = normalize_sheets(sheets)
+    temp_paths = [os.path.join(UPLOAD_DIR, f".incoming-{uuid.uuid4().hex}") for _ in files]
+    new_uploads: List[ExcelUpload] = []
+    duplicates: List[Dict] = []
     
     try:
-        # Leo el contenido del archivo y lo guardo
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-        
-        # Leo el Excel con pandas
-        # pandas detecta automáticamente el formato (.xls o .xlsx)
-        df = pd.read_excel(file_path)
+        # Copio cada subida a disco por bloques calculando su hash
+        hashed = []
+        for file, temp_path in zip(files, temp_paths):
+            size, content_hash = await spool_upload(file, temp_path)
+            hashed.append((file, temp_path, size, content_hash))
         
-        # Obtengo el número total de filas para calcular el progreso
-        total_rows = len(df)
+        for file, temp_path, size, content_hash in hashed:
+            upload, previous = await run_in_threadpool(_claim, db, file.filename, size, content_hash, sheets_key)
+            if previous is not None:
+                # Mismo contenido ya cargado o en proceso: no lo vuelvo a leer
+                duplicates.append(previous)
+                await _store_upload(db, temp_path, upload, only_if_missing=True)
+                continue
+            
+            await _store_upload(db, temp_path, upload)
+            new_uploads.append(upload)
         
-        if total_rows == 0:
+        if not new_uploads:
             return JSONResponse(
-                status_code=400,
-                content={"error": "El archivo Excel está vacío"}
+                status_code=200,
+                content={
+                    "message": "El archivo ya fue cargado, no se volvió a procesar",
+                    "duplicate": True,
+                    **duplicates[0],
+                    "duplicates": duplicates,
+                }
             )
         
-        # Proceso cada fila del DataFrame
-        rows_inserted = 0
+        # Asocio las subidas al trabajo antes de encolarlo para que el worker pueda registrar su resultado
+        job_id = uuid.uuid4().hex
+        saved_files = await run_in_threadpool(_attach, db, new_uploads, job_id)
         
-        for index, row in df.iterrows():
-            # Creo un nuevo registro en la base de datos
-            # NOTA: Adapta los nombres de las columnas según tu Excel
-            # Aquí asumo que el Excel tiene 5 columnas
-            excel_record = ExcelData(
-                column1=str(row.iloc[0]) if len(row) > 0 else None,
-                column2=str(row.iloc[1]) if len(row) > 1 else None,
-                column3=str(row.iloc[2]) if len(row) > 2 else None,
-                column4=str(row.iloc[3]) if len(row) > 3 else None,
-                column5=str(row.iloc[4]) if len(row) > 4 else None,
-                file_name=file.filename,
-                uploaded_at=datetime.utcnow()
-            )
-            
-            # Agrego el registro a la sesión
-            db.add(excel_record)
-            rows_inserted += 1
-            
-            # Actualizo el progreso (porcentaje completado)
-            upload_progress["current"] = (rows_inserted / total_rows) * 100
-            
-            # Hago commit cada 10 filas para mejorar el rendimiento
-            # y permitir que el WebSocket envíe actualizaciones
-            if rows_inserted % 10 == 0:
-                db.commit()
-                # Pequeña pausa para simular procesamiento y permitir actualizaciones
-                await asyncio.sleep(0.1)
-        
-        # Commit final para las filas restantes
-        db.commit()
-        
-        # Marco el progreso como completado
-        upload_progress["current"] = 100.0
-        
-        # Elimino el archivo temporal (opcional)
-        # os.remove(file_path)
+        # Encolo el procesamiento; el worker abre su propia sesión de DB
+        job = job_manager.submit(saved_files, batch_size, streaming, sheets, job_id=job_id)
         
         return JSONResponse(
-            status_code=200,
+            status_code=202,
             content={
-                "message": "Archivo procesado exitosamente",
-                "filename": file.filename,
-                "rows_processed": rows_inserted,
-                "columns": list(df.columns)
+                "message": "Archivo recibido, procesando en segundo plano",
+                **job.snapshot(),
+                "duplicates": duplicates,
             }
         )
     
-    except Exception as e:
-        # En caso de error, reinicio el progreso
-        upload_progress["current"] = 0.0
+    except JobQueueFull:
+        await run_in_threadpool(_release_uploads, db, new_uploads, "La cola de trabajos estaba llena")
         
-        # Elimino el archivo si existe
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Hay demasiadas cargas en proceso, intenta de nuevo en unos segundos"}
+        )
+    
+    except Exception as e:
+        await run_in_threadpool(_release_uploads, db, new_uploads, str(e))
         
         return JSONResponse(
             status_code=500,
             content={"error": f"Error al procesar el archivo: {str(e)}"}
         )
+    
+    finally:
+        # Elimino los archivos temporales que no se movieron a su ubicación final
+        await run_in_threadpool(_remove_files, temp_paths)
+
+
+def _release_uploads(db: Session, uploads: List[ExcelUpload], error: str):
+    """Marco como fallidas las subidas que no se llegaron a encolar y elimino sus archivos."""
+    db.rollback()
+    for upload in uploads:
+        upload.status = JOB_FAILED
+        upload.error = error
+        upload.finished_at = datetime.utcnow()
+    db.commit()
+    _remove_files([os.path.join(UPLOAD_DIR, upload.stored_name) for upload in uploads])
+    unregister_files(db, [upload.stored_name for upload in uploads])
+
+
+@router.post("/upload_excel", status_code=202)
+async def upload_excel(
+    file: UploadFile = File(...),
+    batch_size: Optional[int] = None,
+    streaming: Optional[bool] = None,
+    sheets: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Endpoint POST para subir un archivo Excel (.xls o .xlsx).
+    También acepta CSV, Parquet y Arrow IPC (.csv, .parquet, .arrow, .feather, .ipc),
+    que se cargan mucho más rápido que Excel.
+    
+    El archivo se guarda en disco y se encola como un trabajo en segundo plano;
+    la respuesta llega de inmediato con el id del trabajo.
+    
+    Si el mismo contenido ya se había cargado, no se vuelve a procesar:
+    la respuesta (200, con "duplicate": true) trae el resultado anterior.
+    
+    Flujo:
+    1. Valida el formato del archivo
+    2. Guarda el archivo en disco por bloques calculando su hash
+    3. Si el hash ya está registrado, devuelve el resultado anterior
+    4. Encola el trabajo en el pool de workers
+    5. El worker lee el Excel (pandas, o streaming con openpyxl si es grande)
+       e inserta las filas por lotes; si se piden hojas, las lee en paralelo
+    6. El progreso del trabajo se consulta en /excel/jobs/{job_id}
+    
+    Args:
+        file: Archivo Excel subido por el usuario
+        batch_size: Filas por lote (opcional, por defecto EXCEL_BATCH_SIZE)
+        streaming: Fuerza (o desactiva) el modo streaming; por defecto se decide
+            según EXCEL_STREAMING_THRESHOLD_MB
+        sheets: Hojas a cargar: "all" para todas o nombres separados por comas
+            (por defecto solo la primera hoja)
+        db: Sesión de base de datos
+    
+    Returns:
+        JSON con el id y el estado inicial del trabajo
+    """
+    return await _enqueue_uploads([file], batch_size, streaming, sheets, db)
+
+
+@router.post("/upload_batch", status_code=202)
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    batch_size: Optional[int] = None,
+    sheets: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Endpoint POST para subir varios archivos Excel en un solo trabajo.
+    
+    Cada archivo (o cada hoja, si se indica `sheets`) se lee en un proceso
+    distinto del pool, así la lectura escala con el número de núcleos.
+    Los archivos cuyo contenido ya se cargó se omiten y se devuelven en "duplicates".
+    
+    Args:
+        files: Archivos Excel subidos por el usuario
+        batch_size: Filas por lote (opcional, por defecto EXCEL_BATCH_SIZE)
+        sheets: Hojas a cargar de cada archivo: "all" para todas o nombres
+            separados por comas (por defecto solo la primera hoja)
+        db: Sesión de base de datos
+    
+    Returns:
+        JSON con el id y el estado inicial del trabajo
+    """
+    return await _enqueue_uploads(files, batch_size, None, sheets, db, allow_columnar=False)
+
+
+@router.get("/jobs")
+async def list_jobs(limit: int = 50):
+    """
+    Endpoint GET para listar los trabajos de carga más recientes.
+    
+    Args:
+        limit: Número máximo de trabajos a devolver (default: 50)
+    
+    Returns:
+        JSON con el estado de cada trabajo
+    """
+    jobs = job_manager.list(limit)
+    return {"jobs": jobs, "count": len(jobs)}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Endpoint GET para consultar el estado de un trabajo de carga.
+    
+    Args:
+        job_id: Id devuelto por /excel/upload_excel
+    
+    Returns:
+        JSON con estado, progreso, filas procesadas y errores del trabajo
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo no encontrado: {job_id}")
+    return job
+
+
+def _progress_payload(job_id: Optional[str]) -> Dict:
+    """Armo el progreso de un trabajo (o del más reciente si no se indica uno)."""
+    job = job_manager.get(job_id) if job_id else progress_broker.latest()
+    if job is None:
+        return {"job_id": job_id, "progress": 0.0, "status": "idle", "version": 0}
+    return job
 
 
 @router.websocket("/ws/progress")
-async def websocket_progress(websocket: WebSocket):
+async def websocket_progress(websocket: WebSocket, job_id: Optional[str] = None):
     """
     WebSocket para enviar el progreso de carga en tiempo real.
     
-    El cliente se conecta a este endpoint y recibe actualizaciones
-    del progreso cada segundo mientras se procesa el archivo.
+    El cliente se suscribe al canal de progreso y solo recibe un mensaje
+    cuando el estado del trabajo cambia (no hay consultas periódicas).
     
     Flujo:
-    1. Cliente se conecta al WebSocket
-    2. Servidor acepta la conexión
-    3. Servidor envía el progreso actual cada segundo
-    4. Cliente actualiza la barra de progreso en tiempo real
+    1. Cliente se conecta al WebSocket con ?token=<JWT> (y ?job_id=... o sin él para todos los trabajos)
+    2. Servidor acepta la conexión y envía el estado actual
+    3. Cada vez que el worker publica un cambio, el servidor lo reenvía
+    4. Si se sigue un trabajo concreto, la conexión se cierra cuando termina
     """
     
     # Acepto la conexión del WebSocket
     await websocket.accept()
     
+    # Me suscribo antes de leer el estado actual para no perder cambios intermedios
+    subscription = progress_broker.subscribe(job_id)
+    
+    async def send_updates():
+        current = _progress_payload(job_id)
+        await websocket.send_json(current)
+        if job_id and current["status"] in FINISHED_STATUSES:
+            return
+        
+        async for payload in subscription:
+            # Descarto mensajes que ya envié (pueden llegar repetidos tras el estado inicial)
+            if payload["job_id"] == current.get("job_id") and payload["version"] <= current["version"]:
+                continue
+            current = payload
+            await websocket.send_json(payload)
+            if job_id and payload["status"] in FINISHED_STATUSES:
+                return
+    
+    async def wait_disconnect():
+        # Escucho al cliente solo para enterarme de cuándo se desconecta
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    
+    sender = asyncio.create_task(send_updates())
+    watcher = asyncio.create_task(wait_disconnect())
+    
     try:
-        # Bucle infinito para enviar actualizaciones
-        while True:
-            # Obtengo el progreso actual
-            progress = upload_progress["current"]
-            
-            # Envío el progreso al cliente en formato JSON
-            await websocket.send_json({
-                "progress": round(progress, 2),
-                "status": "processing" if progress < 100 else "completed"
-            })
-            
-            # Si el progreso llegó al 100%, puedo cerrar la conexión
-            # o mantenerla abierta para futuras cargas
-            if progress >= 100:
-                await asyncio.sleep(1)  # Espero 1 segundo antes de cerrar
-                # Opcional: cerrar la conexión
-                # break
-            
-            # Espero 1 segundo antes de enviar la siguiente actualización
-            await asyncio.sleep(1)
+        done, pending = await asyncio.wait({sender, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        
+        if sender in done:
+            # El trabajo terminó: lanzo cualquier error del envío y cierro la conexión
+            sender.result()
+            await websocket.close()
+        else:
+            # El cliente cerró la conexión
+            print("Cliente desconectado del WebSocket")
     
     except WebSocketDisconnect:
         # El cliente cerró la conexión
@@ -195,114 +451,244 @@ async def websocket_progress(websocket: WebSocket):
         # Error en el WebSocket
         print(f"Error en WebSocket: {str(e)}")
         await websocket.close()
+    
+    finally:
+        subscription.close()
 
 
 @router.get("/progress")
-async def get_progress():
+async def get_progress(
+    job_id: Optional[str] = None,
+    since: Optional[int] = None,
+    timeout: float = Query(25.0, ge=0, le=60),
+):
     """
     Endpoint GET alternativo para obtener el progreso actual.
     Útil para clientes que no soportan WebSockets.
     
+    Con `since` funciona como long-polling: si la versión del estado no es
+    mayor que `since`, espera hasta que haya un cambio (o hasta `timeout`
+    segundos) antes de responder.
+    
+    Args:
+        job_id: Trabajo a consultar (por defecto, el más reciente)
+        since: Última versión que ya tiene el cliente
+        timeout: Segundos máximos de espera en modo long-polling
+    
     Returns:
-        JSON con el progreso actual (0-100)
+        JSON con el progreso actual (0-100) y su versión
     """
-    return {
-        "progress": round(upload_progress["current"], 2),
-        "status": "processing" if upload_progress["current"] < 100 else "completed"
-    }
+    current = _progress_payload(job_id)
+    if since is None or current["version"] > since or current["status"] in FINISHED_STATUSES:
+        return current
+    
+    with progress_broker.subscribe(job_id) as subscription:
+        # Vuelvo a leer por si el estado cambió mientras me suscribía
+        current = _progress_payload(job_id)
+        if current["version"] > since:
+            return current
+        
+        payload = await subscription.get(timeout)
+        return payload if payload is not None else current
+
+
+def _row_to_dict(row) -> Dict:
+    """Convierto una fila de excel_data a un diccionario serializable."""
+    data = dict(zip(DATA_FIELDS, row))
+    data["uploaded_at"] = data["uploaded_at"].isoformat() if data["uploaded_at"] else None
+    return data
+
+
+def _encode_cursor(uploaded_at: datetime, record_id: int) -> str:
+    """El cursor es la posición (uploaded_at, id) de la última fila entregada."""
+    raw = f"{uploaded_at.isoformat()}|{record_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        uploaded_at, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(uploaded_at), int(record_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
 
 
 @router.get("/data")
-async def get_excel_data(
-    limit: int = 100,
+def get_excel_data(
+    limit: int = Query(100, ge=1, le=1000),
     offset: int = 0,
+    cursor: Optional[str] = None,
+    file_name: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """
     Endpoint GET para obtener los datos cargados desde Excel.
-    Soporta paginación con limit y offset.
+    Soporta paginación con limit y offset, o con cursor.
+    
+    Con `cursor` (el `next_cursor` de la página anterior) la consulta
+    continúa desde la última fila entregada usando el índice
+    (uploaded_at, id), así las páginas profundas cuestan lo mismo que la
+    primera. El total sale de los conteos por archivo, sin COUNT(*). Es una
+    ruta síncrona para que FastAPI la ejecute en el threadpool.
     
     Args:
         limit: Número máximo de registros a devolver (default: 100)
-        offset: Número de registros a saltar (default: 0)
+        offset: Número de registros a saltar (default: 0, se ignora con cursor)
+        cursor: Cursor devuelto por la página anterior
+        file_name: Devolver solo las filas de este archivo
         db: Sesión de base de datos
     
     Returns:
-        JSON con los datos cargados
+        JSON con los datos cargados y el cursor de la página siguiente
     """
     
-    # Consulto los datos con paginación
-    records = db.query(ExcelData)\
-        .order_by(ExcelData.uploaded_at.desc())\
-        .limit(limit)\
-        .offset(offset)\
-        .all()
+    # Consulto los datos con paginación, de los más recientes a los más antiguos
+    query = select(*DATA_COLUMNS).order_by(ExcelData.uploaded_at.desc(), ExcelData.id.desc())
+    if file_name is not None:
+        query = query.where(ExcelData.file_name == file_name)
+    
+    if cursor:
+        uploaded_at, record_id = _decode_cursor(cursor)
+        query = query.where(or_(
+            ExcelData.uploaded_at < uploaded_at,
+            and_(ExcelData.uploaded_at == uploaded_at, ExcelData.id < record_id),
+        ))
+    elif offset:
+        query = query.offset(offset)
     
-    # Cuento el total de registros
-    total = db.query(ExcelData).count()
+    rows = db.execute(query.limit(limit)).all()
+    
+    # El total viene de los conteos mantenidos al insertar
+    total = count_rows(db, file_name)
     
     # Convierto los registros a diccionarios
-    data = []
-    for record in records:
-        data.append({
-            "id": record.id,
-            "column1": record.column1,
-            "column2": record.column2,
-            "column3": record.column3,
-            "column4": record.column4,
-            "column5": record.column5,
-            "file_name": record.file_name,
-            "uploaded_at": record.uploaded_at.isoformat() if record.uploaded_at else None
-        })
+    data = [_row_to_dict(row) for row in rows]
+    
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = _encode_cursor(last.uploaded_at, last.id)
     
     return {
         "total": total,
         "limit": limit,
         "offset": offset,
-        "data": data
+        "data": data,
+        "next_cursor": next_cursor
     }
 
 
+@router.get("/export")
+def export_excel_data(format: str = "ndjson", file_name: Optional[str] = None):
+    """
+    Endpoint GET para exportar los datos cargados como NDJSON o CSV.
+    
+    La respuesta se envía por bloques a medida que se leen de la base de
+    datos (con un cursor del lado del servidor en PostgreSQL), así se pueden
+    exportar millones de filas con memoria acotada.
+    
+    Args:
+        format: "ndjson" (una fila JSON por línea) o "csv"
+        file_name: Exportar solo las filas de este archivo
+    
+    Returns:
+        Respuesta en streaming con todas las filas
+    """
+    if format not in ("ndjson", "csv"):
+        return JSONResponse(
+            status_code=400,
+            content={"error": "El formato debe ser ndjson o csv"}
+        )
+    
+    query = select(*DATA_COLUMNS).order_by(ExcelData.id)
+    if file_name is not None:
+        query = query.where(ExcelData.file_name == file_name)
+    
+    def generate():
+        # La sesión es propia: la respuesta sigue enviándose después de que termina el endpoint
+        db = SessionLocal()
+        try:
+            result = db.execute(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+            
+            if format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(DATA_FIELDS)
+                for rows in result.partitions():
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                yield buffer.getvalue()
+            else:
+                for rows in result.partitions():
+                    yield "".join(
+                        json.dumps(_row_to_dict(row), ensure_ascii=False) + "\n" for row in rows
+                    )
+        finally:
+            db.close()
+    
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        generate(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="excel_data.{format}"'}
+    )
+
+
 @router.get("/list-files")
-async def list_uploaded_files():
+def list_uploaded_files(
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    sort: str = "modified",
+    order: str = "desc",
+    db: Session = Depends(get_db)
+):
     """
-    Endpoint GET para listar todos los archivos subidos en la carpeta uploads.
+    Endpoint GET para listar los archivos subidos en la carpeta uploads.
+    
+    El listado sale del índice uploaded_files (actualizado al subir y al
+    eliminar, y reconciliado con la carpeta al arrancar), sin recorrer el
+    directorio en cada petición. Los archivos se guardan con el hash de su
+    contenido; "filename" es el nombre original. Es una ruta síncrona para
+    que FastAPI la ejecute en el threadpool y la consulta no bloquee el event loop.
+    
+    Args:
+        limit: Número máximo de archivos a devolver (default: 100)
+        offset: Número de archivos a saltar (default: 0)
+        sort: Orden por "name", "size" o "modified" (default: "modified")
+        order: "asc" o "desc" (default: "desc")
+        db: Sesión de base de datos
     
     Returns:
-        JSON con lista de archivos disponibles
+        JSON con la página de archivos y el total
     """
+    if sort not in SORT_COLUMNS or order not in ("asc", "desc"):
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Orden inválido: sort debe ser {', '.join(SORT_COLUMNS)} y order asc o desc"}
+        )
+    
     try:
-        # Verifico que la carpeta existe
-        if not os.path.exists(UPLOAD_DIR):
-            return {
-                "files": [],
-                "count": 0,
-                "message": "La carpeta uploads no existe o está vacía"
-            }
-        
-        # Obtengo la lista de archivos
-        files = os.listdir(UPLOAD_DIR)
+        files, total = list_files(db, limit, offset, sort, order)
         
-        # Filtro solo archivos (no carpetas)
-        file_list = []
-        for filename in files:
-            filepath = os.path.join(UPLOAD_DIR, filename)
-            if os.path.isfile(filepath):
-                # Obtengo el tamaño del archivo en bytes
-                file_size = os.path.getsize(filepath)
-                # Obtengo la fecha de modificación
-                modified_time = datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat()
-                
-                file_list.append({
-                    "filename": filename,
-                    "size_bytes": file_size,
-                    "size_mb": round(file_size / (1024 * 1024), 2),
-                    "modified_at": modified_time
-                })
+        file_list = [
+            {
+                "filename": file.file_name,
+                "stored_name": file.stored_name,
+                "content_hash": file.content_hash,
+                "size_bytes": file.size_bytes,
+                "size_mb": round(file.size_bytes / (1024 * 1024), 2),
+                "modified_at": file.modified_at.isoformat()
+            }
+            for file in files
+        ]
         
         return {
             "files": file_list,
-            "count": len(file_list)
+            "count": total,
+            "limit": limit,
+            "offset": offset
         }
     
     except Exception as e:
@@ -313,15 +699,23 @@ async def list_uploaded_files():
 
 
 @router.delete("/file/{filename}")
-async def delete_specific_file(filename: str):
+def delete_specific_file(filename: str, db: Session = Depends(get_db)):
     """
-    Endpoint DELETE para eliminar un archivo específico de la carpeta uploads.
+    Endpoint DELETE para eliminar un archivo específico de la carpeta uploads
+    junto con sus filas en excel_data.
+    
+    Acepta el nombre original del archivo o su nombre en disco (hash).
+    Las filas se eliminan por lotes en un trabajo en segundo plano, cuyo
+    progreso se consulta en /excel/jobs/{job_id}. Es una ruta síncrona para
+    que FastAPI la ejecute en el threadpool: las consultas, el borrado de
+    archivos y el commit no bloquean el event loop.
     
     Args:
         filename: Nombre del archivo a eliminar (sin path)
+        db: Sesión de base de datos
     
     Returns:
-        JSON confirmando la eliminación
+        JSON confirmando la eliminación y los trabajos de borrado encolados
     """
     try:
         # Sanitizo el filename para evitar ataques de path traversal
@@ -332,32 +726,66 @@ async def delete_specific_file(filename: str):
                 detail="Nombre de archivo inválido"
             )
         
-        filepath = os.path.join(UPLOAD_DIR, filename)
+        # Busco las subidas y los archivos con ese nombre original (o ese nombre en disco)
+        uploads_query = db.query(ExcelUpload).filter(
+            (ExcelUpload.file_name == filename) | (ExcelUpload.stored_name == filename)
+        )
+        uploads = uploads_query.all()
+        indexed = db.query(UploadedFile).filter(
+            (UploadedFile.file_name == filename) | (UploadedFile.stored_name == filename)
+        ).all()
+        stored_names = {upload.stored_name for upload in uploads} | {file.stored_name for file in indexed} or {filename}
+        file_names = {upload.file_name for upload in uploads} | {file.file_name for file in indexed} or {filename}
+        
+        def existing_paths():
+            paths = [os.path.join(UPLOAD_DIR, stored_name) for stored_name in stored_names]
+            return [path for path in paths if os.path.exists(path)], all(
+                os.path.isfile(path) for path in paths if os.path.exists(path)
+            )
         
-        # Verifico que el archivo existe
-        if not os.path.exists(filepath):
+        filepaths, all_files = existing_paths()
+        file_names = [file_name for file_name in file_names if count_rows(db, file_name) > 0]
+        
+        # Verifico que el archivo (o sus datos) existe
+        if not filepaths and not file_names:
             raise HTTPException(
                 status_code=404,
                 detail=f"Archivo no encontrado: {filename}"
             )
         
         # Verifico que es un archivo, no una carpeta
-        if not os.path.isfile(filepath):
+        if not all_files:
             raise HTTPException(
                 status_code=400,
                 detail="La ruta especificada no es un archivo"
             )
         
-        # Elimino el archivo
-        os.remove(filepath)
+        # Encolo el borrado de sus filas, limitado a las que ya existen
+        upto_id = max_row_id(db)
+        purge_jobs = [job_manager.submit_purge(file_name, upto_id).snapshot() for file_name in file_names]
         
-        return {
-            "message": f"Archivo '{filename}' eliminado exitosamente",
-            "deleted_file": filename
-        }
+        # Elimino el archivo, su registro y su entrada del índice, así se puede volver a cargar
+        _remove_files(filepaths)
+        uploads_query.delete(synchronize_session=False)
+        db.commit()
+        unregister_files(db, list(stored_names))
+        
+        return JSONResponse(
+            status_code=202 if purge_jobs else 200,
+            content={
+                "message": f"Archivo '{filename}' eliminado exitosamente",
+                "deleted_file": filename,
+                "purge_jobs": purge_jobs
+            }
+        )
     
     except HTTPException:
         raise
+    except JobQueueFull:
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Hay demasiados trabajos en proceso, intenta de nuevo en unos segundos"}
+        )
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -366,44 +794,63 @@ async def delete_specific_file(filename: str):
 
 
 @router.delete("/data")
-async def delete_all_data(db: Session = Depends(get_db)):
+def delete_all_data(db: Session = Depends(get_db)):
     """
     Endpoint DELETE para eliminar todos los datos cargados y archivos.
     Limpia tanto la base de datos como la carpeta uploads.
     Útil para limpiar completamente durante pruebas.
     
+    Los archivos se eliminan de inmediato; las filas se borran en un trabajo
+    en segundo plano (TRUNCATE en PostgreSQL, o por lotes en otros motores)
+    cuyo progreso se consulta en /excel/jobs/{job_id}. Como /file/{filename},
+    es una ruta síncrona que FastAPI ejecuta en el threadpool.
+    
     Args:
         db: Sesión de base de datos
     
     Returns:
-        JSON con el número de registros y archivos eliminados
+        JSON con el trabajo de borrado y el número de archivos eliminados
     """
     
     try:
-        # Cuento los registros antes de eliminar
-        count = db.query(ExcelData).count()
+        # Encolo el borrado de las filas que existen ahora
+        count = count_rows(db)
+        job = job_manager.submit_purge(None, max_row_id(db))
         
-        # Elimino todos los registros
-        db.query(ExcelData).delete()
+        # Elimino el registro de subidas y el índice de archivos,
+        # así el mismo archivo se puede volver a cargar
+        db.query(ExcelUpload).delete()
+        db.query(UploadedFile).delete()
         db.commit()
         
         # Elimino todos los archivos de la carpeta uploads
         files_deleted = 0
         if os.path.exists(UPLOAD_DIR):
-            for filename in os.listdir(UPLOAD_DIR):
-                filepath = os.path.join(UPLOAD_DIR, filename)
-                try:
-                    if os.path.isfile(filepath):
-                        os.remove(filepath)
-                        files_deleted += 1
-                except Exception as file_error:
-                    print(f"Error al eliminar archivo {filename}: {str(file_error)}")
+            with os.scandir(UPLOAD_DIR) as entries:
+                for entry in entries:
+                    try:
+                        # Las subidas temporales en curso (.incoming-*) no se tocan
+                        if entry.is_file() and not entry.name.startswith("."):
+                            os.remove(entry.path)
+                            files_deleted += 1
+                    except Exception as file_error:
+                        print(f"Error al eliminar archivo {entry.name}: {str(file_error)}")
         
-        return {
-            "message": "Datos y archivos eliminados exitosamente",
-            "deleted_records": count,
-            "deleted_files": files_deleted
-        }
+        return JSONResponse(
+            status_code=202,
+            content={
+                "message": "Archivos eliminados, los datos se están borrando en segundo plano",
+                "deleted_records": count,
+                "deleted_files": files_deleted,
+                **job.snapshot()
+            }
+        )
+    
+    except JobQueueFull:
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Hay demasiados trabajos en proceso, intenta de nuevo en unos segundos"}
+        )
     
     except Exception as e:
         db.rollback()
@@ -1,10 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status   # Importo APIRouter y herramientas de FastAPI
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request  # Importo APIRouter y herramientas de FastAPI
 from sqlalchemy.orm import Session                              # Importo Session para trabajar con la base de datos
-from typing import List                                         # Importo List para definir tipos en respuestas
+from typing import List, Optional                               # Importo List para definir tipos en respuestas
+from datetime import date                                       # Para el año por defecto del calendario
+import base64                                                   # Para enviar los bitmaps del calendario
+import calendar                                                 # Para saber si el año es bisiesto
 import logging                                                  # Uso logging para registrar eventos
 from app.database.config import get_db                          # Importo la función que me da acceso a la DB
 from app.models import models                                   # Importo los modelos (tablas)
 from app.schemas import schemas                                 # Importo los esquemas de validación (Pydantic)
+from app.services import streaks                                # Importo el motor de rachas
+from app.services import calendar_bitmaps                       # Importo el calendario de bits por año
+from app.services import response_cache                         # Importo la caché de respuestas con ETag
+from app.services import habits as habits_service              # Importo la escritura masiva de hábitos
+from app.services import schedule                               # Importo la programación según la frecuencia
+from app.services.auth import CurrentUser, get_current_user, require_reminders, require_user  # Importo la autenticación
 
 # Configuro el sistema de logs para registrar información útil de ejecución
 logging.basicConfig(level=logging.INFO)
@@ -12,14 +21,24 @@ logger = logging.getLogger(__name__)
 
 # Creo un enrutador (router) con el prefijo /habits
 # Esto significa que todas las rutas aquí empezarán con /habits
-router = APIRouter(prefix="/habits", tags=["habits"])
+# Todas las rutas exigen un usuario autenticado (Authorization: Bearer <token>)
+router = APIRouter(prefix="/habits", tags=["habits"], dependencies=[Depends(get_current_user)])
+
+# Rutas para procesos internos (no para usuarios), con credencial de servicio
+service_router = APIRouter(prefix="/habits", tags=["habits"])
 
 # -------------------- CREAR HÁBITO --------------------
 @router.post("/", response_model=schemas.Habit, status_code=status.HTTP_201_CREATED)
-def create_habit(habit: schemas.HabitCreate, user_id: int, db: Session = Depends(get_db)):
+def create_habit(
+    habit: schemas.HabitCreate,
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
     """
     Crear un nuevo hábito.
     """
+    require_user(current_user, user_id)
     try:
         logger.info(f"Intentando crear hábito '{habit.name}' para usuario ID: {user_id}")
         
@@ -30,11 +49,14 @@ def create_habit(habit: schemas.HabitCreate, user_id: int, db: Session = Depends
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
         # Creo el hábito y lo asocio al usuario
-        db_habit = models.Habit(**habit.dict(), user_id=user_id)
+        db_habit = models.Habit(**habit.dict(), user_id=user_id, next_due_date=schedule.initial_due_date(habit.frequency))
         db.add(db_habit)
         db.commit()
         db.refresh(db_habit)
         
+        # El listado de hábitos del usuario cambió
+        response_cache.invalidate(f"habits:user:{user_id}")
+        
         logger.info(f"Hábito creado exitosamente: {habit.name} (ID: {db_habit.id})")
         return db_habit
         
@@ -45,13 +67,140 @@ def create_habit(habit: schemas.HabitCreate, user_id: int, db: Session = Depends
         db.rollback()
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+# -------------------- CREAR VARIOS HÁBITOS --------------------
+@router.post("/bulk", response_model=List[schemas.Habit], status_code=status.HTTP_201_CREATED)
+def bulk_create_habits(
+    payload: schemas.HabitBulkCreate,
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Crear varios hábitos de un usuario en una sola transacción (por ejemplo, desde una plantilla).
+    
+    - **user_id**: ID del usuario dueño de los hábitos
+    - **habits**: Lista de hábitos a crear (máximo 1000)
+    """
+    require_user(current_user, user_id)
+    if len(payload.habits) > habits_service.MAX_BULK_HABITS:
+        raise HTTPException(status_code=400, detail=f"Máximo {habits_service.MAX_BULK_HABITS} hábitos por petición")
+    
+    try:
+        logger.info(f"Creando {len(payload.habits)} hábitos para usuario ID: {user_id}")
+        
+        # Verifico el usuario una sola vez para todo el lote
+        if db.query(models.User.id).filter(models.User.id == user_id).first() is None:
+            logger.warning(f"Usuario no encontrado: {user_id}")
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        
+        created = habits_service.bulk_create_habits(db, user_id, payload.habits)
+        # Armo la respuesta antes del commit para no recargar cada hábito después
+        response = [schemas.Habit.model_validate(habit) for habit in created]
+        db.commit()
+        response_cache.invalidate(f"habits:user:{user_id}")
+        
+        logger.info(f"{len(response)} hábitos creados para usuario ID: {user_id}")
+        return response
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error al crear hábitos: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+# -------------------- ACTUALIZAR VARIOS HÁBITOS --------------------
+@router.patch("/bulk", response_model=List[schemas.Habit])
+def bulk_update_habits(
+    payload: schemas.HabitBulkUpdate,
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Actualizar varios hábitos de un usuario en una sola transacción.
+    
+    Solo se modifican los campos enviados en cada elemento. Si algún hábito
+    no existe o es de otro usuario, no se modifica ninguno.
+    """
+    require_user(current_user, user_id)
+    if len(payload.habits) > habits_service.MAX_BULK_HABITS:
+        raise HTTPException(status_code=400, detail=f"Máximo {habits_service.MAX_BULK_HABITS} hábitos por petición")
+    
+    try:
+        logger.info(f"Actualizando {len(payload.habits)} hábitos del usuario ID: {user_id}")
+        
+        updated, missing = habits_service.bulk_update_habits(db, user_id, payload.habits)
+        if missing:
+            logger.warning(f"Hábitos no encontrados para el usuario {user_id}: {missing}")
+            db.rollback()
+            raise HTTPException(status_code=404, detail=f"Habitos no encontrados: {missing}")
+        
+        response = [schemas.Habit.model_validate(habit) for habit in updated]
+        db.commit()
+        response_cache.invalidate(f"habits:user:{user_id}", *(f"habit:{habit.id}" for habit in response))
+        
+        logger.info(f"{len(response)} hábitos actualizados")
+        return response
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error al actualizar hábitos: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+# -------------------- DESACTIVAR VARIOS HÁBITOS --------------------
+@router.post("/bulk/deactivate", response_model=schemas.HabitBulkDeactivateResponse)
+def bulk_deactivate_habits(
+    payload: schemas.HabitBulkDeactivate,
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Desactivar (soft delete) varios hábitos de un usuario en una sola transacción.
+    
+    Los ids que no existen o son de otro usuario se informan en not_found y se ignoran.
+    """
+    require_user(current_user, user_id)
+    if len(payload.habit_ids) > habits_service.MAX_BULK_DEACTIVATE:
+        raise HTTPException(status_code=400, detail=f"Máximo {habits_service.MAX_BULK_DEACTIVATE} hábitos por petición")
+    
+    try:
+        logger.info(f"Desactivando {len(payload.habit_ids)} hábitos del usuario ID: {user_id}")
+        
+        deactivated, habit_ids, not_found = habits_service.bulk_deactivate_habits(db, user_id, payload.habit_ids)
+        db.commit()
+        if deactivated:
+            response_cache.invalidate(f"habits:user:{user_id}", *(f"habit:{habit_id}" for habit_id in habit_ids))
+        
+        logger.info(f"{deactivated} hábitos desactivados ({len(not_found)} no encontrados)")
+        return {"deactivated": deactivated, "habit_ids": habit_ids, "not_found": not_found}
+        
+    except Exception as e:
+        logger.error(f"Error al desactivar hábitos: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
 # -------------------- LISTAR HÁBITOS --------------------
 @router.get("/", response_model=List[schemas.Habit])
-def get_habits(user_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_habits(
+    request: Request,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
     """
     Obtener lista de hábitos de un usuario.
+    
+    Incluye un ETag: si el cliente lo reenvía en If-None-Match y nada cambió, recibe 304.
     """
-    try:
+    require_user(current_user, user_id)
+    
+    def load():
         logger.info(f"Obteniendo hábitos del usuario ID: {user_id}")
         
         # Busco todos los hábitos activos del usuario
@@ -61,28 +210,191 @@ def get_habits(user_id: int, skip: int = 0, limit: int = 100, db: Session = Depe
         ).offset(skip).limit(limit).all()
         
         logger.info(f"Se encontraron {len(habits)} hábitos activos")
-        return habits
+        return [schemas.Habit.model_validate(habit) for habit in habits], response_cache.row_version(habits), {}
+    
+    try:
+        return response_cache.conditional_get(request, [f"habits:user:{user_id}"], load)
         
     except Exception as e:
         logger.error(f"Error al obtener hábitos: {str(e)}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+# -------------------- RACHAS DE LOS HÁBITOS DE UN USUARIO --------------------
+# Va antes de /{habit_id} para que "streaks" no se interprete como un ID
+@router.get("/streaks", response_model=List[schemas.HabitStreak])
+def get_user_streaks(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Obtener la racha actual y la mejor racha de todos los hábitos activos de un usuario.
+    """
+    require_user(current_user, user_id)
+    try:
+        habits = db.query(models.Habit).filter(
+            models.Habit.user_id == user_id,
+            models.Habit.is_active == True
+        ).all()
+        
+        # Leo todas las rachas guardadas con una sola consulta
+        return streaks.get_streaks(db, habits)
+        
+    except Exception as e:
+        logger.error(f"Error al obtener rachas: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+# -------------------- CALENDARIO DE VARIOS HÁBITOS --------------------
+# Va antes de /{habit_id} para que "calendar" no se interprete como un ID
+@router.get("/calendar", response_model=schemas.HabitCalendar)
+def get_habits_calendar(
+    year: Optional[int] = Query(None, ge=1970, le=9999),
+    habit_ids: Optional[List[int]] = Query(None),
+    user_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Obtener el calendario de un año de varios hábitos, un bit por día.
+
+    - **year**: Año (por defecto, el actual)
+    - **habit_ids**: IDs de los hábitos (se puede repetir: ?habit_ids=1&habit_ids=2)
+    - **user_id**: En lugar de habit_ids, todos los hábitos activos del usuario
+    """
+    year = year or date.today().year
+    if not habit_ids and user_id is None:
+        raise HTTPException(status_code=400, detail="Indica habit_ids o user_id")
+    if not habit_ids:
+        require_user(current_user, user_id)
+
+    try:
+        query = db.query(models.Habit.id)
+        if habit_ids:
+            habit_ids = list(dict.fromkeys(habit_ids))
+            # Los hábitos de otros usuarios cuentan como no encontrados
+            found = {habit_id for (habit_id,) in query.filter(
+                models.Habit.id.in_(habit_ids),
+                models.Habit.user_id == current_user.id
+            )}
+            missing = [habit_id for habit_id in habit_ids if habit_id not in found]
+            if missing:
+                logger.warning(f"Hábitos no encontrados: {missing}")
+                raise HTTPException(status_code=404, detail=f"Habitos no encontrados: {missing}")
+        else:
+            habit_ids = [habit_id for (habit_id,) in query.filter(
+                models.Habit.user_id == user_id,
+                models.Habit.is_active == True
+            ).order_by(models.Habit.id)]
+        
+        bitmaps = calendar_bitmaps.get_bitmaps(db, habit_ids, year) if habit_ids else {}
+        return {
+            "year": year,
+            "days": 366 if calendar.isleap(year) else 365,
+            "habits": [
+                {"habit_id": habit_id, "bits": base64.b64encode(bitmaps[habit_id]).decode("ascii")}
+                for habit_id in habit_ids
+            ],
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error al obtener calendario: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+# -------------------- HÁBITOS PENDIENTES --------------------
+# Va antes de /{habit_id} para que "due" no se interprete como un ID
+@router.get("/due", response_model=List[schemas.HabitDue])
+def get_due_habits(
+    user_id: int,
+    day: Optional[date] = Query(None, alias="date"),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Obtener los hábitos activos de un usuario que tocan en una fecha, incluidos los atrasados.
+    
+    - **user_id**: ID del usuario
+    - **date**: Fecha a consultar (por defecto, hoy)
+    """
+    require_user(current_user, user_id)
+    day = day or date.today()
+    try:
+        # Una sola consulta sobre el índice (user_id, next_due_date)
+        habits = schedule.due_habits(db, [user_id], day)
+        logger.info(f"{len(habits)} hábitos pendientes para el usuario {user_id} el {day}")
+        return [schedule.due_view(habit, day) for habit in habits]
+        
+    except Exception as e:
+        logger.error(f"Error al obtener hábitos pendientes: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+# -------------------- HÁBITOS PENDIENTES DE VARIOS USUARIOS --------------------
+@service_router.post("/due/bulk", response_model=List[schemas.UserDueHabits], dependencies=[Depends(require_reminders)])
+def get_due_habits_bulk(
+    payload: schemas.DueHabitsBulkRequest,
+    db: Session = Depends(get_db),
+):
+    """
+    Obtener los hábitos pendientes de varios usuarios en una fecha (por ejemplo, para los recordatorios).
+    
+    - **user_ids**: IDs de los usuarios (máximo 1000)
+    - **due_date**: Fecha a consultar (por defecto, hoy)
+    
+    Es para el proceso de recordatorios, no para los usuarios: requiere el
+    encabezado X-Service-Token con el valor de REMINDERS_TOKEN (sin esa
+    variable, la ruta está deshabilitada). Cada usuario consulta los suyos
+    con GET /habits/due.
+    """
+    user_ids = list(dict.fromkeys(payload.user_ids))
+    if len(user_ids) > schedule.MAX_BULK_DUE_USERS:
+        raise HTTPException(status_code=400, detail=f"Máximo {schedule.MAX_BULK_DUE_USERS} usuarios por petición")
+    
+    day = payload.due_date or date.today()
+    try:
+        due_by_user = {user_id: [] for user_id in user_ids}
+        for habit in schedule.due_habits(db, user_ids, day) if user_ids else []:
+            due_by_user[habit.user_id].append(schedule.due_view(habit, day))
+        
+        logger.info(f"Hábitos pendientes consultados para {len(user_ids)} usuarios el {day}")
+        return [{"user_id": user_id, "habits": habits} for user_id, habits in due_by_user.items()]
+        
+    except Exception as e:
+        logger.error(f"Error al obtener hábitos pendientes: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
 # -------------------- OBTENER HÁBITO POR ID --------------------
 @router.get("/{habit_id}", response_model=schemas.Habit)
-def get_habit(habit_id: int, db: Session = Depends(get_db)):
+def get_habit(
+    habit_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
     """
     Obtener un hábito por ID.
+    
+    Incluye un ETag: si el cliente lo reenvía en If-None-Match y nada cambió, recibe 304.
     """
-    try:
+    def load():
         logger.info(f"Buscando hábito con ID: {habit_id}")
         
         habit = db.query(models.Habit).filter(models.Habit.id == habit_id).first()
         if habit is None:
             logger.warning(f"Hábito no encontrado: {habit_id}")
             raise HTTPException(status_code=404, detail="Habito no encontrado")
+        require_user(current_user, habit.user_id)
         
         logger.info(f"Hábito encontrado: {habit.name}")
-        return habit
+        return schemas.Habit.model_validate(habit), response_cache.row_version([habit]), {}
+    
+    try:
+        # La caché se separa por usuario: la comprobación de dueño está dentro de load
+        return response_cache.conditional_get(request, [f"habit:{habit_id}"], load, scope=f"user:{current_user.id}")
         
     except HTTPException:
         raise
@@ -90,9 +402,40 @@ def get_habit(habit_id: int, db: Session = Depends(get_db)):
         logger.error(f"Error al obtener hábito: {str(e)}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+# -------------------- RACHA DE UN HÁBITO --------------------
+@router.get("/{habit_id}/streak", response_model=schemas.HabitStreak)
+def get_habit_streak(
+    habit_id: int,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Obtener la racha actual y la mejor racha de un hábito.
+    """
+    try:
+        habit = db.query(models.Habit).filter(models.Habit.id == habit_id).first()
+        if habit is None:
+            logger.warning(f"Hábito no encontrado: {habit_id}")
+            raise HTTPException(status_code=404, detail="Habito no encontrado")
+        require_user(current_user, habit.user_id)
+        
+        return streaks.get_streaks(db, [habit])[0]
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error al obtener racha: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
 # -------------------- ACTUALIZAR HÁBITO --------------------
 @router.put("/{habit_id}", response_model=schemas.Habit)
-def update_habit(habit_id: int, habit: schemas.HabitCreate, db: Session = Depends(get_db)):
+def update_habit(
+    habit_id: int,
+    habit: schemas.HabitCreate,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
     """
     Actualizar un hábito existente.
     """
@@ -103,14 +446,23 @@ def update_habit(habit_id: int, habit: schemas.HabitCreate, db: Session = Depend
         if db_habit is None:
             logger.warning(f"Hábito no encontrado: {habit_id}")
             raise HTTPException(status_code=404, detail="Habito no encontrado")
+        require_user(current_user, db_habit.user_id)
+        
+        rescheduled = habit.frequency != db_habit.frequency
         
         # Recorro los campos del nuevo hábito y los asigno al existente
         for key, value in habit.dict().items():
             setattr(db_habit, key, value)
         
+        # Si cambió la frecuencia, recalculo la próxima fecha en la misma transacción
+        if rescheduled:
+            schedule.refresh_due_dates(db, [habit_id])
+        
         db.commit()
         db.refresh(db_habit)
         
+        response_cache.invalidate(f"habit:{habit_id}", f"habits:user:{db_habit.user_id}")
+        
         logger.info(f"Hábito actualizado exitosamente: {db_habit.name}")
         return db_habit
         
@@ -123,7 +475,7 @@ def update_habit(habit_id: int, habit: schemas.HabitCreate, db: Session = Depend
 
 # -------------------- ELIMINAR (DESACTIVAR) HÁBITO --------------------
 @router.delete("/{habit_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_habit(habit_id: int, db: Session = Depends(get_db)):
+def delete_habit(habit_id: int, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     """
     Desactivar un hábito (soft delete).
     """
@@ -134,11 +486,14 @@ def delete_habit(habit_id: int, db: Session = Depends(get_db)):
         if db_habit is None:
             logger.warning(f"Hábito no encontrado: {habit_id}")
             raise HTTPException(status_code=404, detail="Habito no encontrado")
+        require_user(current_user, db_habit.user_id)
         
         # En lugar de borrar, solo lo marco como inactivo
         db_habit.is_active = False
         db.commit()
         
+        response_cache.invalidate(f"habit:{habit_id}", f"habits:user:{db_habit.user_id}")
+        
         logger.info(f"Hábito desactivado exitosamente: {db_habit.name}")
         return None
         
@@ -1,21 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from datetime import date
 import logging
 from app.database.config import get_db
 from app.models import models
 from app.schemas import schemas
+from app.services import records as records_service
+from app.services import calendar_bitmaps, response_cache, rollups, schedule, streaks
+from app.services.auth import CurrentUser, get_current_user, require_user
 
 # Configuro el sistema de logs para registrar información, advertencias y errores
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Defino el router principal para esta parte del módulo, con el prefijo /records
-router = APIRouter(prefix="/records", tags=["records"])
+# Todas las rutas exigen un usuario autenticado (Authorization: Bearer <token>)
+router = APIRouter(prefix="/records", tags=["records"], dependencies=[Depends(get_current_user)])
 
 @router.post("/", response_model=schemas.Record, status_code=status.HTTP_201_CREATED)
-def create_record(record: schemas.RecordCreate, db: Session = Depends(get_db)):
+def create_record(
+    record: schemas.RecordCreate,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
     """
     Crear un nuevo registro de hábito completado.
     
@@ -32,6 +40,10 @@ def create_record(record: schemas.RecordCreate, db: Session = Depends(get_db)):
         if not habit:
             logger.warning(f"Hábito no encontrado: {record.habit_id}")
             raise HTTPException(status_code=404, detail="Habitos no funcional")
+        require_user(current_user, habit.user_id)
+        
+        # Bloqueo el hábito antes de leer o escribir sus registros (ver app/services/streaks.py)
+        streaks.lock_habits(db, [habit.id])
         
         # Verificar si ya existe un registro para esa fecha
         existing_record = db.query(models.Record).filter(
@@ -46,8 +58,15 @@ def create_record(record: schemas.RecordCreate, db: Session = Depends(get_db)):
         # Si todo está bien, creo el nuevo registro
         db_record = models.Record(**record.dict())
         db.add(db_record)
+        # Actualizo la racha del hábito en la misma transacción que el registro
+        streaks.apply_record_change(db, habit, db_record.date, False, db_record.completed)
+        rollups.apply_record_deltas(db, [(habit, db_record.date, 1, int(db_record.completed))])
+        if db_record.completed:
+            calendar_bitmaps.apply_day_changes(db, [(habit.id, db_record.date, True)])
+            schedule.refresh_due_dates(db, [habit.id])
         db.commit()
         db.refresh(db_record)
+        response_cache.invalidate(f"records:habit:{habit.id}")
         
         logger.info(f"Registro creado exitosamente (ID: {db_record.id})")
         return db_record
@@ -61,16 +80,89 @@ def create_record(record: schemas.RecordCreate, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+@router.post("/bulk", response_model=schemas.RecordBulkResponse)
+def bulk_upsert_records(
+    payload: schemas.RecordBulkCreate,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Crear o actualizar muchos registros en una sola transacción.
+    
+    Pensado para clientes que sincronizan check-ins hechos sin conexión:
+    si ya existe un registro para el mismo hábito y fecha, se actualiza
+    (completed y, si se envían, notes) en lugar de fallar.
+    
+    - **records**: Lista de registros (habit_id, date, completed, notes)
+    
+    Devuelve un resultado por registro, en el mismo orden: created, updated,
+    superseded (repetido en la misma petición) o error. Los hábitos de
+    otros usuarios se informan como no encontrados.
+    """
+    if len(payload.records) > records_service.MAX_BULK_RECORDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {records_service.MAX_BULK_RECORDS} registros por petición"
+        )
+    
+    try:
+        logger.info(f"Sincronizando {len(payload.records)} registros")
+        
+        results = records_service.bulk_upsert_records(db, payload.records, current_user.id)
+        
+        # Armo la respuesta antes del commit para no recargar cada registro después
+        response = schemas.RecordBulkResponse(
+            created=sum(1 for result in results if result["status"] == records_service.RECORD_CREATED),
+            updated=sum(1 for result in results if result["status"] == records_service.RECORD_UPDATED),
+            failed=sum(1 for result in results if result["status"] == records_service.RECORD_ERROR),
+            results=[schemas.RecordBulkResult.model_validate(result) for result in results],
+        )
+        db.commit()
+        response_cache.invalidate(*{
+            f"records:habit:{result['habit_id']}"
+            for result in results
+            if result["status"] in (records_service.RECORD_CREATED, records_service.RECORD_UPDATED)
+        })
+        
+        logger.info(f"Sincronización completada: {response.created} creados, {response.updated} actualizados, {response.failed} con error")
+        return response
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error al sincronizar registros: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
 @router.get("/habit/{habit_id}", response_model=List[schemas.Record])
-def get_habit_records(habit_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_habit_records(
+    habit_id: int,
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    cursor: Optional[date] = None,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
     """
     Obtener todos los registros de un hábito específico.
     
+    Los registros se leen del índice (habit_id, date), así un rango de
+    fechas cuesta lo mismo sin importar cuánto historial tenga el hábito.
+    
     - **habit_id**: ID del hábito
-    - **skip**: Número de registros a saltar
+    - **skip**: Número de registros a saltar (se ignora si se envía cursor)
     - **limit**: Número máximo de registros a retornar
+    - **from**: Fecha inicial del rango (inclusive)
+    - **to**: Fecha final del rango (inclusive)
+    - **cursor**: Valor del encabezado X-Next-Cursor de la página anterior
+    
+    Si hay más registros, la respuesta incluye el encabezado X-Next-Cursor.
+    Incluye un ETag: si el cliente lo reenvía en If-None-Match y nada cambió, recibe 304.
     """
-    try:
+    def load():
         logger.info(f"Obteniendo registros del hábito ID: {habit_id}")
         
         # Verifico que el hábito exista antes de buscar sus registros
@@ -78,14 +170,33 @@ def get_habit_records(habit_id: int, skip: int = 0, limit: int = 100, db: Sessio
         if not habit:
             logger.warning(f"Hábito no encontrado: {habit_id}")
             raise HTTPException(status_code=404, detail="Habitos no funcional")
+        require_user(current_user, habit.user_id)
         
         # Consulto los registros de ese hábito ordenados por fecha descendente
-        records = db.query(models.Record).filter(
-            models.Record.habit_id == habit_id
-        ).order_by(models.Record.date.desc()).offset(skip).limit(limit).all()
+        query = db.query(models.Record).filter(models.Record.habit_id == habit_id)
+        if from_date:
+            query = query.filter(models.Record.date >= from_date)
+        if to_date:
+            query = query.filter(models.Record.date <= to_date)
+        
+        # Con cursor continúo desde la última fecha entregada (hay un registro por fecha)
+        if cursor:
+            query = query.filter(models.Record.date < cursor)
+        elif skip:
+            query = query.offset(skip)
+        
+        records = query.order_by(models.Record.date.desc()).limit(limit).all()
+        
+        headers = {}
+        if records and len(records) == limit:
+            headers["X-Next-Cursor"] = records[-1].date.isoformat()
         
         logger.info(f"Se encontraron {len(records)} registros")
-        return records
+        return [schemas.Record.model_validate(record) for record in records], response_cache.row_version(records), headers
+    
+    try:
+        # La caché se separa por usuario: la comprobación de dueño está dentro de load
+        return response_cache.conditional_get(request, [f"records:habit:{habit_id}"], load, scope=f"user:{current_user.id}")
         
     except HTTPException:
         raise
@@ -95,7 +206,7 @@ def get_habit_records(habit_id: int, skip: int = 0, limit: int = 100, db: Sessio
 
 #  Obtener un registro individual por su ID
 @router.get("/{record_id}", response_model=schemas.Record)
-def get_record(record_id: int, db: Session = Depends(get_db)):
+def get_record(record_id: int, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     """
     Obtener un registro por ID.
     
@@ -109,6 +220,7 @@ def get_record(record_id: int, db: Session = Depends(get_db)):
         if record is None:
             logger.warning(f"Registro no encontrado: {record_id}")
             raise HTTPException(status_code=404, detail="Record no funcional")
+        require_user(current_user, record.habit.user_id)
         
         logger.info(f"Registro encontrado (ID: {record_id})")
         return record
@@ -120,7 +232,13 @@ def get_record(record_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 @router.put("/{record_id}", response_model=schemas.Record)
-def update_record(record_id: int, completed: bool, notes: str = None, db: Session = Depends(get_db)):
+def update_record(
+    record_id: int,
+    completed: bool,
+    notes: str = None,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
     """
     Actualizar un registro existente.
     
@@ -136,14 +254,28 @@ def update_record(record_id: int, completed: bool, notes: str = None, db: Sessio
         if db_record is None:
             logger.warning(f"Registro no encontrado: {record_id}")
             raise HTTPException(status_code=404, detail="Record no funcional")
+        require_user(current_user, db_record.habit.user_id)
+        
+        # Bloqueo el hábito y releo el registro ya con el bloqueo tomado
+        streaks.lock_habits(db, [db_record.habit_id])
+        db.refresh(db_record)
         
         # Actualizo los campos 'completed' y 'notes' si se proporciona
+        was_completed = db_record.completed
         db_record.completed = completed
         if notes:
             db_record.notes = notes
         
+        # Si cambió el estado de completado, actualizo la racha del hábito
+        if was_completed != completed:
+            streaks.apply_record_change(db, db_record.habit, db_record.date, was_completed, completed)
+            rollups.apply_record_deltas(db, [(db_record.habit, db_record.date, 0, int(completed) - int(was_completed))])
+            calendar_bitmaps.apply_day_changes(db, [(db_record.habit_id, db_record.date, completed)])
+            schedule.refresh_due_dates(db, [db_record.habit_id])
+        
         db.commit()
         db.refresh(db_record)
+        response_cache.invalidate(f"records:habit:{db_record.habit_id}")
         
         logger.info(f"Registro actualizado exitosamente (ID: {record_id})")
         return db_record
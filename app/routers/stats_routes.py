@@ -0,0 +1,70 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import date, timedelta
+import logging
+from app.database.config import get_db
+from app.schemas import schemas
+from app.services import rollups
+from app.services.auth import CurrentUser, get_current_user, require_user
+
+# Configuro el sistema de logs para registrar información, advertencias y errores
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Defino el router de estadísticas, con el prefijo /stats
+# Todas las rutas leen de completion_rollups, nunca de la tabla records completa
+# y exigen un usuario autenticado, que solo puede ver sus propias estadísticas
+router = APIRouter(prefix="/stats", tags=["stats"], dependencies=[Depends(get_current_user)])
+
+# Periodos que se pueden pedir en la serie
+SERIES_PERIODS = ("day", "week", "month")
+
+# -------------------- RESUMEN DE UN USUARIO --------------------
+@router.get("/users/{user_id}/summary", response_model=schemas.UserStatsSummary)
+def get_user_summary(user_id: int, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Obtener el porcentaje de cumplimiento histórico, de la semana y del mes actuales,
+    en total y por hábito.
+    """
+    require_user(current_user, user_id)
+    try:
+        return rollups.user_summary(db, user_id)
+
+    except Exception as e:
+        logger.error(f"Error al obtener estadísticas: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+# -------------------- SERIE POR PERIODO --------------------
+@router.get("/users/{user_id}/series", response_model=List[schemas.CompletionStats])
+def get_user_series(
+    user_id: int,
+    period: str = Query("week", description="day, week o month"),
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    habit_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Obtener el cumplimiento por día, semana o mes en un rango de fechas.
+
+    - **period**: day, week o month
+    - **from** / **to**: Rango de fechas (por defecto, las últimas 12 semanas)
+    - **habit_id**: Limitar la serie a un hábito (opcional)
+    """
+    require_user(current_user, user_id)
+    if period not in SERIES_PERIODS:
+        raise HTTPException(status_code=400, detail=f"Periodo no válido. Usa: {', '.join(SERIES_PERIODS)}")
+
+    to_date = to_date or date.today()
+    from_date = from_date or to_date - timedelta(weeks=12)
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="La fecha inicial es posterior a la final")
+
+    try:
+        return rollups.user_series(db, user_id, period, from_date, to_date, habit_id)
+
+    except Exception as e:
+        logger.error(f"Error al obtener serie de estadísticas: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+import logging
+from app.database.config import get_db
+from app.schemas import schemas
+from app.services import sync
+from app.services.auth import CurrentUser, get_current_user, require_user
+
+# Configuro el sistema de logs para registrar información, advertencias y errores
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Defino el router de sincronización incremental, con el prefijo /sync
+# Exige un usuario autenticado, que solo puede sincronizar sus propios datos
+router = APIRouter(prefix="/sync", tags=["sync"], dependencies=[Depends(get_current_user)])
+
+# -------------------- CAMBIOS DESDE UN TOKEN --------------------
+@router.get("", response_model=schemas.SyncResponse)
+def get_changes(
+    user_id: int,
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(1000, ge=1, le=sync.MAX_SYNC_LIMIT),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Obtener los hábitos y registros de un usuario que cambiaron desde el último token.
+
+    - **user_id**: ID del usuario
+    - **since**: next_token de la respuesta anterior (sin él se devuelve todo)
+    - **limit**: Máximo de registros por respuesta
+    """
+    require_user(current_user, user_id)
+
+    try:
+        return sync.changes_since(db, user_id, since, limit)
+
+    except Exception as e:
+        logger.error(f"Error al obtener cambios: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
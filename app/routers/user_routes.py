@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, UploadFile, File
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List
 import logging
 from app.database.config import get_db
 from app.models import models
 from app.schemas import schemas
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from app.services import dashboard, response_cache
+from app.services import hashing
+from app.services import users as users_service
+from app.services.auth import CurrentUser, create_access_token, get_current_user, require_provisioning, require_user
+from app.services.throttle import client_ip, login_throttle
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -17,16 +21,12 @@ router = APIRouter(
     tags=["users"]
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Constantes (la clave y el algoritmo de los tokens están en app/services/auth.py)
+MAX_PASSWORD_LENGTH = hashing.MAX_PASSWORD_LENGTH
 
-# Constantes
-SECRET_KEY = "keysecreta"  # CAMBIAR ESTO en producción
-ALGORITHM = "HS256"
-MAX_PASSWORD_LENGTH = 72
 
-
-def get_password_hash(password: str):
-    """Hashear contraseña con validación de longitud"""
+async def get_password_hash(password: str):
+    """Hashear contraseña con validación de longitud (bcrypt corre en el pool de procesos)"""
     # Validar longitud mínima
     if len(password) < 8:
         logger.warning("Contraseña demasiado corta")
@@ -35,60 +35,95 @@ def get_password_hash(password: str):
             detail="La contraseña debe tener al menos 8 caracteres"
         )
     
-    # Truncar a 72 bytes para bcrypt
-    password_bytes = password.encode("utf-8")
-    if len(password_bytes) > MAX_PASSWORD_LENGTH:
-        password = password_bytes[:MAX_PASSWORD_LENGTH].decode("utf-8", errors="ignore")
+    # El pool trunca a 72 bytes para bcrypt
+    if len(password.encode("utf-8")) > MAX_PASSWORD_LENGTH:
         logger.info("Contraseña truncada a 72 bytes")
     
-    return pwd_context.hash(password)
+    return await _run_hashing(hashing.hash_password(password))
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verificar contraseña con truncamiento consistente (en el pool de procesos)"""
+    return await _run_hashing(hashing.verify_password(plain_password, hashed_password))
+
+
+async def _run_hashing(operation):
+    """Espero el hash y, si la cola del pool está llena, respondo 503."""
+    try:
+        return await operation
+    except hashing.HashingQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Hay demasiadas solicitudes en proceso, intenta de nuevo en unos segundos",
+            headers={"Retry-After": "1"},
+        )
+
+
+@router.on_event("startup")
+def start_password_hasher():
+    """Arranco el pool de hash al iniciar para que el primer login no espere a los procesos."""
+    hashing.password_hasher.start()
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verificar contraseña con truncamiento consistente"""
-    # Truncar de la misma forma que al hashear
-    password_bytes = plain_password.encode("utf-8")
-    if len(password_bytes) > MAX_PASSWORD_LENGTH:
-        plain_password = password_bytes[:MAX_PASSWORD_LENGTH].decode("utf-8", errors="ignore")
+@router.on_event("shutdown")
+def stop_password_hasher():
+    hashing.password_hasher.shutdown()
+
+
+def _find_existing_user(db: Session, user: schemas.UserCreate):
+    """Devuelvo el motivo si el correo o el usuario ya están registrados."""
+    # Verificar si el email ya existe
+    existing_email = db.query(models.User.id).filter(models.User.email == user.email).first()
+    if existing_email:
+        logger.warning(f"Correo ya registrado: {user.email}")
+        return "Correo ya registrado"
+    
+    # Verificar si el username ya existe
+    existing_username = db.query(models.User.id).filter(models.User.username == user.username).first()
+    if existing_username:
+        logger.warning(f"Usuario ya registrado: {user.username}")
+        return "Usuario ya registrado"
+    return None
+
+
+def _insert_user(db: Session, user: schemas.UserCreate, hashed_password: str) -> models.User:
+    db_user = models.User(
+        username=user.username,
+        email=user.email,
+        hashed_password=hashed_password
+    )
     
-    return pwd_context.verify(plain_password, hashed_password)
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
 
 
 @router.post("/", response_model=schemas.User, status_code=status.HTTP_201_CREATED)  # Cambiado de "/users/" a "/"
-async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, request: Request, db: Session = Depends(get_db)):
     """
     Crear un nuevo usuario.
     - **username**: Nombre de usuario único
     - **email**: Correo electrónico único
     - **password**: Contraseña del usuario (mínimo 8 caracteres)
+    
+    La base de datos se consulta en el threadpool y bcrypt corre en el pool
+    de procesos, así el event loop nunca se bloquea. Las altas por IP están
+    limitadas (429) antes de hacer ningún trabajo.
     """
     try:
+        await login_throttle.enforce(("signup_ip", client_ip(request)))
+
         logger.info(f"Intentando crear usuario: {user.username} ({user.email})")
         
-        # Verificar si el email ya existe
-        existing_email = db.query(models.User).filter(models.User.email == user.email).first()
-        if existing_email:
-            logger.warning(f"Correo ya registrado: {user.email}")
-            raise HTTPException(status_code=400, detail="Correo ya registrado")
-        
-        # Verificar si el username ya existe
-        existing_username = db.query(models.User).filter(models.User.username == user.username).first()
-        if existing_username:
-            logger.warning(f"Usuario ya registrado: {user.username}")
-            raise HTTPException(status_code=400, detail="Usuario ya registrado")
+        existing = await run_in_threadpool(_find_existing_user, db, user)
+        if existing:
+            raise HTTPException(status_code=400, detail=existing)
         
         # Crear el usuario 
-        hashed_password = get_password_hash(user.password)  # La función ya maneja el truncamiento
-        
-        db_user = models.User(
-            username=user.username,
-            email=user.email,
-            hashed_password=hashed_password
-        )
+        hashed_password = await get_password_hash(user.password)  # La función ya maneja el truncamiento
         
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        db_user = await run_in_threadpool(_insert_user, db, user, hashed_password)
         
         logger.info(f"Usuario creado exitosamente: {user.username}")
         return db_user
@@ -97,22 +132,126 @@ async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         raise
     except Exception as e:
         logger.error(f"❌ Error al crear usuario: {str(e)}")
-        db.rollback()
+        await run_in_threadpool(db.rollback)
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+
+async def _provision_users(db: Session, rows: List[Dict]) -> Dict:
+    """
+    Doy de alta las filas validadas: unicidad con una consulta por bloque,
+    hashes en paralelo en el pool de procesos e INSERT por lotes.
+    """
+    if len(rows) > users_service.MAX_BULK_USERS:
+        raise HTTPException(status_code=400, detail=f"Máximo {users_service.MAX_BULK_USERS} usuarios por petición")
+    
+    results, valid = users_service.validate_rows(rows)
+    
+    taken_emails, taken_usernames = await run_in_threadpool(users_service.find_taken, db, [user for _, user in valid])
+    pending = []
+    for index, user in valid:
+        if user.email in taken_emails:
+            results[index].update(status=users_service.USER_ERROR, error="Correo ya registrado")
+        elif user.username in taken_usernames:
+            results[index].update(status=users_service.USER_ERROR, error="Usuario ya registrado")
+        else:
+            pending.append((index, user))
+    
+    # Cada lote se hashea en paralelo y se guarda en su propia transacción
+    for start in range(0, len(pending), users_service.USER_BATCH_SIZE):
+        batch = pending[start:start + users_service.USER_BATCH_SIZE]
+        hashes = await hashing.hash_passwords([user.password for _, user in batch])
+        await run_in_threadpool(
+            users_service.insert_users,
+            db,
+            [(index, user, hashed) for (index, user), hashed in zip(batch, hashes)],
+            results,
+        )
+        logger.info(f"Alta masiva: {start + len(batch)} de {len(pending)} usuarios procesados")
+    
+    created = sum(1 for result in results if result["status"] == users_service.USER_CREATED)
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+
+@router.post("/bulk", response_model=schemas.UserBulkResponse, dependencies=[Depends(require_provisioning)])
+async def bulk_create_users(payload: schemas.UserBulkCreate, db: Session = Depends(get_db)):
+    """
+    Dar de alta muchos usuarios a la vez (por ejemplo, una organización completa).
+    
+    - **users**: Lista de usuarios (username, email, password; máximo 10000)
+    
+    Devuelve un resultado por fila, en el mismo orden: created (con su id) o
+    error (dato no válido, repetido en la petición o ya registrado). Las
+    filas con error no impiden crear las demás.
+    
+    No es una ruta de usuarios: requiere el encabezado X-Service-Token con
+    el valor de PROVISIONING_TOKEN (sin esa variable, la ruta está deshabilitada).
+    """
+    try:
+        logger.info(f"Alta masiva de {len(payload.users)} usuarios")
+        response = await _provision_users(db, [item.model_dump() for item in payload.users])
+        logger.info(f"Alta masiva completada: {response['created']} creados, {response['failed']} con error")
+        return response
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error en el alta masiva de usuarios: {str(e)}")
+        await run_in_threadpool(db.rollback)
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+
+@router.post("/bulk/csv", response_model=schemas.UserBulkResponse, dependencies=[Depends(require_provisioning)])
+async def bulk_create_users_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """
+    Dar de alta muchos usuarios desde un CSV (UTF-8) con encabezado username,email,password.
+    
+    La respuesta es la misma que la de POST /users/bulk; el índice de cada
+    resultado es el número de fila de datos (sin contar el encabezado), desde 0.
+    Requiere la misma credencial de servicio (X-Service-Token).
+    """
+    try:
+        rows = users_service.parse_csv(await file.read())
+    except ValueError as e:
+        logger.warning(f"CSV de usuarios no válido: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        logger.info(f"Alta masiva de {len(rows)} usuarios desde '{file.filename}'")
+        response = await _provision_users(db, rows)
+        logger.info(f"Alta masiva completada: {response['created']} creados, {response['failed']} con error")
+        return response
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error en el alta masiva de usuarios: {str(e)}")
+        await run_in_threadpool(db.rollback)
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 
 @router.post("/login")
-def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
+async def login(user: schemas.UserLogin, request: Request, db: Session = Depends(get_db)):
     """
     Autenticar usuario y retornar un token JWT.
     - **email**: Correo electrónico del usuario
     - **password**: Contraseña del usuario
+
+    Los intentos por IP y por cuenta están limitados: al superar el límite
+    se responde 429 sin consultar la base de datos ni ejecutar bcrypt.
     """
     try:
+        # Límite de intentos antes de cualquier trabajo caro
+        await login_throttle.enforce(
+            ("login_ip", client_ip(request)),
+            ("login_account", user.email.strip().lower()),
+        )
+
         logger.info(f"🔐 Intentando autenticar usuario: {user.email}")
         
-        # Buscar usuario por email
-        db_user = db.query(models.User).filter(models.User.email == user.email).first()
+        # Buscar usuario por email (en el threadpool, fuera del event loop)
+        db_user = await run_in_threadpool(
+            lambda: db.query(models.User).filter(models.User.email == user.email).first()
+        )
         
         if not db_user:
             logger.warning(f"Usuario no encontrado: {user.email}")
@@ -121,19 +260,14 @@ def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
         logger.info(f"✓ Usuario encontrado: {db_user.email}")
         
         # Verificar contraseña con la función que trunca correctamente
-        password_valid = verify_password(user.password, db_user.hashed_password)  # 👈 Usa verify_password
+        password_valid = await verify_password(user.password, db_user.hashed_password)  # 👈 Usa verify_password
         
         if not password_valid:
             logger.warning(f"❌ Contraseña incorrecta para: {user.email}")
             raise HTTPException(status_code=401, detail="Credenciales inválidas")  # 👈 Cambiado a 401
         
-        # Crear token JWT
-        token_data = {
-            "sub": db_user.email,
-            "user_id": db_user.id,
-            "username": db_user.username
-        }
-        token = jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
+        # Crear token JWT (con vencimiento)
+        token = create_access_token(db_user)
         
         logger.info(f"Usuario autenticado exitosamente: {user.email}")
         return {
@@ -153,7 +287,7 @@ def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 
-@router.get("/", response_model=List[schemas.User])
+@router.get("/", response_model=List[schemas.User], dependencies=[Depends(get_current_user)])
 def get_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """
     Obtener lista de usuarios.
@@ -171,12 +305,16 @@ def get_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
 
 
 @router.get("/{user_id}", response_model=schemas.User)
-def get_user(user_id: int, db: Session = Depends(get_db)):
+def get_user(user_id: int, request: Request, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     """
-    Obtener un usuario por ID.
+    Obtener un usuario por ID (solo el propio usuario autenticado).
     - **user_id**: ID del usuario
+    
+    Incluye un ETag: si el cliente lo reenvía en If-None-Match y nada cambió, recibe 304.
     """
-    try:
+    require_user(current_user, user_id)
+    
+    def load():
         logger.info(f"Buscando usuario con ID: {user_id}")
         user = db.query(models.User).filter(models.User.id == user_id).first()
         
@@ -185,13 +323,39 @@ def get_user(user_id: int, db: Session = Depends(get_db)):
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
         logger.info(f"Usuario encontrado: {user.username}")
-        return user
+        return schemas.User.model_validate(user), response_cache.row_version([user]), {}
+    
+    try:
+        return response_cache.conditional_get(request, [f"user:{user_id}"], load)
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error al obtener usuario: {str(e)}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+
+@router.get("/{user_id}/dashboard", response_model=schemas.UserDashboard)
+def get_dashboard(
+    user_id: int,
+    days: int = Query(7, ge=1, le=90),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Obtener todo lo que muestra el dashboard en una sola llamada: hábitos activos,
+    sus registros recientes, si se completaron hoy, sus rachas y el resumen de cumplimiento.
+    
+    - **days**: Días de registros recientes por hábito (por defecto 7)
+    """
+    require_user(current_user, user_id)
+    try:
+        return dashboard.build_dashboard(db, user_id, days)
+        
+    except Exception as e:
+        logger.error(f"Error al obtener dashboard: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
     
 
 
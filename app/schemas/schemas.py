@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, field_validator
 from datetime import date, datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 # User Schemas
 class UserBase(BaseModel):
@@ -21,6 +21,29 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
+# Bulk User Schemas
+class UserBulkItem(BaseModel):
+    # Sin validar aquí: cada fila se valida por separado y sus errores van en el resultado
+    username: Optional[str] = None
+    email: Optional[str] = None
+    password: Optional[str] = None
+
+class UserBulkCreate(BaseModel):
+    users: List[UserBulkItem]
+
+class UserBulkResult(BaseModel):
+    index: int
+    username: Optional[str] = None
+    email: Optional[str] = None
+    status: str  # created o error
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class UserBulkResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[UserBulkResult]
+
 # Habit Schemas
 class HabitBase(BaseModel):
     name: str
@@ -39,6 +62,35 @@ class Habit(HabitBase):
     class Config:
         from_attributes = True
 
+# Bulk Habit Schemas
+class HabitBulkCreate(BaseModel):
+    habits: List[HabitCreate]
+
+class HabitBulkUpdateItem(BaseModel):
+    id: int
+    name: Optional[str] = None
+    description: Optional[str] = None
+    frequency: Optional[str] = None
+
+    # Se pueden omitir, pero no enviar como null: las columnas son NOT NULL
+    @field_validator("name", "frequency")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("no puede ser null")
+        return value
+
+class HabitBulkUpdate(BaseModel):
+    habits: List[HabitBulkUpdateItem]
+
+class HabitBulkDeactivate(BaseModel):
+    habit_ids: List[int]
+
+class HabitBulkDeactivateResponse(BaseModel):
+    deactivated: int  # Hábitos que estaban activos y se desactivaron
+    habit_ids: List[int]  # Hábitos del usuario incluidos en la petición
+    not_found: List[int]  # Ids que no existen o son de otro usuario
+
 # Record Schemas
 class RecordBase(BaseModel):
     date: date
@@ -56,4 +108,130 @@ class Record(RecordBase):
     class Config:
         from_attributes = True 
 
+# Bulk Record Schemas
+class RecordBulkCreate(BaseModel):
+    records: List[RecordCreate]
+
+class RecordBulkResult(BaseModel):
+    index: int
+    habit_id: int
+    date: date
+    status: str  # created, updated, superseded o error
+    record: Optional[Record] = None
+    error: Optional[str] = None
+
+class RecordBulkResponse(BaseModel):
+    created: int
+    updated: int
+    failed: int
+    results: List[RecordBulkResult]
+
+# Streak Schemas
+class HabitStreak(BaseModel):
+    habit_id: int
+    unit: str  # day, week o month
+    current_streak: int
+    longest_streak: int
+    last_completed_date: Optional[date] = None
+
+# Stats Schemas
+class CompletionStats(BaseModel):
+    period_start: Optional[date] = None
+    total_records: int
+    completed_records: int
+    completion_rate: float  # Porcentaje de registros completados
+
+class HabitCompletionStats(BaseModel):
+    habit_id: int
+    total_records: int
+    completed_records: int
+    completion_rate: float
+    week_rate: float
+    month_rate: float
+
+class UserStatsSummary(BaseModel):
+    user_id: int
+    overall: CompletionStats
+    this_week: CompletionStats
+    this_month: CompletionStats
+    habits: List[HabitCompletionStats]
+
+# Calendar Schemas
+class HabitCalendarBits(BaseModel):
+    habit_id: int
+    bits: str  # Bitmap del año en base64: bit N % 8 del byte N // 8 = día N del año (0 = 1 de enero)
+
+class HabitCalendar(BaseModel):
+    year: int
+    days: int  # Días del año (365 o 366)
+    habits: List[HabitCalendarBits]
+
+# Analytics Schemas
+class HabitAnalytics(BaseModel):
+    habit_id: int
+    name: str
+    completion_rate: float
+    rolling_7: float
+    rolling_30: float
+    consistency_score: float  # 0-100: media de las tasas semanales penalizada por su variación
+    trend: float  # Puntos porcentuales por semana en las últimas 12 semanas
+    best_weekday: Optional[str] = None
+
+class UserAnalytics(BaseModel):
+    start: date
+    end: date
+    completion_rate: float
+    rolling_7: float
+    rolling_30: float
+    trend: float
+    best_weekday: Optional[str] = None
+    weekday_rates: Dict[str, float]
+    habits: List[HabitAnalytics]
+
+class RollingRate(BaseModel):
+    date: date
+    rolling_7: float
+    rolling_30: float
+
+# Sync Schemas
+class SyncResponse(BaseModel):
+    habits: List[Habit]  # Incluye los desactivados (is_active = False) para que el cliente los quite
+    records: List[Record]
+    next_token: int  # Valor de "since" para la siguiente petición
+    has_more: bool  # True si quedan cambios: volver a pedir enseguida con next_token
+
+# Dashboard Schemas
+class DashboardHabit(Habit):
+    completed_today: bool
+    current_streak: int
+    longest_streak: int
+    recent_records: List[Record]  # Registros de los últimos días, del más reciente al más antiguo
+
+class DashboardSummary(BaseModel):
+    active_habits: int
+    completed_today: int
+    today_rate: float
+    overall: CompletionStats
+    this_week: CompletionStats
+    this_month: CompletionStats
+
+class UserDashboard(BaseModel):
+    user_id: int
+    date: date
+    habits: List[DashboardHabit]
+    summary: DashboardSummary
+
+# Due Schemas
+class HabitDue(Habit):
+    next_due_date: date
+    overdue: bool  # True si debía hacerse antes de la fecha consultada
+
+class UserDueHabits(BaseModel):
+    user_id: int
+    habits: List[HabitDue]
+
+class DueHabitsBulkRequest(BaseModel):
+    user_ids: List[int]
+    due_date: Optional[date] = None  # Por defecto, hoy
+
 # Report Schemas
\ No newline at end of file
@@ -0,0 +1,317 @@
+"""
+Analítica del historial de hábitos de un usuario con NumPy.
+
+El historial del usuario se carga desde los bitmaps anuales de cada hábito
+(una consulta) en una matriz hábitos × días (1 = completado), junto con otra
+que marca los días que cuentan para cada hábito según su frecuencia (la misma
+regla que app/services/schedule.py):
+- diario: cada día desde que existe el hábito
+- días concretos ("mon,wed,fri", "entre semana"): solo esos días
+- por periodo ("weekly", "monthly", "every 3 days"): un día por periodo, el
+  de la última vez que se completó o, si no se completó, el último día del
+  periodo; el periodo en curso solo cuenta si ya se completó
+Así un hábito semanal cumplido todas las semanas tiene una tasa del 100%.
+Todas las métricas (tasas móviles de 7 y 30 días,
+mejor día de la semana, constancia y tendencia) se calculan con operaciones
+sobre esas matrices, sin recorrer los registros en Python: 50 hábitos × 5
+años son menos de 100.000 celdas.
+"""
+
+from datetime import date, timedelta  # Para el eje de días
+from typing import Dict, List, Optional  # Para anotaciones de tipos
+
+import numpy as np  # Cálculo vectorizado (dependencia de pandas)
+from sqlalchemy import func  # Para la fecha del primer registro de cada hábito
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models import models  # Modelos (tablas)
+from app.services import calendar_bitmaps  # Historial de días completados por año
+from app.services.schedule import ScheduleRule, parse_frequency  # Regla de la frecuencia de cada hábito
+
+WEEKDAY_NAMES = ["lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo"]
+
+# Semanas que se usan para calcular la tendencia
+TREND_WEEKS = 12
+
+
+class HabitHistory:
+    """
+    Historial de los hábitos activos de un usuario en forma de matrices.
+
+    Attributes:
+        habit_ids / names: Hábitos, en el orden de las filas
+        start: Fecha de la primera columna (un lunes)
+        end: Fecha de la última columna (hoy)
+        completed: Matriz bool (hábitos × días), True si el día se completó y cuenta
+        eligible: Matriz bool (hábitos × días), True si el día cuenta según la frecuencia
+    """
+
+    def __init__(self, habit_ids: List[int], names: List[str], start: date, end: date,
+                 completed: np.ndarray, eligible: np.ndarray):
+        self.habit_ids = habit_ids
+        self.names = names
+        self.start = start
+        self.end = end
+        self.completed = completed
+        self.eligible = eligible
+
+    @property
+    def days(self) -> int:
+        return self.completed.shape[1]
+
+
+def load_history(db: Session, user_id: int, today: Optional[date] = None) -> HabitHistory:
+    """
+    Cargo los hábitos activos de un usuario y su historial de días completados.
+
+    El historial sale de los bitmaps anuales de calendar_bitmaps (46 bytes por
+    hábito y año), que se desempaquetan con NumPy: no se lee ni se convierte
+    cada registro.
+    """
+    today = today or date.today()
+    habits = db.query(models.Habit.id, models.Habit.name, models.Habit.frequency, models.Habit.created_at).filter(
+        models.Habit.user_id == user_id,
+        models.Habit.is_active == True
+    ).order_by(models.Habit.id).all()
+    habit_ids = [habit.id for habit in habits]
+
+    # Cada hábito cuenta desde que se creó o desde su primer registro, lo que sea anterior
+    first_records = dict(
+        db.query(models.Record.habit_id, func.min(models.Record.date)).filter(
+            models.Record.habit_id.in_(habit_ids)
+        ).group_by(models.Record.habit_id).all()
+    ) if habit_ids else {}
+    starts = np.array([
+        min([habit.created_at.date(), today] + ([first_records[habit.id]] if habit.id in first_records else [])).toordinal()
+        for habit in habits
+    ], dtype=np.int64)
+
+    # La primera columna es el lunes anterior al inicio más antiguo, para alinear las semanas
+    first = date.fromordinal(int(starts.min())) if habit_ids else today
+    first -= timedelta(days=first.weekday())
+    days = today.toordinal() - first.toordinal() + 1
+
+    completed = np.zeros((len(habit_ids), days), dtype=bool)
+    if habit_ids:
+        bitmaps = calendar_bitmaps.get_year_bitmaps(db, habit_ids, first.year, today.year)
+        for year in range(first.year, today.year + 1):
+            # Columnas del año dentro de la matriz y días del año que caen en ellas
+            year_start = date(year, 1, 1).toordinal() - first.toordinal()
+            lo, hi = max(year_start, 0), min(date(year, 12, 31).toordinal() - first.toordinal(), days - 1) + 1
+            year_bits = np.unpackbits(
+                np.frombuffer(b"".join(bitmaps[(habit_id, year)] for habit_id in habit_ids), dtype=np.uint8).reshape(len(habit_ids), -1),
+                axis=1,
+                bitorder="little",
+            )
+            completed[:, lo:hi] = year_bits[:, lo - year_start:hi - year_start]
+
+    eligible = np.arange(days)[None, :] >= (starts - first.toordinal())[:, None]
+    for row, habit in enumerate(habits):
+        completed[row], eligible[row] = _apply_schedule(
+            parse_frequency(habit.frequency), habit.created_at.date(), first, completed[row], eligible[row]
+        )
+
+    return HabitHistory(habit_ids, [habit.name for habit in habits], first, today, completed, eligible)
+
+
+def _apply_schedule(rule: ScheduleRule, anchor: date, first: date, completed: np.ndarray, eligible: np.ndarray):
+    """
+    Dejo en la fila de un hábito solo los días que cuentan según su frecuencia.
+
+    Args:
+        rule: Regla de la frecuencia
+        anchor: Fecha desde la que cuenta el intervalo (creación del hábito, como en schedule)
+        first: Fecha de la primera columna
+        completed / eligible: Filas del hábito (días completados y días desde que existe)
+
+    Returns:
+        Tupla (completados, elegibles) con las mismas columnas
+    """
+    if rule.unit == "day" and rule.interval == 1:
+        return completed, eligible
+
+    # Una columna más (mañana) para saber si el periodo de hoy ya terminó
+    dates = np.datetime64(first, "D") + np.arange(len(completed) + 1)
+    epoch_days = dates.astype(np.int64)
+    # 1970-01-01 fue jueves: desplazo 3 días para que las semanas empiecen en lunes
+    weeks = (epoch_days + 3) // 7
+    anchor_days = np.datetime64(anchor, "D").astype(np.int64)
+    anchor_week = (anchor_days + 3) // 7
+
+    if rule.unit == "week" and rule.weekdays:
+        scheduled = np.isin((epoch_days + 3) % 7, list(rule.weekdays)) & ((weeks - anchor_week) % rule.interval == 0)
+        return completed & scheduled[:-1], eligible & scheduled[:-1]
+
+    if rule.unit == "day":
+        periods = (epoch_days - anchor_days) // rule.interval
+    elif rule.unit == "week":
+        periods = (weeks - anchor_week) // rule.interval
+    else:
+        months = dates.astype("datetime64[M]").astype(np.int64)
+        periods = (months - np.datetime64(anchor, "M").astype(np.int64)) // rule.interval
+
+    # Primer índice de cada periodo dentro de la fila
+    starts = np.flatnonzero(np.r_[True, periods[1:-1] != periods[:-2]])
+    ends = np.r_[starts[1:], len(completed)] - 1
+    done = np.logical_or.reduceat(completed, starts)
+    existed = np.logical_or.reduceat(eligible, starts)
+    last_done = np.maximum.reduceat(np.where(completed, np.arange(len(completed)), -1), starts)
+    # El periodo en curso (el último, si sigue mañana) solo cuenta si ya se completó
+    finished = np.ones(len(starts), dtype=bool)
+    finished[-1] = periods[-1] != periods[-2]
+
+    counts = existed & (finished | done)
+    slots = np.where(done, last_done, ends)[counts]
+    new_completed = np.zeros_like(completed)
+    new_eligible = np.zeros_like(eligible)
+    new_eligible[slots] = True
+    new_completed[slots] = done[counts]
+    return new_completed, new_eligible
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """Porcentaje elemento a elemento (0 donde no hay días que contar)."""
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    out = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator * 100.0, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Suma móvil de `window` días sobre el último eje (ventanas incompletas al inicio)."""
+    cumulative = np.cumsum(values, axis=-1, dtype=np.int64)
+    shifted = np.zeros_like(cumulative)
+    shifted[..., window:] = cumulative[..., :-window]
+    return cumulative - shifted
+
+
+def _weekly(values: np.ndarray) -> np.ndarray:
+    """Sumo las columnas de cada semana (el historial empieza en lunes)."""
+    return np.add.reduceat(values.astype(np.int64), np.arange(0, values.shape[-1], 7), axis=-1)
+
+
+def _slope(rates: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Pendiente por fila de una regresión lineal, ignorando las semanas sin días que contar."""
+    x = np.arange(rates.shape[-1], dtype=float)[None, :]
+    weights = mask.astype(float)
+    count = weights.sum(axis=-1, keepdims=True)
+    safe = np.where(count > 0, count, 1)
+    x_mean = (x * weights).sum(axis=-1, keepdims=True) / safe
+    y_mean = (rates * weights).sum(axis=-1, keepdims=True) / safe
+    covariance = ((x - x_mean) * (rates - y_mean) * weights).sum(axis=-1)
+    variance = (((x - x_mean) ** 2) * weights).sum(axis=-1)
+    return np.divide(covariance, variance, out=np.zeros_like(covariance), where=variance > 0)
+
+
+def _summarize(history: HabitHistory) -> Dict:
+    completed = history.completed
+    eligible = history.eligible
+
+    # Tasas móviles al día de hoy
+    rolling = {
+        window: _ratio(_rolling_sum(completed, window)[:, -1], _rolling_sum(eligible, window)[:, -1])
+        for window in (7, 30)
+    }
+    user_rolling = {
+        window: float(_ratio(_rolling_sum(completed.sum(axis=0), window)[-1], _rolling_sum(eligible.sum(axis=0), window)[-1]))
+        for window in (7, 30)
+    }
+
+    # Días de la semana: una matriz días × 7 con un 1 en el día de cada columna
+    weekdays = np.eye(7, dtype=np.int64)[np.arange(history.days) % 7]
+    weekday_completed = completed.astype(np.int64) @ weekdays
+    weekday_eligible = eligible.astype(np.int64) @ weekdays
+    habit_weekday_rates = _ratio(weekday_completed, weekday_eligible)
+    user_weekday_rates = _ratio(weekday_completed.sum(axis=0), weekday_eligible.sum(axis=0))
+
+    # Constancia: media de las tasas semanales penalizada por su variación
+    weekly_completed = _weekly(completed)
+    weekly_eligible = _weekly(eligible)
+    weekly_rates = _ratio(weekly_completed, weekly_eligible) / 100.0
+    weeks_mask = weekly_eligible > 0
+    weeks_count = np.maximum(weeks_mask.sum(axis=1), 1)
+    weekly_mean = (weekly_rates * weeks_mask).sum(axis=1) / weeks_count
+    weekly_std = np.sqrt((((weekly_rates - weekly_mean[:, None]) ** 2) * weeks_mask).sum(axis=1) / weeks_count)
+    consistency = np.clip(weekly_mean * (1 - weekly_std), 0, 1) * 100
+
+    # Tendencia: pendiente de la tasa semanal en las últimas semanas (puntos porcentuales por semana)
+    recent = slice(-TREND_WEEKS, None)
+    trend = _slope(weekly_rates[:, recent] * 100, weeks_mask[:, recent])
+    user_weekly_rates = _ratio(weekly_completed.sum(axis=0), weekly_eligible.sum(axis=0))[None, recent]
+    user_trend = float(_slope(user_weekly_rates, (weekly_eligible.sum(axis=0) > 0)[None, recent])[0])
+
+    overall = _ratio(completed.sum(axis=1), eligible.sum(axis=1))
+    best_weekday = int(np.argmax(user_weekday_rates))
+
+    return {
+        "start": history.start,
+        "end": history.end,
+        "completion_rate": round(float(_ratio(completed.sum(), eligible.sum())), 2),
+        "rolling_7": round(user_rolling[7], 2),
+        "rolling_30": round(user_rolling[30], 2),
+        "trend": round(user_trend, 2),
+        "best_weekday": WEEKDAY_NAMES[best_weekday] if weekday_completed.sum() else None,
+        "weekday_rates": {WEEKDAY_NAMES[day]: round(float(rate), 2) for day, rate in enumerate(user_weekday_rates)},
+        "habits": [
+            {
+                "habit_id": habit_id,
+                "name": history.names[row],
+                "completion_rate": round(float(overall[row]), 2),
+                "rolling_7": round(float(rolling[7][row]), 2),
+                "rolling_30": round(float(rolling[30][row]), 2),
+                "consistency_score": round(float(consistency[row]), 2),
+                "trend": round(float(trend[row]), 2),
+                "best_weekday": WEEKDAY_NAMES[int(np.argmax(habit_weekday_rates[row]))] if weekday_completed[row].any() else None,
+            }
+            for row, habit_id in enumerate(history.habit_ids)
+        ],
+    }
+
+
+def user_analytics(db: Session, user_id: int, today: Optional[date] = None) -> Dict:
+    """
+    Métricas del historial completo de un usuario.
+
+    Returns:
+        Tasas globales y móviles, mejor día de la semana, tendencia y, por
+        hábito, tasa, tasas móviles, constancia (0-100), tendencia y mejor día
+    """
+    history = load_history(db, user_id, today)
+    if not history.habit_ids:
+        return {
+            "start": history.start, "end": history.end, "completion_rate": 0.0, "rolling_7": 0.0,
+            "rolling_30": 0.0, "trend": 0.0, "best_weekday": None,
+            "weekday_rates": {name: 0.0 for name in WEEKDAY_NAMES}, "habits": [],
+        }
+    return _summarize(history)
+
+
+def rolling_series(db: Session, user_id: int, days: int, habit_id: Optional[int] = None, today: Optional[date] = None) -> List[Dict]:
+    """
+    Serie diaria de las tasas móviles de 7 y 30 días de los últimos `days` días,
+    de todos los hábitos activos del usuario o de uno solo.
+
+    Returns:
+        La serie, o None si `habit_id` no es un hábito activo del usuario
+    """
+    history = load_history(db, user_id, today)
+    completed = history.completed
+    eligible = history.eligible
+    if habit_id is not None:
+        if habit_id not in history.habit_ids:
+            return None
+        rows = [history.habit_ids.index(habit_id)]
+        completed = completed[rows]
+        eligible = eligible[rows]
+
+    completed_by_day = completed.sum(axis=0)
+    eligible_by_day = eligible.sum(axis=0)
+    rate_7 = _ratio(_rolling_sum(completed_by_day, 7), _rolling_sum(eligible_by_day, 7))[-days:]
+    rate_30 = _ratio(_rolling_sum(completed_by_day, 30), _rolling_sum(eligible_by_day, 30))[-days:]
+
+    first = history.end - timedelta(days=len(rate_7) - 1)
+    return [
+        {"date": first + timedelta(days=offset), "rolling_7": round(float(r7), 2), "rolling_30": round(float(r30), 2)}
+        for offset, (r7, r30) in enumerate(zip(rate_7, rate_30))
+    ]
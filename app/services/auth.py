@@ -0,0 +1,237 @@
+"""
+Autenticación con JWT y dependencia get_current_user para las rutas.
+
+Decodificar el token y buscar al usuario en cada petición costaría una
+consulta por llamada. Aquí se guardan dos cachés acotadas (LRU con TTL):
+los tokens ya validados (token -> id de usuario y vencimiento) y los datos
+del usuario (id -> usuario). En el camino caliente una petición autenticada
+no toca la base de datos; solo la primera petición de cada usuario, o la
+siguiente a un cambio en su fila, hace una consulta.
+
+Cuando una fila de users se modifica o se borra, un listener del mapper
+descarta ese usuario de la caché; el TTL acota lo que cambie por otra vía
+(otro proceso o SQL directo).
+
+Configuración:
+- SECRET_KEY: clave para firmar los tokens
+- ACCESS_TOKEN_EXPIRE_MINUTES: vigencia de los tokens nuevos
+- AUTH_CACHE_SIZE / AUTH_CACHE_TTL: entradas y segundos de cada caché
+- PROVISIONING_TOKEN: credencial de servicio para las altas masivas de usuarios
+- REMINDERS_TOKEN: credencial de servicio para los pendientes de varios usuarios
+
+Las rutas para procesos internos (no para usuarios) usan ServiceToken: piden
+el encabezado X-Service-Token con el valor de su variable de entorno y, si la
+variable no está definida, quedan deshabilitadas.
+"""
+
+import os  # Para leer la configuración desde variables de entorno
+import hmac  # Para comparar las credenciales de servicio en tiempo constante
+import time  # Para el TTL de las entradas
+import logging  # Para registrar los fallos de autenticación
+import threading  # Las rutas síncronas corren en el threadpool
+from collections import OrderedDict  # Para el orden LRU
+from datetime import datetime, timedelta  # Para el vencimiento de los tokens
+from typing import Any, NamedTuple, Optional  # Para anotaciones de tipos
+
+from fastapi import Depends, Header, HTTPException, WebSocketException, status  # Para las dependencias y sus errores
+from jose import JWTError, jwt  # Tokens JWT
+from sqlalchemy import event  # Para invalidar la caché cuando cambia un usuario
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+from starlette.requests import HTTPConnection  # Petición HTTP o WebSocket
+
+from app.database.config import get_db  # Sesión de base de datos
+from app.models import models  # Modelos (tablas)
+
+logger = logging.getLogger(__name__)
+
+SECRET_KEY = os.environ.get("SECRET_KEY") or "keysecreta"  # CAMBIAR ESTO en producción (variable SECRET_KEY)
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES") or "1440")
+
+# Entradas y segundos que vive cada una en las cachés de tokens y de usuarios
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE") or "10000")
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL") or "300")
+
+if not os.environ.get("SECRET_KEY"):
+    logger.warning("SECRET_KEY no está definida: se usa la clave por defecto (solo para desarrollo)")
+
+
+class CurrentUser(NamedTuple):
+    """Datos del usuario autenticado (copia inmutable, segura de compartir entre peticiones)."""
+    id: int
+    username: str
+    email: str
+
+
+class TTLCache:
+    """LRU acotado en el que cada entrada vence a los `ttl` segundos (o antes, si se indica)."""
+
+    def __init__(self, max_entries: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Any, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Any):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Token -> (id de usuario, vencimiento) y id de usuario -> CurrentUser
+token_cache = TTLCache()
+user_cache = TTLCache()
+
+
+def create_access_token(user: models.User) -> str:
+    """Creo el token JWT de un usuario, con vencimiento."""
+    now = datetime.utcnow()
+    token_data = {
+        "sub": user.email,
+        "user_id": user.id,
+        "username": user.username,
+        "iat": now,
+        "exp": now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    }
+    return jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def invalidate_user(user_id: int):
+    """Descarto los datos cacheados de un usuario (sus tokens siguen siendo válidos)."""
+    user_cache.pop(user_id)
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _user_changed(mapper, connection, target: models.User):
+    invalidate_user(target.id)
+
+
+def _decode_token(token: str) -> Optional[int]:
+    """Devuelvo el id de usuario del token, desde la caché o decodificándolo."""
+    cached = token_cache.get(token)
+    if cached is not None:
+        user_id, expires_at = cached
+        return user_id if expires_at is None or expires_at > time.time() else None
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    user_id = payload.get("user_id")
+    if not isinstance(user_id, int):
+        return None
+
+    # La entrada no vive más que el propio token
+    expires_at = payload.get("exp")
+    token_cache.put(token, (user_id, expires_at), None if expires_at is None else expires_at - time.time())
+    return user_id
+
+
+def _load_user(db: Session, user_id: int) -> Optional[CurrentUser]:
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    row = db.query(models.User.id, models.User.username, models.User.email).filter(models.User.id == user_id).first()
+    if row is None:
+        return None
+    user = CurrentUser(row.id, row.username, row.email)
+    user_cache.put(user_id, user)
+    return user
+
+
+def _token_from(connection: HTTPConnection) -> Optional[str]:
+    """Token del encabezado Authorization: Bearer (o de ?token= en un WebSocket, que no admite encabezados)."""
+    scheme, _, token = connection.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token.strip()
+    if connection.scope["type"] == "websocket":
+        return connection.query_params.get("token")
+    return None
+
+
+def get_current_user(connection: HTTPConnection, db: Session = Depends(get_db)) -> CurrentUser:
+    """
+    Dependencia: usuario autenticado de la petición.
+
+    Raises:
+        HTTPException: 401 si falta el token, es inválido, venció o el usuario ya no existe
+        (en un WebSocket, la conexión se cierra con el código 1008)
+    """
+    token = _token_from(connection)
+    user_id = _decode_token(token) if token else None
+    user = _load_user(db, user_id) if user_id is not None else None
+    if user is None:
+        logger.warning(f"Petición no autenticada a {connection.url.path}")
+        if connection.scope["type"] == "websocket":
+            raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="No autenticado")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="No autenticado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+
+def require_user(current_user: CurrentUser, user_id: int):
+    """Solo se permite operar sobre los datos del propio usuario."""
+    if user_id != current_user.id:
+        logger.warning(f"Usuario {current_user.id} intentó acceder a datos del usuario {user_id}")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
+
+
+class ServiceToken:
+    """
+    Dependencia para las rutas de procesos internos: exige X-Service-Token
+    igual a la variable de entorno `variable` (403 si falta, no coincide o
+    la variable no está definida).
+    """
+
+    def __init__(self, variable: str):
+        self.variable = variable
+        self.token = os.environ.get(variable) or ""
+
+    def __call__(self, x_service_token: Optional[str] = Header(None)):
+        if not self.token:
+            logger.warning(f"Ruta de servicio deshabilitada: {self.variable} no está definida")
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Ruta deshabilitada")
+        if not x_service_token or not hmac.compare_digest(x_service_token.encode(), self.token.encode()):
+            logger.warning(f"Credencial de servicio inválida ({self.variable})")
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
+
+
+# Altas masivas de usuarios
+require_provisioning = ServiceToken("PROVISIONING_TOKEN")
+
+# Proceso de recordatorios (POST /habits/due/bulk)
+require_reminders = ServiceToken("REMINDERS_TOKEN")
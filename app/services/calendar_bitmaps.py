@@ -0,0 +1,149 @@
+"""
+Calendario compacto de los hábitos: un bit por día y por año.
+
+Cada hábito tiene, por año, 46 bytes en habit_year_bitmaps donde el bit del
+día N del año (0 = 1 de enero) está en el byte N // 8, en la posición N % 8
+(el bit menos significativo primero), y vale 1 si ese día se completó.
+Los bitmaps se actualizan en la misma transacción que los registros; los
+que faltan (hábitos con registros anteriores a este módulo) se construyen
+desde la tabla records la primera vez que se piden y quedan guardados.
+"""
+
+from collections import defaultdict  # Para agrupar cambios por hábito y año
+from datetime import date, datetime  # Para calcular el día del año
+from typing import Dict, Iterable, List, Tuple  # Para anotaciones de tipos
+
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models import models  # Modelos (tablas)
+from app.services.upsert import dialect_insert  # INSERT ... ON CONFLICT del motor
+
+# Bytes por año (366 días, redondeado a bytes)
+YEAR_BYTES = 46
+
+
+def day_bit(day: date) -> int:
+    """Posición del día dentro del bitmap de su año."""
+    return day.timetuple().tm_yday - 1
+
+
+def _set_bit(bits: bytearray, day: date, completed: bool):
+    index = day_bit(day)
+    if completed:
+        bits[index // 8] |= 1 << (index % 8)
+    else:
+        bits[index // 8] &= ~(1 << (index % 8)) & 0xFF
+
+
+def _build_from_records(db: Session, habit_ids: Iterable[int], year: int) -> Dict[int, bytearray]:
+    """Construyo los bitmaps de varios hábitos en un año con una sola consulta."""
+    bitmaps = {habit_id: bytearray(YEAR_BYTES) for habit_id in habit_ids}
+    completed_days = db.query(models.Record.habit_id, models.Record.date).filter(
+        models.Record.habit_id.in_(list(bitmaps)),
+        models.Record.date >= date(year, 1, 1),
+        models.Record.date <= date(year, 12, 31),
+        models.Record.completed == True,
+    )
+    for habit_id, day in completed_days:
+        _set_bit(bitmaps[habit_id], day, True)
+    return bitmaps
+
+
+def _store(db: Session, year: int, bitmaps: Dict[int, bytearray]):
+    """Guardo bitmaps recién construidos (reemplazando los que otra petición haya creado)."""
+    if not bitmaps:
+        return
+    now = datetime.utcnow()
+    rows = [{"habit_id": habit_id, "year": year, "bits": bytes(bits), "updated_at": now} for habit_id, bits in bitmaps.items()]
+
+    insert = dialect_insert(db)
+    if insert is not None:
+        stmt = insert(models.HabitYearBitmap).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.HabitYearBitmap.habit_id, models.HabitYearBitmap.year],
+            set_={"bits": stmt.excluded.bits, "updated_at": now},
+        )
+        db.execute(stmt)
+        return
+
+    for row in rows:
+        db.merge(models.HabitYearBitmap(**row))
+    db.flush()
+
+
+def apply_day_changes(db: Session, changes: Iterable[Tuple[int, date, bool]]):
+    """
+    Actualizo los bits de los días cuyo estado de completado cambió, sin hacer commit.
+
+    Args:
+        changes: Tuplas (id del hábito, fecha, completado)
+    """
+    by_year: Dict[int, Dict[int, List[Tuple[date, bool]]]] = defaultdict(lambda: defaultdict(list))
+    for habit_id, day, completed in changes:
+        by_year[day.year][habit_id].append((day, completed))
+
+    for year, habits in by_year.items():
+        # Bloqueo los bitmaps existentes para que dos escrituras del mismo año no se pisen (solo en PostgreSQL)
+        existing = {
+            bitmap.habit_id: bitmap
+            for bitmap in db.query(models.HabitYearBitmap).filter(
+                models.HabitYearBitmap.habit_id.in_(list(habits)),
+                models.HabitYearBitmap.year == year,
+            ).with_for_update()
+        }
+
+        now = datetime.utcnow()
+        for habit_id, bitmap in existing.items():
+            bits = bytearray(bitmap.bits)
+            for day, completed in habits[habit_id]:
+                _set_bit(bits, day, completed)
+            bitmap.bits = bytes(bits)
+            bitmap.updated_at = now
+
+        # Los que no existían se construyen desde los registros, que ya incluyen estos cambios
+        missing = [habit_id for habit_id in habits if habit_id not in existing]
+        if missing:
+            db.flush()
+            _store(db, year, _build_from_records(db, missing, year))
+
+
+def get_year_bitmaps(db: Session, habit_ids: List[int], first_year: int, last_year: int) -> Dict[Tuple[int, int], bytes]:
+    """
+    Devuelvo los bitmaps de varios hábitos en un rango de años.
+
+    Lee todos los bitmaps guardados con una consulta; los que faltan se
+    construyen (una consulta por año) y se guardan para las siguientes lecturas.
+
+    Returns:
+        Diccionario (id del hábito, año) -> bitmap
+    """
+    bitmaps = {
+        (habit_id, year): bits
+        for habit_id, year, bits in db.query(
+            models.HabitYearBitmap.habit_id, models.HabitYearBitmap.year, models.HabitYearBitmap.bits
+        ).filter(
+            models.HabitYearBitmap.habit_id.in_(habit_ids),
+            models.HabitYearBitmap.year >= first_year,
+            models.HabitYearBitmap.year <= last_year,
+        )
+    }
+
+    built_any = False
+    for year in range(first_year, last_year + 1):
+        missing = [habit_id for habit_id in habit_ids if (habit_id, year) not in bitmaps]
+        if not missing:
+            continue
+        built = _build_from_records(db, missing, year)
+        _store(db, year, built)
+        bitmaps.update({(habit_id, year): bytes(bits) for habit_id, bits in built.items()})
+        built_any = True
+    if built_any:
+        db.commit()
+
+    return bitmaps
+
+
+def get_bitmaps(db: Session, habit_ids: List[int], year: int) -> Dict[int, bytes]:
+    """Devuelvo el bitmap de cada hábito en un año."""
+    bitmaps = get_year_bitmaps(db, habit_ids, year, year)
+    return {habit_id: bitmaps[(habit_id, year)] for habit_id in habit_ids}
@@ -0,0 +1,73 @@
+"""
+Datos del dashboard de un usuario en una sola respuesta.
+
+El número de consultas es fijo sin importar cuántos hábitos tenga el
+usuario: una para los hábitos, una (selectinload con IN) para sus registros
+recientes, una para las rachas y una para los totales precalculados.
+"""
+
+from datetime import date, timedelta  # Para la ventana de registros recientes
+from typing import Dict, Optional  # Para anotaciones de tipos
+
+from sqlalchemy.orm import Session, selectinload  # Sesión y carga anticipada
+
+from app.models import models  # Modelos (tablas)
+from app.services import rollups, streaks  # Totales por periodo y rachas
+
+
+def build_dashboard(db: Session, user_id: int, days: int = 7, today: Optional[date] = None) -> Dict:
+    """
+    Armo el dashboard: hábitos activos con sus registros de los últimos `days`
+    días, estado de hoy, rachas y resumen de cumplimiento.
+    """
+    today = today or date.today()
+    since = today - timedelta(days=days - 1)
+
+    # Los registros se cargan con una sola consulta IN, limitados a la ventana reciente
+    habits = db.query(models.Habit).options(
+        selectinload(models.Habit.records.and_(
+            models.Record.date >= since,
+            models.Record.date <= today,
+        ))
+    ).filter(
+        models.Habit.user_id == user_id,
+        models.Habit.is_active == True
+    ).order_by(models.Habit.id).all()
+
+    streak_by_habit = {streak["habit_id"]: streak for streak in streaks.get_streaks(db, habits)} if habits else {}
+    summary = rollups.user_summary(db, user_id, today)
+
+    habit_views = []
+    completed_today = 0
+    for habit in habits:
+        recent = sorted(habit.records, key=lambda record: record.date, reverse=True)
+        done_today = any(record.date == today and record.completed for record in recent)
+        completed_today += done_today
+        streak = streak_by_habit[habit.id]
+        habit_views.append({
+            "id": habit.id,
+            "name": habit.name,
+            "description": habit.description,
+            "frequency": habit.frequency,
+            "user_id": habit.user_id,
+            "is_active": habit.is_active,
+            "created_at": habit.created_at,
+            "completed_today": done_today,
+            "current_streak": streak["current_streak"],
+            "longest_streak": streak["longest_streak"],
+            "recent_records": recent,
+        })
+
+    return {
+        "user_id": user_id,
+        "date": today,
+        "habits": habit_views,
+        "summary": {
+            "active_habits": len(habits),
+            "completed_today": completed_today,
+            "today_rate": round(completed_today * 100.0 / len(habits), 2) if habits else 0.0,
+            "overall": summary["overall"],
+            "this_week": summary["this_week"],
+            "this_month": summary["this_month"],
+        },
+    }
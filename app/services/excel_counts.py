@@ -0,0 +1,127 @@
+"""
+Conteo de filas de excel_data por archivo.
+
+El escritor de lotes suma las filas de cada lote en excel_file_counts dentro
+de la misma transacción que las inserta, así el total por archivo siempre
+coincide con los datos y la API no necesita hacer COUNT(*) sobre la tabla.
+
+Los conteos de una tabla con datos anteriores a excel_file_counts se
+reconstruyen al arrancar la aplicación (si no hay ninguno) o a mano:
+
+    python -m app.services.excel_counts
+"""
+
+import logging  # Para registrar la reconstrucción
+from datetime import datetime  # Para el sello de la última actualización
+from typing import Optional  # Para anotaciones de tipos
+
+from sqlalchemy import func  # Para sumar y agrupar
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models.models import ExcelData, ExcelFileCount  # Datos y conteos por archivo
+from app.services.upsert import dialect_insert  # INSERT ... ON CONFLICT del motor
+
+logger = logging.getLogger(__name__)
+
+
+
+def increment_file_count(db: Session, file_name: Optional[str], delta: int):
+    """
+    Sumo (o resto) filas al conteo de un archivo sin hacer commit.
+
+    Se llama dentro de la transacción del lote, de modo que el conteo y
+    las filas se confirman (o se descartan) juntos.
+    """
+    if not delta:
+        return
+    file_name = file_name or ""
+    now = datetime.utcnow()
+
+    insert = dialect_insert(db)
+    if insert is not None:
+        stmt = insert(ExcelFileCount).values(file_name=file_name, row_count=delta, updated_at=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ExcelFileCount.file_name],
+            set_={"row_count": ExcelFileCount.row_count + delta, "updated_at": now},
+        )
+        db.execute(stmt)
+        return
+
+    updated = db.query(ExcelFileCount).filter(ExcelFileCount.file_name == file_name).update(
+        {"row_count": ExcelFileCount.row_count + delta, "updated_at": now},
+        synchronize_session=False,
+    )
+    if not updated:
+        db.add(ExcelFileCount(file_name=file_name, row_count=delta, updated_at=now))
+        db.flush()
+
+
+def rebuild_counts(db: Session) -> int:
+    """
+    Recalculo todos los conteos con un GROUP BY sobre excel_data.
+
+    Solo hace falta si la tabla tenía datos antes de existir los conteos.
+
+    Returns:
+        Total de filas en excel_data
+    """
+    db.query(ExcelFileCount).delete()
+    now = datetime.utcnow()
+    total = 0
+    rows = db.query(ExcelData.file_name, func.count(ExcelData.id)).group_by(ExcelData.file_name)
+    for file_name, row_count in rows:
+        db.add(ExcelFileCount(file_name=file_name or "", row_count=row_count, updated_at=now))
+        total += row_count
+    db.commit()
+    logger.info(f"Conteos de excel_data reconstruidos: {total} filas")
+    return total
+
+
+def ensure_counts(db: Session) -> Optional[int]:
+    """
+    Reconstruyo los conteos si todavía no hay ninguno pero sí datos.
+
+    Se llama una vez al arrancar, no en las lecturas.
+
+    Returns:
+        Total de filas si se reconstruyeron, o None si no hacía falta
+    """
+    if db.query(ExcelFileCount.file_name).first() is not None:
+        return None
+    if db.query(ExcelData.id).first() is None:
+        return None
+    return rebuild_counts(db)
+
+
+
+def count_rows(db: Session, file_name: Optional[str] = None) -> int:
+    """
+    Devuelvo las filas de excel_data (de un archivo o de todos) desde los conteos.
+
+    Solo lee excel_file_counts; la reconstrucción se hace con ensure_counts.
+    """
+    if file_name is not None:
+        row_count = db.query(ExcelFileCount.row_count).filter(ExcelFileCount.file_name == file_name).scalar()
+        return row_count or 0
+    return int(db.query(func.coalesce(func.sum(ExcelFileCount.row_count), 0)).scalar())
+
+
+def clear_counts(db: Session):
+    """Borro todos los conteos (sin commit), junto con el borrado de excel_data."""
+    db.query(ExcelFileCount).delete()
+
+
+def main():
+    from app.database.config import Base, SessionLocal, engine
+
+    logging.basicConfig(level=logging.INFO)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rebuild_counts(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Motor de inserción masiva para los datos cargados desde Excel.
+
+En lugar de recorrer el DataFrame fila por fila y crear un objeto ORM por
+cada una, convierto el DataFrame por columnas y escribo lotes grandes:
+- En PostgreSQL uso COPY (el camino más rápido que ofrece el motor).
+- En el resto (SQLite) uso executemany con insert().
+"""
+
+import io  # Para construir el buffer que se envía a COPY
+import math  # Para reconocer las celdas NaN
+import os  # Para leer la configuración desde variables de entorno
+import logging  # Para registrar el avance de la carga
+from datetime import datetime  # Para el sello de tiempo de la carga
+from typing import Any, Callable, Dict, Iterable, List, Optional  # Para anotaciones de tipos
+
+import pandas as pd  # Para procesamiento de datos en Excel
+from sqlalchemy import insert  # Para inserciones masivas con executemany
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models.models import ExcelData  # Modelo para almacenar datos de Excel
+from app.services.excel_counts import increment_file_count  # Conteo de filas por archivo
+
+logger = logging.getLogger(__name__)
+
+# Número de columnas de datos que tiene la tabla excel_data (column1..column5)
+EXCEL_DATA_COLUMNS = 5
+
+# Tamaño de lote por defecto, configurable desde el entorno
+DEFAULT_BATCH_SIZE = int(os.environ.get("EXCEL_BATCH_SIZE", "5000"))
+
+# Límites para no aceptar lotes absurdos desde la API
+MIN_BATCH_SIZE = 100
+MAX_BATCH_SIZE = 100_000
+
+# Orden de las columnas tal y como las escribo en la tabla
+INSERT_COLUMNS = [f"column{i}" for i in range(1, EXCEL_DATA_COLUMNS + 1)] + [
+    "file_name", "sheet_name", "uploaded_at", "job_id"
+]
+
+# Callback de progreso: recibe (filas_insertadas, filas_totales)
+ProgressCallback = Callable[[int, int], None]
+
+# Función que escribe un lote: recibe (sesión, lote, usar_copy) y devuelve las filas escritas
+BatchWriter = Callable[[Session, Any, bool], int]
+
+
+def resolve_batch_size(batch_size: Optional[int]) -> int:
+    """Devuelvo el tamaño de lote a usar, acotado a los límites permitidos."""
+    if not batch_size:
+        batch_size = DEFAULT_BATCH_SIZE
+    return max(MIN_BATCH_SIZE, min(MAX_BATCH_SIZE, batch_size))
+
+
+def cell_to_str(value) -> Optional[str]:
+    """
+    Convierto una celda a texto igual en todos los lectores (pandas y streaming).
+
+    Las celdas vacías (None o NaN) quedan como NULL y los números enteros que
+    llegan como float se escriben sin decimales ("3" y no "3.0").
+    """
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+def dataframe_to_rows(
+    df: pd.DataFrame,
+    file_name: str,
+    uploaded_at: datetime,
+    sheet_name: Optional[str] = None,
+    job_id: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Convierto el DataFrame a una lista de diccionarios listos para insertar.
+
+    Las celdas pasan por cell_to_str columna por columna, y las filas sin
+    ningún valor se descartan, igual que en el lector en streaming.
+    """
+    columns = [
+        [cell_to_str(value) for value in df.iloc[:, i].tolist()]
+        for i in range(min(EXCEL_DATA_COLUMNS, df.shape[1]))
+    ]
+    rows = columns_to_rows(columns, len(df), file_name, uploaded_at, sheet_name, job_id)
+    return [row for row in rows if any(row[column] is not None for column in INSERT_COLUMNS[:EXCEL_DATA_COLUMNS])]
+
+
+def columns_to_rows(
+    columns: List[List],
+    row_count: int,
+    file_name: str,
+    uploaded_at: datetime,
+    sheet_name: Optional[str] = None,
+    job_id: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Armo las filas a insertar a partir de listas de valores por columna.
+
+    Las columnas que falten (el origen tiene menos de 5) quedan como NULL.
+    Cada fila lleva el id del trabajo que la carga (job_id), si lo hay.
+    """
+    columns = list(columns[:EXCEL_DATA_COLUMNS])
+    while len(columns) < EXCEL_DATA_COLUMNS:
+        columns.append([None] * row_count)
+
+    return [
+        dict(zip(INSERT_COLUMNS, values + (file_name, sheet_name, uploaded_at, job_id)))
+        for values in zip(*columns)
+    ]
+
+
+def _copy_escape(value) -> str:
+    """Escapo un valor para el formato de texto de COPY (\\N representa NULL)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_from_buffer(db: Session, buffer, csv_format: bool = False) -> None:
+    """
+    Envío un buffer a COPY excel_data ... FROM STDIN usando la conexión de psycopg2.
+
+    El buffer debe traer las columnas en el orden de INSERT_COLUMNS, en el
+    formato de texto de COPY o, con csv_format, en CSV sin encabezado.
+    """
+    options = " WITH (FORMAT csv)" if csv_format else ""
+
+    # Uso la misma conexión de la sesión para que el COPY forme parte de su transacción
+    dbapi_connection = db.connection().connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {ExcelData.__tablename__} ({', '.join(INSERT_COLUMNS)}) FROM STDIN{options}",
+            buffer,
+        )
+
+
+def _copy_rows(db: Session, rows: List[Dict]) -> None:
+    """Inserto un lote de diccionarios con COPY en formato de texto."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_escape(row[column]) for column in INSERT_COLUMNS))
+        buffer.write("\n")
+    buffer.seek(0)
+    copy_from_buffer(db, buffer)
+
+
+def supports_copy(db: Session) -> bool:
+    """Indico si el motor de la sesión admite COPY (solo PostgreSQL con psycopg2)."""
+    bind = db.get_bind()
+    return bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2"
+
+
+def bulk_insert_rows(db: Session, rows: List[Dict], use_copy: Optional[bool] = None) -> int:
+    """
+    Inserto un lote de filas en excel_data sin crear objetos ORM.
+
+    Returns:
+        Número de filas insertadas
+    """
+    if not rows:
+        return 0
+
+    if use_copy is None:
+        use_copy = supports_copy(db)
+
+    if use_copy:
+        _copy_rows(db, rows)
+    else:
+        # executemany: una sola sentencia preparada para todo el lote
+        db.execute(insert(ExcelData), rows)
+
+    return len(rows)
+
+
+def ingest_batches(
+    db: Session,
+    batches: Iterable[Any],
+    total_rows: Optional[int],
+    on_progress: Optional[ProgressCallback] = None,
+    write: BatchWriter = bulk_insert_rows,
+    file_name: Optional[str] = None,
+) -> int:
+    """
+    Inserto lotes ya preparados haciendo commit y reportando progreso por lote.
+
+    Por defecto cada lote es una lista de diccionarios; con `write` se puede
+    usar otro formato de lote (por ejemplo, lotes columnares de Arrow).
+    Con `file_name`, el conteo de filas del archivo se actualiza en la misma
+    transacción que cada lote.
+
+    Returns:
+        Número total de filas insertadas
+    """
+    use_copy = supports_copy(db)
+    rows_inserted = 0
+
+    for batch in batches:
+        written = write(db, batch, use_copy)
+        if file_name is not None:
+            increment_file_count(db, file_name, written)
+        db.commit()
+        rows_inserted += written
+
+        if on_progress:
+            on_progress(rows_inserted, total_rows)
+
+    return rows_inserted
+
+
+def ingest_dataframe(
+    db: Session,
+    df: pd.DataFrame,
+    file_name: str,
+    batch_size: Optional[int] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    sheet_name: Optional[str] = None,
+    job_id: Optional[str] = None,
+) -> int:
+    """
+    Inserto todas las filas de un DataFrame en excel_data por lotes.
+
+    Args:
+        db: Sesión de base de datos
+        df: DataFrame leído del Excel
+        file_name: Nombre del archivo de origen
+        batch_size: Filas por lote (por defecto EXCEL_BATCH_SIZE)
+        on_progress: Función llamada después de cada lote
+        sheet_name: Hoja de origen de las filas
+        job_id: Trabajo de carga al que pertenecen las filas
+
+
+    Returns:
+        Número total de filas insertadas
+    """
+    batch_size = resolve_batch_size(batch_size)
+    total_rows = len(df)
+    uploaded_at = datetime.utcnow()
+
+    def batches():
+        for start in range(0, total_rows, batch_size):
+            chunk = df.iloc[start:start + batch_size]
+            yield dataframe_to_rows(chunk, file_name, uploaded_at, sheet_name, job_id)
+
+    rows_inserted = ingest_batches(db, batches(), total_rows, on_progress, file_name=file_name)
+    logger.info(f"Carga masiva completada: {rows_inserted} filas de '{file_name}' (lotes de {batch_size})")
+    return rows_inserted
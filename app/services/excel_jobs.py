@@ -0,0 +1,383 @@
+"""
+Cola de trabajos en segundo plano para las cargas de Excel.
+
+Cada carga (o borrado de datos) se convierte en un trabajo con su propio id, estado, progreso,
+conteo de filas y errores. Los trabajos se ejecutan en un pool de hilos con
+una cola acotada, de modo que la petición HTTP responde de inmediato y los
+workers de uvicorn quedan libres mientras se procesa el archivo.
+"""
+
+import os  # Para leer la configuración desde variables de entorno
+import uuid  # Para generar los ids de los trabajos
+import logging  # Para registrar el resultado de cada trabajo
+import threading  # Para proteger el estado compartido entre hilos
+from collections import OrderedDict  # Para conservar el orden de llegada de los trabajos
+from concurrent.futures import ThreadPoolExecutor  # Pool de workers
+from datetime import datetime  # Para los sellos de tiempo de cada trabajo
+from typing import Dict, List, Optional, Tuple  # Para anotaciones de tipos
+
+import pandas as pd  # Para procesamiento de datos en Excel
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.database.config import SessionLocal  # Cada trabajo abre su propia sesión
+from app.services.excel_ingest import ProgressCallback, ingest_dataframe
+from app.services.excel_reader import ingest_excel_stream, should_stream
+from app.services.excel_parallel import ingest_workbooks, parse_sheet_selection
+from app.services.columnar_ingest import ingest_columnar_file, is_columnar_file
+from app.services.progress_broker import ProgressBroker, progress_broker
+from app.services.upload_registry import record_job_result
+from app.services.excel_purge import purge_rows
+from app.services.upload_files import unregister_files
+
+logger = logging.getLogger(__name__)
+
+# Configuración del pool, configurable desde el entorno
+EXCEL_WORKERS = int(os.environ.get("EXCEL_WORKERS", "2"))
+EXCEL_QUEUE_SIZE = int(os.environ.get("EXCEL_QUEUE_SIZE", "16"))
+EXCEL_JOB_HISTORY = int(os.environ.get("EXCEL_JOB_HISTORY", "200"))
+
+# Estados posibles de un trabajo
+JOB_QUEUED = "queued"
+JOB_PROCESSING = "processing"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED)
+
+
+class JobQueueFull(Exception):
+    """La cola de trabajos está llena y no acepta más cargas por ahora."""
+
+
+class IngestJob:
+    """
+    Estado de una carga de Excel procesada en segundo plano.
+
+    Un trabajo puede incluir varios archivos y, si se piden hojas (sheets),
+    se leen en paralelo una hoja por proceso.
+    """
+
+    kind = "ingest"
+
+    def __init__(
+        self,
+        files: List[Tuple[str, str]],
+        batch_size: Optional[int],
+        streaming: Optional[bool],
+        sheets: Optional[str] = None,
+        job_id: Optional[str] = None,
+    ):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.files = files
+        self.filename = ", ".join(file_name for _, file_name in files)
+        self.batch_size = batch_size
+        self.streaming = streaming
+        self.sheets = sheets
+
+        self.status = JOB_QUEUED
+        self.progress = 0.0
+        self.rows_processed = 0
+        self.total_rows: Optional[int] = None
+        self.columns: List[str] = []
+        self.sheet_summary: List[Dict] = []
+        self.error: Optional[str] = None
+
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def snapshot(self) -> Dict:
+        """Devuelvo el estado del trabajo listo para enviarlo como JSON."""
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "filename": self.filename,
+            "status": self.status,
+            "progress": round(self.progress, 2),
+            "rows_processed": self.rows_processed,
+            "total_rows": self.total_rows,
+            "columns": self.columns,
+            "sheets": self.sheet_summary,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class PurgeJob(IngestJob):
+    """
+    Borrado en segundo plano de las filas de un archivo (o de todos).
+
+    Reporta el progreso igual que una carga: filas eliminadas sobre el total.
+    """
+
+    kind = "purge"
+
+    def __init__(self, file_name: Optional[str], upto_id: Optional[int], job_id: Optional[str] = None):
+        super().__init__([], None, None, job_id=job_id)
+        self.filename = file_name if file_name is not None else "*"
+        self.purge_file = file_name
+        self.upto_id = upto_id
+
+
+def ingest_file(
+    db: Session,
+    file_path: str,
+    file_name: str,
+    batch_size: Optional[int] = None,
+    streaming: Optional[bool] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    job_id: Optional[str] = None,
+) -> Tuple[int, List[str]]:
+    """
+    Leo un archivo ya guardado en disco y lo inserto en excel_data.
+
+    CSV, Parquet y Arrow van por el lector columnar; en Excel uso el modo
+    streaming para .xlsx grandes y pandas para el resto. Las filas quedan
+    marcadas con job_id.
+
+    Returns:
+        Tupla (filas insertadas, columnas del encabezado)
+    """
+    if is_columnar_file(file_path):
+        return ingest_columnar_file(db, file_path, file_name, batch_size, on_progress, job_id)
+
+    if should_stream(file_path, streaming):
+        return ingest_excel_stream(db, file_path, file_name, batch_size, on_progress, job_id)
+
+    # pandas detecta automáticamente el formato (.xls o .xlsx)
+    with pd.ExcelFile(file_path) as workbook:
+        sheet_name = workbook.sheet_names[0]
+        df = workbook.parse(sheet_name)
+    if on_progress:
+        on_progress(0, len(df))
+    rows_inserted = ingest_dataframe(db, df, file_name, batch_size, on_progress, sheet_name=sheet_name, job_id=job_id)
+    return rows_inserted, [str(column) for column in df.columns]
+
+
+class JobManager:
+    """
+    Ejecuta las cargas en un pool de hilos con una cola acotada, guarda
+    el estado de los últimos trabajos para poder consultarlo por id y
+    publica cada cambio en el broker de progreso.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, max_history: int, broker: ProgressBroker):
+        self.broker = broker
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="excel-job")
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pending_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def _evict_finished(self):
+        """Descarto los trabajos terminados más antiguos si supero el historial."""
+        overflow = len(self._jobs) - self.max_history
+        if overflow <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished][:overflow]:
+            del self._jobs[job_id]
+
+    def submit(
+        self,
+        files: List[Tuple[str, str]],
+        batch_size: Optional[int] = None,
+        streaming: Optional[bool] = None,
+        sheets: Optional[str] = None,
+        job_id: Optional[str] = None,
+    ) -> IngestJob:
+        """
+        Encolo una nueva carga.
+
+        Args:
+            files: Lista de (ruta en disco, nombre original)
+            batch_size: Filas por lote
+            streaming: Fuerza (o desactiva) el modo streaming
+            sheets: Hojas a leer ("all" o nombres separados por comas)
+            job_id: Id a usar para el trabajo (por defecto se genera uno)
+
+        Raises:
+            JobQueueFull: si ya hay demasiados trabajos pendientes
+        """
+        job = IngestJob(files, batch_size, streaming, sheets, job_id)
+        return self._enqueue(job, self._run)
+
+    def submit_purge(self, file_name: Optional[str] = None, upto_id: Optional[int] = None) -> PurgeJob:
+        """
+        Encolo el borrado de las filas de un archivo (o de todos si file_name es None).
+
+        Args:
+            file_name: Archivo cuyas filas se eliminan
+            upto_id: Eliminar solo filas con id menor o igual
+
+        Raises:
+            JobQueueFull: si ya hay demasiados trabajos pendientes
+        """
+        return self._enqueue(PurgeJob(file_name, upto_id), self._run_purge)
+
+    def _enqueue(self, job: IngestJob, target) -> IngestJob:
+        """Registro el trabajo, publico su estado inicial y lo envío al pool."""
+        with self._lock:
+            if self._pending_count() >= self.max_workers + self.max_queue:
+                raise JobQueueFull()
+            self._jobs[job.job_id] = job
+            self._evict_finished()
+            snapshot = job.snapshot()
+
+        self.broker.publish(job.job_id, snapshot)
+        self._executor.submit(target, job)
+        logger.info(f"Trabajo {job.job_id} ({job.kind}) encolado para '{job.filename}'")
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """
+        Devuelvo el estado de un trabajo. Si lo procesa otro worker,
+        uso el último estado recibido por el broker.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            snapshot = job.snapshot() if job else None
+        if snapshot is None:
+            return self.broker.latest(job_id)
+        return {**snapshot, "version": self.broker.version(job_id)}
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        """Devuelvo los trabajos más recientes primero."""
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+            return [job.snapshot() for job in reversed(jobs)]
+
+    def _update(self, job: IngestJob, **fields):
+        """Actualizo el trabajo y publico su nuevo estado."""
+        with self._lock:
+            for key, value in fields.items():
+                setattr(job, key, value)
+            snapshot = job.snapshot()
+        self.broker.publish(job.job_id, snapshot)
+
+    def _progress_reporter(self, job: IngestJob) -> ProgressCallback:
+        """Creo el callback que publica el avance del trabajo."""
+
+        def report_progress(rows_done: int, rows_total: Optional[int]):
+            fields = {"rows_processed": rows_done, "total_rows": rows_total}
+            if rows_total:
+                fields["progress"] = min((rows_done / rows_total) * 100, 99.99)
+            self._update(job, **fields)
+
+        return report_progress
+
+    def _run_purge(self, job: PurgeJob):
+        """Ejecuto un borrado dentro de un hilo del pool."""
+        self._update(job, status=JOB_PROCESSING, started_at=datetime.utcnow())
+
+        db = SessionLocal()
+        try:
+            rows_deleted = purge_rows(db, job.purge_file, job.upto_id, on_progress=self._progress_reporter(job))
+            self._update(
+                job,
+                status=JOB_COMPLETED,
+                progress=100.0,
+                rows_processed=rows_deleted,
+                finished_at=datetime.utcnow(),
+            )
+            logger.info(f"Trabajo {job.job_id} completado: {rows_deleted} filas eliminadas")
+
+        except Exception as e:
+            db.rollback()
+            self._update(job, status=JOB_FAILED, error=str(e), finished_at=datetime.utcnow())
+            logger.error(f"Error en el trabajo {job.job_id}: {str(e)}")
+
+        finally:
+            db.close()
+
+    def _run(self, job: IngestJob):
+        """Proceso un trabajo dentro de un hilo del pool."""
+        self._update(job, status=JOB_PROCESSING, started_at=datetime.utcnow())
+        report_progress = self._progress_reporter(job)
+
+        db = SessionLocal()
+        try:
+            sheet_summary = []
+            if job.sheets is not None or len(job.files) > 1:
+                # Varias hojas o varios archivos: una hoja por proceso del pool
+                rows_inserted, sheet_summary = ingest_workbooks(
+                    db,
+                    job.files,
+                    parse_sheet_selection(job.sheets),
+                    job.batch_size,
+                    report_progress,
+                    first_sheet_only=job.sheets is None,
+                    job_id=job.job_id,
+                )
+                columns = sheet_summary[0]["columns"] if sheet_summary else []
+            else:
+                file_path, file_name = job.files[0]
+                rows_inserted, columns = ingest_file(
+                    db, file_path, file_name, job.batch_size, job.streaming, report_progress, job.job_id
+                )
+
+            if rows_inserted == 0:
+                raise ValueError("El archivo Excel está vacío")
+
+            # Anoto el resultado por archivo para no volver a procesar el mismo contenido
+            if sheet_summary:
+                rows_by_file, columns_by_file = {}, {}
+                for sheet in sheet_summary:
+                    rows_by_file[sheet["file_name"]] = rows_by_file.get(sheet["file_name"], 0) + sheet["rows"]
+                    columns_by_file.setdefault(sheet["file_name"], sheet["columns"])
+            else:
+                rows_by_file = {job.files[0][1]: rows_inserted}
+                columns_by_file = {job.files[0][1]: columns}
+            record_job_result(db, job.job_id, JOB_COMPLETED, rows_by_file, columns_by_file)
+
+            self._update(
+                job,
+                status=JOB_COMPLETED,
+                progress=100.0,
+                rows_processed=rows_inserted,
+                columns=columns,
+                sheet_summary=sheet_summary,
+                finished_at=datetime.utcnow(),
+            )
+            logger.info(f"Trabajo {job.job_id} completado: {rows_inserted} filas")
+
+        except Exception as e:
+            db.rollback()
+            self._update(job, status=JOB_FAILED, error=str(e), finished_at=datetime.utcnow())
+            logger.error(f"Error en el trabajo {job.job_id}: {str(e)}")
+
+            # Cada lote se confirma por separado: antes de permitir un nuevo intento
+            # borro las filas que este trabajo alcanzó a insertar (marcadas con su job_id),
+            # o se duplicarían. Si no se pueden borrar, la subida no queda como reintentable.
+            try:
+                for file_name in dict.fromkeys(file_name for _, file_name in job.files):
+                    purge_rows(db, file_name, job_id=job.job_id)
+                record_job_result(db, job.job_id, JOB_FAILED, error=str(e))
+            except Exception as record_error:
+                db.rollback()
+                logger.error(f"No se pudo deshacer o registrar el fallo del trabajo {job.job_id}: {str(record_error)}")
+
+            # Elimino los archivos si existen, igual que hacía la carga síncrona
+            for file_path, _ in job.files:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            try:
+                unregister_files(db, [os.path.basename(file_path) for file_path, _ in job.files])
+            except Exception as index_error:
+                db.rollback()
+                logger.error(f"No se pudo actualizar el índice de archivos: {str(index_error)}")
+
+        finally:
+            db.close()
+
+
+# Instancia compartida por todo el proceso
+job_manager = JobManager(EXCEL_WORKERS, EXCEL_QUEUE_SIZE, EXCEL_JOB_HISTORY, progress_broker)
@@ -0,0 +1,286 @@
+"""
+Lectura en paralelo de libros con varias hojas y de lotes de archivos.
+
+Cada hoja (o archivo) se lee en un proceso distinto del pool, de modo que
+la lectura aprovecha todos los núcleos. Los lotes ya convertidos vuelven al
+proceso principal por una cola acotada, a medida que se leen, y pasan por
+el mismo escritor de excel_data, guardando la hoja de origen de cada fila.
+"""
+
+import os  # Para leer la configuración desde variables de entorno
+import logging  # Para registrar el avance de la carga
+import threading  # Para crear el pool una sola vez
+import multiprocessing  # Para elegir cómo se arrancan los procesos del pool
+from concurrent.futures import Future, ProcessPoolExecutor  # Pool de procesos
+from queue import Empty, Full  # Errores de espera de la cola de lotes
+from datetime import datetime  # Para el sello de tiempo de la carga
+from typing import Dict, List, Optional, Sequence, Tuple  # Para anotaciones de tipos
+
+import pandas as pd  # Para leer los .xls
+from openpyxl import load_workbook  # Motor de lectura Excel
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.services.excel_ingest import ProgressCallback, dataframe_to_rows, ingest_batches, resolve_batch_size
+from app.services.excel_reader import ExcelStreamReader
+
+logger = logging.getLogger(__name__)
+
+# Número de procesos de lectura (por defecto, uno por núcleo)
+EXCEL_PARSE_PROCESSES = int(os.environ.get("EXCEL_PARSE_PROCESSES", str(os.cpu_count() or 1)))
+
+# Lotes leídos que pueden esperar en la cola de cada carga antes de escribirse
+EXCEL_PARSE_QUEUE_BATCHES = int(os.environ.get("EXCEL_PARSE_QUEUE_BATCHES") or str(2 * EXCEL_PARSE_PROCESSES))
+
+# Cada cuánto (en segundos) se revisa la cola si no llega nada o no hay sitio
+QUEUE_POLL_SECONDS = 1.0
+
+# Valores del parámetro "sheets" que significan "todas las hojas"
+ALL_SHEETS = ("*", "all")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_manager = None
+_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Devuelvo el pool de procesos de lectura, creándolo la primera vez.
+
+    Uso "spawn" porque el servidor ya tiene hilos en marcha y hacer fork
+    de un proceso con hilos puede dejar locks tomados en el hijo.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=EXCEL_PARSE_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def get_parse_manager():
+    """
+    Devuelvo el proceso gestor que aloja las colas de lotes, creándolo la primera vez.
+
+    Las colas de multiprocessing no se pueden enviar a las tareas del pool;
+    las del gestor sí, porque viajan como proxies.
+    """
+    global _manager
+    with _pool_lock:
+        if _manager is None:
+            _manager = multiprocessing.get_context("spawn").Manager()
+        return _manager
+
+
+
+def parse_sheet_selection(sheets: Optional[str]) -> Optional[List[str]]:
+    """
+    Interpreto el parámetro "sheets" de la API.
+
+    Returns:
+        None si se piden todas las hojas, o la lista de nombres indicados
+    """
+    if sheets is None or sheets.strip().lower() in ALL_SHEETS:
+        return None
+    return [name.strip() for name in sheets.split(",") if name.strip()]
+
+
+def list_sheets(file_path: str) -> List[Tuple[str, Optional[int]]]:
+    """
+    Listo las hojas de un libro con su número estimado de filas de datos.
+
+    En .xlsx el número de filas sale de la dimensión guardada en el archivo,
+    sin recorrer las celdas.
+    """
+    if file_path.endswith(".xlsx"):
+        workbook = load_workbook(file_path, read_only=True)
+        try:
+            return [
+                (sheet.title, max(sheet.max_row - 1, 0) if sheet.max_row else None)
+                for sheet in workbook.worksheets
+            ]
+        finally:
+            workbook.close()
+
+    with pd.ExcelFile(file_path) as workbook:
+        return [(name, None) for name in workbook.sheet_names]
+
+
+def plan_sheet_tasks(
+    files: Sequence[Tuple[str, str]],
+    sheets: Optional[List[str]],
+    first_sheet_only: bool = False,
+) -> List[Tuple[str, str, str, Optional[int]]]:
+    """
+    Armo la lista de tareas (ruta, nombre de archivo, hoja, filas estimadas).
+
+    Args:
+        files: Lista de (ruta en disco, nombre original)
+        sheets: Hojas a leer de cada archivo (None = todas)
+        first_sheet_only: Leer solo la primera hoja de cada archivo
+
+    Raises:
+        ValueError: si ninguna de las hojas pedidas existe
+    """
+    tasks = []
+    for file_path, file_name in files:
+        available = list_sheets(file_path)
+        if first_sheet_only:
+            available = available[:1]
+        for sheet_name, estimated_rows in available:
+            if sheets is None or sheet_name in sheets:
+                tasks.append((file_path, file_name, sheet_name, estimated_rows))
+
+    if not tasks:
+        raise ValueError(f"No se encontraron las hojas solicitadas: {', '.join(sheets or [])}")
+    return tasks
+
+
+def _send_batch(queue, cancel, task_index: int, batch: Optional[List[Dict]]):
+    """
+    Envío un lote (o None, fin de la hoja) al proceso principal.
+
+    Si la cola está llena espero, comprobando cada poco si la carga se canceló.
+    """
+    while not cancel.is_set():
+        try:
+            queue.put((task_index, batch), timeout=QUEUE_POLL_SECONDS)
+            return
+        except Full:
+            continue
+    raise RuntimeError("Carga cancelada")
+
+
+def parse_sheet(
+    task_index: int,
+    file_path: str,
+    file_name: str,
+    sheet_name: str,
+    batch_size: int,
+    queue,
+    cancel,
+    job_id: Optional[str] = None,
+) -> List[str]:
+    """
+    Leo una hoja dentro de un proceso del pool y envío sus lotes por la cola.
+
+    Cada lote se envía en cuanto está listo; con la cola llena el proceso
+    espera, así ni este proceso ni el principal acumulan la hoja completa.
+    Al terminar (o fallar) envío None para indicar el fin de la hoja.
+
+    Returns:
+        Columnas del encabezado de la hoja
+    """
+    try:
+        if file_path.endswith(".xlsx"):
+            with ExcelStreamReader(file_path, sheet_name) as reader:
+                for batch in reader.iter_batches(file_name, batch_size, job_id):
+                    _send_batch(queue, cancel, task_index, batch)
+                return reader.columns
+
+        # Los .xls solo se pueden leer completos con pandas, pero se envían por lotes
+        df = pd.read_excel(file_path, sheet_name=sheet_name)
+        uploaded_at = datetime.utcnow()
+        for start in range(0, len(df), batch_size):
+            batch = dataframe_to_rows(df.iloc[start:start + batch_size], file_name, uploaded_at, sheet_name, job_id)
+            _send_batch(queue, cancel, task_index, batch)
+        return [str(column) for column in df.columns]
+    finally:
+        if not cancel.is_set():
+            _send_batch(queue, cancel, task_index, None)
+
+
+def ingest_workbooks(
+    db: Session,
+    files: Sequence[Tuple[str, str]],
+    sheets: Optional[List[str]] = None,
+    batch_size: Optional[int] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    first_sheet_only: bool = False,
+    job_id: Optional[str] = None,
+) -> Tuple[int, List[Dict]]:
+    """
+    Leo en paralelo las hojas de uno o varios archivos y las inserto en excel_data.
+
+    Cada hoja se lee en un proceso del pool, con como máximo
+    EXCEL_PARSE_PROCESSES hojas en curso por carga. Los lotes llegan por una
+    cola acotada (EXCEL_PARSE_QUEUE_BATCHES) y se escriben desde este hilo a
+    medida que llegan, así la memoria no depende del tamaño de las hojas.
+
+    Args:
+        db: Sesión de base de datos
+        files: Lista de (ruta en disco, nombre original)
+        sheets: Hojas a leer de cada archivo (None = todas)
+        batch_size: Filas por lote
+        on_progress: Función llamada después de cada lote
+        first_sheet_only: Leer solo la primera hoja de cada archivo
+        job_id: Trabajo de carga al que pertenecen las filas
+
+    Returns:
+        Tupla (filas insertadas, resumen por hoja)
+    """
+    batch_size = resolve_batch_size(batch_size)
+    tasks = plan_sheet_tasks(files, sheets, first_sheet_only)
+
+    estimates = [estimated for _, _, _, estimated in tasks]
+    total_rows = sum(estimates) if all(estimate is not None for estimate in estimates) else None
+
+    pool, manager = get_parse_pool(), get_parse_manager()
+    queue = manager.Queue(maxsize=EXCEL_PARSE_QUEUE_BATCHES)
+    cancel = manager.Event()
+
+    running: Dict[int, Future] = {}
+    sheet_rows: Dict[int, int] = {}
+    next_task = 0
+    rows_inserted = 0
+    summary = []
+
+    def submit_next():
+        nonlocal next_task
+        file_path, file_name, sheet_name, _ = tasks[next_task]
+        running[next_task] = pool.submit(
+            parse_sheet, next_task, file_path, file_name, sheet_name, batch_size, queue, cancel, job_id
+        )
+        sheet_rows[next_task] = 0
+        next_task += 1
+
+    try:
+        while next_task < len(tasks) and len(running) < EXCEL_PARSE_PROCESSES:
+            submit_next()
+
+        while running:
+            try:
+                task_index, batch = queue.get(timeout=QUEUE_POLL_SECONDS)
+            except Empty:
+                # Un proceso que murió sin avisar no envía el fin de su hoja
+                for future in running.values():
+                    if future.done() and future.exception() is not None:
+                        raise future.exception()
+                continue
+
+            _, file_name, sheet_name, _ = tasks[task_index]
+            if batch is not None:
+                written = ingest_batches(db, [batch], total_rows, file_name=file_name)
+                sheet_rows[task_index] += written
+                rows_inserted += written
+                if on_progress:
+                    on_progress(rows_inserted, total_rows)
+                continue
+
+            # Fin de la hoja: si falló, result() lanza su error
+            columns = running.pop(task_index).result()
+            summary.append({
+                "file_name": file_name, "sheet_name": sheet_name, "rows": sheet_rows[task_index], "columns": columns
+            })
+            logger.info(f"Hoja '{sheet_name}' de '{file_name}' cargada: {sheet_rows[task_index]} filas")
+            if next_task < len(tasks):
+                submit_next()
+    except Exception:
+        # Si una hoja falla, detengo las que están en curso y no empiezo las demás
+        cancel.set()
+        for future in running.values():
+            future.cancel()
+        raise
+
+    return rows_inserted, summary
@@ -0,0 +1,159 @@
+"""
+Borrado de los datos cargados en excel_data.
+
+Los borrados grandes no se hacen con un único DELETE: se eliminan por lotes
+acotados (cada uno en su propia transacción) para no bloquear la tabla ni
+acumular una transacción enorme. Cuando se vacía la tabla completa en
+PostgreSQL uso TRUNCATE, que no recorre las filas.
+
+Cada borrado se limita a las filas con id <= `upto_id` (el último id que
+existía al pedirlo), así un archivo que se vuelve a subir mientras se
+borra el anterior no pierde sus filas nuevas.
+"""
+
+import os  # Para leer la configuración desde variables de entorno
+import logging  # Para registrar el resultado de cada borrado
+from typing import Optional  # Para anotaciones de tipos
+
+from sqlalchemy import delete, func, or_, select, text  # Para los borrados por lotes
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models.models import ExcelData, ExcelFileCount  # Datos y conteos por archivo
+from app.services.excel_counts import count_rows, increment_file_count
+from app.services.excel_ingest import ProgressCallback
+
+logger = logging.getLogger(__name__)
+
+# Filas que se eliminan en cada transacción
+PURGE_BATCH_SIZE = int(os.environ.get("EXCEL_PURGE_BATCH_SIZE", "5000"))
+
+
+def max_row_id(db: Session) -> int:
+    """Último id de excel_data (0 si la tabla está vacía)."""
+    return db.query(func.coalesce(func.max(ExcelData.id), 0)).scalar()
+
+
+def _file_filter(file_name: str):
+    """Los conteos guardan "" para las filas sin nombre de archivo."""
+    if file_name == "":
+        return or_(ExcelData.file_name == "", ExcelData.file_name.is_(None))
+    return ExcelData.file_name == file_name
+
+
+def _truncate(db: Session, upto_id: int) -> Optional[int]:
+    """
+    Vacío excel_data con TRUNCATE si no hay filas posteriores a upto_id.
+
+    Returns:
+        Filas eliminadas, o None si no se pudo usar TRUNCATE
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+
+    total = count_rows(db)
+    # Con la tabla bloqueada compruebo que nadie insertó filas después de pedir el borrado
+    db.execute(text("LOCK TABLE excel_data IN ACCESS EXCLUSIVE MODE"))
+    if max_row_id(db) > upto_id:
+        db.rollback()
+        return None
+
+    db.execute(text("TRUNCATE TABLE excel_data, excel_file_counts"))
+    db.commit()
+    return total
+
+
+def _purge_file(
+    db: Session,
+    file_name: str,
+    upto_id: int,
+    batch_size: int,
+    on_batch,
+    job_id: Optional[str] = None,
+) -> int:
+    """Elimino por lotes las filas de un archivo, actualizando su conteo en cada lote."""
+    deleted = 0
+    while True:
+        ids = select(ExcelData.id).where(_file_filter(file_name), ExcelData.id <= upto_id)
+        if job_id is not None:
+            ids = ids.where(ExcelData.job_id == job_id)
+        ids = ids.limit(batch_size)
+        result = db.execute(delete(ExcelData).where(ExcelData.id.in_(ids)).execution_options(synchronize_session=False))
+        increment_file_count(db, file_name, -result.rowcount)
+        db.commit()
+
+        if result.rowcount == 0:
+            return deleted
+        deleted += result.rowcount
+        on_batch(result.rowcount)
+
+
+def purge_rows(
+    db: Session,
+    file_name: Optional[str] = None,
+    upto_id: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    job_id: Optional[str] = None,
+) -> int:
+    """
+    Elimino las filas de un archivo (o de todos) por lotes.
+
+    Args:
+        db: Sesión de base de datos
+        file_name: Archivo cuyas filas se eliminan (None = todos)
+        upto_id: Eliminar solo filas con id menor o igual (por defecto, el último actual)
+        batch_size: Filas por transacción (por defecto EXCEL_PURGE_BATCH_SIZE)
+        on_progress: Función llamada después de cada lote
+        job_id: Eliminar solo las filas de ese trabajo de carga (para deshacer una carga que falló)
+
+    Returns:
+        Número de filas eliminadas
+    """
+    batch_size = batch_size or PURGE_BATCH_SIZE
+    if upto_id is None:
+        upto_id = max_row_id(db)
+
+    total_rows = count_rows(db, file_name)
+    if on_progress:
+        on_progress(0, total_rows)
+
+    if file_name is None and job_id is None:
+        truncated = _truncate(db, upto_id)
+        if truncated is not None:
+            logger.info(f"excel_data vaciada con TRUNCATE: {truncated} filas")
+            return truncated
+
+    deleted = 0
+
+    def on_batch(rows: int):
+        nonlocal deleted
+        deleted += rows
+        if on_progress:
+            on_progress(deleted, total_rows)
+
+    if file_name is not None:
+        _purge_file(db, file_name, upto_id, batch_size, on_batch, job_id)
+    else:
+        # Borro archivo por archivo para que los conteos sigan siendo exactos durante el borrado
+        file_names = [name for (name,) in db.query(ExcelFileCount.file_name)]
+        for name in file_names:
+            _purge_file(db, name, upto_id, batch_size, on_batch, job_id)
+
+        # Filas que no figuraban en los conteos (por ejemplo, cargadas por otra vía)
+        while True:
+            ids = select(ExcelData.id).where(ExcelData.id <= upto_id)
+            if job_id is not None:
+                ids = ids.where(ExcelData.job_id == job_id)
+            ids = ids.limit(batch_size)
+            result = db.execute(delete(ExcelData).where(ExcelData.id.in_(ids)).execution_options(synchronize_session=False))
+            db.commit()
+            if result.rowcount == 0:
+                break
+            on_batch(result.rowcount)
+
+    # Los conteos de archivos sin filas ya no hacen falta
+    db.query(ExcelFileCount).filter(ExcelFileCount.row_count <= 0).delete()
+    db.commit()
+
+    logger.info(f"Borrado de excel_data completado: {deleted} filas ({file_name or 'todos los archivos'})")
+    return deleted
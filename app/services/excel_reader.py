@@ -0,0 +1,160 @@
+"""
+Lectura en streaming de archivos Excel grandes.
+
+Este módulo guarda el archivo subido en disco por bloques y recorre las
+filas con el modo de solo lectura de openpyxl, entregándolas en lotes de
+tamaño fijo. Así la memoria máxima no depende del tamaño del archivo.
+"""
+
+import os  # Para leer la configuración desde variables de entorno
+import hashlib  # Para calcular el hash del contenido mientras se copia
+from datetime import datetime  # Para el sello de tiempo de la carga
+from typing import Dict, Iterator, List, Optional, Tuple  # Para anotaciones de tipos
+
+from fastapi import UploadFile  # Archivo subido por el cliente
+from fastapi.concurrency import run_in_threadpool  # Para no bloquear el event loop al escribir en disco
+from openpyxl import load_workbook  # Motor de lectura Excel
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.services.excel_ingest import (
+    EXCEL_DATA_COLUMNS,
+    INSERT_COLUMNS,
+    ProgressCallback,
+    cell_to_str,
+    ingest_batches,
+    resolve_batch_size,
+)
+
+# Tamaño de cada bloque al copiar la subida a disco (1 MB)
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# A partir de este tamaño (en MB) uso el modo streaming automáticamente
+STREAMING_THRESHOLD_MB = int(os.environ.get("EXCEL_STREAMING_THRESHOLD_MB", "20"))
+
+
+async def spool_upload(file: UploadFile, destination: str) -> Tuple[int, str]:
+    """
+    Guardo el archivo subido en disco copiándolo por bloques,
+    sin cargar nunca el contenido completo en memoria.
+
+    El hash SHA-256 se calcula sobre los mismos bloques, así no hace
+    falta volver a leer el archivo para saber si ya se había cargado.
+
+    Returns:
+        Tupla (bytes escritos, hash SHA-256 en hexadecimal)
+    """
+    def copy():
+        digest = hashlib.sha256()
+        file.file.seek(0)
+        with open(destination, "wb") as out:
+            for chunk in iter(lambda: file.file.read(SPOOL_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                out.write(chunk)
+            return out.tell(), digest.hexdigest()
+
+    return await run_in_threadpool(copy)
+
+
+def should_stream(file_path: str, streaming: Optional[bool] = None) -> bool:
+    """
+    Decido si uso el modo streaming.
+
+    Si el cliente no lo indica, lo activo según el tamaño del archivo.
+    Los .xls no se pueden leer con openpyxl, así que siempre van por pandas.
+    """
+    if not file_path.endswith(".xlsx"):
+        return False
+    if streaming is not None:
+        return streaming
+    return os.path.getsize(file_path) >= STREAMING_THRESHOLD_MB * 1024 * 1024
+
+
+
+class ExcelStreamReader:
+    """
+    Lector de una hoja de un .xlsx (por defecto la primera) en modo solo lectura.
+
+    Uso:
+        with ExcelStreamReader(path) as reader:
+            reader.columns      # encabezados de la primera fila
+            reader.total_rows   # filas de datos (None si la hoja no lo indica)
+            for batch in reader.iter_batches(file_name, 5000): ...
+    """
+
+    def __init__(self, file_path: str, sheet_name: Optional[str] = None):
+        self.file_path = file_path
+        self.workbook = load_workbook(file_path, read_only=True, data_only=True)
+        self.sheet = self.workbook[sheet_name] if sheet_name else self.workbook.worksheets[0]
+        self.sheet_name = self.sheet.title
+        self._rows = self.sheet.iter_rows(values_only=True)
+
+        # La primera fila son los encabezados, igual que en pd.read_excel
+        header = next(self._rows, None) or ()
+        self.columns: List[str] = [str(value) for value in header if value is not None]
+
+        # max_row viene de la dimensión guardada en el archivo y puede faltar
+        max_row = self.sheet.max_row
+        self.total_rows: Optional[int] = max(max_row - 1, 0) if max_row else None
+
+    def iter_batches(
+        self,
+        file_name: str,
+        batch_size: Optional[int] = None,
+        job_id: Optional[str] = None,
+    ) -> Iterator[List[Dict]]:
+        """Entrego las filas en lotes de tamaño fijo listos para insertar."""
+        batch_size = resolve_batch_size(batch_size)
+        uploaded_at = datetime.utcnow()
+        batch: List[Dict] = []
+
+        for values in self._rows:
+            cells = [cell_to_str(value) for value in values[:EXCEL_DATA_COLUMNS]]
+
+            # Salto las filas completamente vacías (habituales al final de la hoja), igual que dataframe_to_rows
+            if all(cell is None for cell in cells):
+                continue
+
+            cells += [None] * (EXCEL_DATA_COLUMNS - len(cells))
+            batch.append(dict(zip(INSERT_COLUMNS, cells + [file_name, self.sheet_name, uploaded_at, job_id])))
+
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def close(self):
+        """Libero el archivo abierto por openpyxl."""
+        self.workbook.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def ingest_excel_stream(
+    db: Session,
+    file_path: str,
+    file_name: str,
+    batch_size: Optional[int] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    job_id: Optional[str] = None,
+) -> Tuple[int, List[str]]:
+    """
+    Inserto un .xlsx en excel_data leyendo y escribiendo por lotes fijos.
+
+    Returns:
+        Tupla (filas insertadas, columnas del encabezado)
+    """
+    with ExcelStreamReader(file_path) as reader:
+        rows_inserted = ingest_batches(
+            db,
+            reader.iter_batches(file_name, batch_size, job_id),
+            reader.total_rows,
+            on_progress,
+            file_name=file_name,
+        )
+        return rows_inserted, reader.columns
@@ -0,0 +1,117 @@
+"""
+Escritura masiva de hábitos.
+
+Las plantillas de bienvenida crean decenas de hábitos a la vez y las
+limpiezas desactivan miles. Estas funciones validan el dueño una sola vez,
+escriben todo en una transacción y devuelven las filas resultantes sin
+volver a consultarlas una por una. Ninguna hace commit: lo hace la ruta.
+"""
+
+from typing import Dict, List, Tuple  # Para anotaciones de tipos
+
+from sqlalchemy import insert, update  # Para las escrituras por lotes
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models import models  # Modelos (tablas)
+from app.schemas import schemas  # Esquemas de validación
+from app.services import schedule  # Próxima fecha de cada hábito
+from app.services.sync import next_change_seq  # Número de cambio para /sync
+
+# Máximos por petición
+MAX_BULK_HABITS = 1000
+MAX_BULK_DEACTIVATE = 10000
+
+# Ids por sentencia al desactivar, para no superar el límite de parámetros del motor
+DEACTIVATE_CHUNK_SIZE = 1000
+
+
+def bulk_create_habits(db: Session, user_id: int, items: List[schemas.HabitCreate]) -> List[models.Habit]:
+    """Creo varios hábitos de un usuario con un solo INSERT ... RETURNING."""
+    # El INSERT masivo no pasa por el flush del ORM, así que numero el cambio aquí
+    change_seq = next_change_seq(db, user_id)
+    rows = [
+        dict(item.model_dump(), user_id=user_id, change_seq=change_seq, next_due_date=schedule.initial_due_date(item.frequency))
+        for item in items
+    ]
+
+    if db.get_bind().dialect.insert_executemany_returning:
+        # Un solo INSERT de varias filas; RETURNING devuelve los hábitos en el orden de la petición
+        return list(db.scalars(insert(models.Habit).returning(models.Habit, sort_by_parameter_order=True), rows))
+
+    habits = [models.Habit(**row) for row in rows]
+    db.add_all(habits)
+    db.flush()
+    return habits
+
+
+def bulk_update_habits(
+    db: Session,
+    user_id: int,
+    items: List[schemas.HabitBulkUpdateItem],
+) -> Tuple[List[models.Habit], List[int]]:
+    """
+    Actualizo varios hábitos de un usuario cargándolos con una sola consulta.
+
+    Solo cambian los campos enviados. Si algún id no existe o es de otro
+    usuario no se modifica nada.
+
+    Returns:
+        Tupla (hábitos actualizados en el orden de la petición, ids no encontrados)
+    """
+    ids = list(dict.fromkeys(item.id for item in items))
+    habits: Dict[int, models.Habit] = {
+        habit.id: habit
+        for habit in db.query(models.Habit).filter(models.Habit.id.in_(ids), models.Habit.user_id == user_id)
+    }
+    missing = [habit_id for habit_id in ids if habit_id not in habits]
+    if missing:
+        return [], missing
+
+    rescheduled = set()
+    for item in items:
+        habit = habits[item.id]
+        for key, value in item.model_dump(exclude={"id"}, exclude_unset=True).items():
+            setattr(habit, key, value)
+            if key == "frequency":
+                rescheduled.add(habit.id)
+    # El flush agrupa los UPDATE y numera los cambios (listener de sync)
+    db.flush()
+    # Si cambió la frecuencia, cambia la próxima fecha
+    schedule.refresh_due_dates(db, rescheduled)
+    return [habits[habit_id] for habit_id in ids], []
+
+
+def bulk_deactivate_habits(db: Session, user_id: int, habit_ids: List[int]) -> Tuple[int, List[int], List[int]]:
+    """
+    Desactivo (soft delete) varios hábitos de un usuario con UPDATE por bloques.
+
+    Returns:
+        Tupla (hábitos que estaban activos y se desactivaron, ids del usuario,
+        ids que no existen o son de otro usuario)
+    """
+    ids = list(dict.fromkeys(habit_ids))
+    owned = set()
+    for start in range(0, len(ids), DEACTIVATE_CHUNK_SIZE):
+        chunk = ids[start:start + DEACTIVATE_CHUNK_SIZE]
+        owned.update(
+            habit_id for (habit_id,) in db.query(models.Habit.id).filter(
+                models.Habit.id.in_(chunk), models.Habit.user_id == user_id
+            )
+        )
+    targets = [habit_id for habit_id in ids if habit_id in owned]
+    missing = [habit_id for habit_id in ids if habit_id not in owned]
+
+    deactivated = 0
+    if targets:
+        change_seq = next_change_seq(db, user_id)
+        for start in range(0, len(targets), DEACTIVATE_CHUNK_SIZE):
+            # Solo los que siguen activos: desactivar dos veces no genera un cambio nuevo
+            result = db.execute(
+                update(models.Habit)
+                .where(models.Habit.id.in_(targets[start:start + DEACTIVATE_CHUNK_SIZE]), models.Habit.is_active == True)
+                .values(is_active=False, change_seq=change_seq)
+                .execution_options(synchronize_session=False)
+            )
+            deactivated += result.rowcount
+
+    return deactivated, targets, missing
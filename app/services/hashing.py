@@ -0,0 +1,236 @@
+"""
+Hash y verificación de contraseñas (bcrypt) en un pool de procesos propio.
+
+bcrypt tarda cientos de milisegundos de CPU a propósito. Hacerlo en el
+event loop congela todas las peticiones del worker, y hacerlo en el
+threadpool compartido de Starlette le quita hilos al resto de rutas. Aquí
+cada hash corre en un proceso aparte, con paralelismo real, y la cola es
+acotada: si hay demasiados pendientes se rechaza la petición (503) en vez
+de acumular esperas.
+
+Las altas masivas (hash_many) reparten las contraseñas en lotes, con un
+lote en curso por proceso como máximo, así los logins que llegan mientras
+tanto se intercalan entre lotes en vez de esperar al final.
+
+Configuración:
+- PASSWORD_HASH_PROCESSES: procesos del pool (por defecto, uno por núcleo)
+- PASSWORD_HASH_QUEUE_SIZE: hashes en espera además de los que se ejecutan
+- PASSWORD_HASH_BATCH_SIZE: contraseñas por lote en las altas masivas
+"""
+
+import os  # Para leer la configuración desde variables de entorno
+import asyncio  # Para esperar el resultado sin bloquear el event loop
+import logging  # Para registrar el arranque y los rechazos
+import threading  # Para crear el pool una sola vez y contar pendientes
+import multiprocessing  # Para elegir cómo se arrancan los procesos del pool
+from concurrent.futures import Future, ProcessPoolExecutor  # Pool de procesos
+from typing import Callable, Dict, List, Optional  # Para anotaciones de tipos
+
+from passlib.context import CryptContext  # Hash de contraseñas
+
+logger = logging.getLogger(__name__)
+
+# Procesos del pool y hashes que pueden esperar turno
+PASSWORD_HASH_PROCESSES = int(os.environ.get("PASSWORD_HASH_PROCESSES") or os.cpu_count() or 1)
+PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get("PASSWORD_HASH_QUEUE_SIZE") or "32")
+PASSWORD_HASH_BATCH_SIZE = int(os.environ.get("PASSWORD_HASH_BATCH_SIZE") or "8")
+
+# bcrypt solo usa los primeros 72 bytes
+MAX_PASSWORD_LENGTH = 72
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class HashingQueueFull(Exception):
+    """Hay demasiados hashes pendientes y no se aceptan más por ahora."""
+
+
+def truncate_password(password: str) -> str:
+    """Recorto a 72 bytes, igual al hashear que al verificar."""
+    password_bytes = password.encode("utf-8")
+    if len(password_bytes) > MAX_PASSWORD_LENGTH:
+        return password_bytes[:MAX_PASSWORD_LENGTH].decode("utf-8", errors="ignore")
+    return password
+
+
+# Estas funciones corren dentro de los procesos del pool
+def _hash(password: str) -> str:
+    return pwd_context.hash(truncate_password(password))
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(truncate_password(password), hashed_password)
+
+
+def _hash_batch(passwords: List[str]) -> List[str]:
+    return [_hash(password) for password in passwords]
+
+
+def _warm_up() -> None:
+    return None
+
+
+class PasswordHasher:
+    """
+    Pool de procesos con una cola acotada y contadores para /health.
+
+    La cuenta de pendientes incluye los hashes en ejecución y los que
+    esperan; al llegar a procesos + cola se lanza HashingQueueFull.
+    """
+
+    def __init__(self, processes: int = PASSWORD_HASH_PROCESSES, queue_size: int = PASSWORD_HASH_QUEUE_SIZE):
+        self.processes = max(processes, 1)
+        self.queue_size = max(queue_size, 0)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._bulk_lock = asyncio.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.bulk_pending = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.processes + self.queue_size
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """
+        Devuelvo el pool, creándolo la primera vez.
+
+        Uso "spawn" porque el servidor ya tiene hilos en marcha y hacer fork
+        de un proceso con hilos puede dejar locks tomados en el hijo.
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def start(self):
+        """Arranco los procesos por adelantado para que el primer login no pague el arranque."""
+        pool = self._get_pool()
+        for _ in range(self.processes):
+            pool.submit(_warm_up)
+        logger.info(f"Pool de hash de contraseñas listo ({self.processes} procesos, cola {self.queue_size})")
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _reserve(self, count: int):
+        with self._lock:
+            if self.pending + count > self.capacity:
+                self.rejected += count
+                logger.warning(f"Cola de hash llena ({self.pending} pendientes), se rechazan {count}")
+                raise HashingQueueFull()
+            self.pending += count
+
+    def _release(self, _future: Future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        future = self._get_pool().submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    async def _run(self, fn: Callable, *args):
+        self._reserve(1)
+        try:
+            future = self._submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        return await asyncio.wrap_future(future)
+
+    async def hash(self, password: str) -> str:
+        """
+        Hasheo una contraseña sin bloquear el event loop.
+
+        Raises:
+            HashingQueueFull: si ya hay demasiados hashes pendientes
+        """
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """
+        Verifico una contraseña sin bloquear el event loop.
+
+        Raises:
+            HashingQueueFull: si ya hay demasiados hashes pendientes
+        """
+        return await self._run(_verify, password, hashed_password)
+
+    async def hash_many(self, passwords: List[str], batch_size: int = PASSWORD_HASH_BATCH_SIZE) -> List[str]:
+        """
+        Hasheo muchas contraseñas en paralelo, en el mismo orden recibido.
+
+        Las altas masivas se atienden de una en una y no cuentan para la
+        cola de los hashes individuales: nunca provocan un 503 en el login.
+        """
+        hashes: List[Optional[str]] = [None] * len(passwords)
+        batch_size = max(batch_size, 1)
+        async with self._bulk_lock:
+            with self._lock:
+                self.bulk_pending += len(passwords)
+            in_flight: Dict[asyncio.Future, int] = {}
+            try:
+                for start in range(0, len(passwords), batch_size):
+                    # Un lote en curso por proceso como máximo
+                    if len(in_flight) >= self.processes:
+                        await self._collect(in_flight, hashes, asyncio.FIRST_COMPLETED)
+                    future = self._get_pool().submit(_hash_batch, passwords[start:start + batch_size])
+                    in_flight[asyncio.wrap_future(future)] = start
+                while in_flight:
+                    await self._collect(in_flight, hashes, asyncio.ALL_COMPLETED)
+            finally:
+                for future in in_flight:
+                    future.cancel()
+                with self._lock:
+                    self.bulk_pending = 0
+        return hashes
+
+    async def _collect(self, in_flight: Dict[asyncio.Future, int], hashes: List[Optional[str]], return_when: str):
+        done, _ = await asyncio.wait(list(in_flight), return_when=return_when)
+        for future in done:
+            start = in_flight.pop(future)
+            batch = future.result()
+            hashes[start:start + len(batch)] = batch
+            with self._lock:
+                self.completed += len(batch)
+                self.bulk_pending -= len(batch)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "queue_size": self.queue_size,
+                "pending": self.pending,
+                "bulk_pending": self.bulk_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+
+# Pool compartido por todas las rutas del proceso
+password_hasher = PasswordHasher()
+
+
+async def hash_password(password: str) -> str:
+    """Atajo para las rutas: hash en el pool de procesos."""
+    return await password_hasher.hash(password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    """Atajo para las rutas: verificación en el pool de procesos."""
+    return await password_hasher.verify(password, hashed_password)
+
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    """Atajo para las altas masivas: hashes repartidos en lotes entre los procesos."""
+    return await password_hasher.hash_many(passwords)
@@ -0,0 +1,235 @@
+"""
+Canal pub/sub para el progreso de las cargas.
+
+El código de ingesta publica el estado de cada trabajo y los WebSockets
+(y el long-polling de /excel/progress) se suscriben por trabajo; solo se
+envía algo cuando el estado cambia, sin bucles que consulten cada segundo.
+
+Hay dos implementaciones, elegidas con la variable PROGRESS_BROKER:
+- "memory" (por defecto): todo en el proceso, suficiente con un solo worker.
+- "postgres": usa LISTEN/NOTIFY de la misma base de datos para repartir los
+  mensajes entre varios workers de uvicorn sin infraestructura adicional.
+"""
+
+import os  # Para leer la configuración desde variables de entorno
+import json  # Para serializar los mensajes de NOTIFY
+import select  # Para esperar notificaciones de PostgreSQL sin consumir CPU
+import asyncio  # Para despertar a los suscriptores en su event loop
+import logging  # Para registrar errores del canal
+import threading  # Para proteger el estado compartido entre hilos
+from collections import OrderedDict  # Para acotar los estados guardados
+from typing import AsyncIterator, Dict, Optional, Set  # Para anotaciones de tipos
+
+logger = logging.getLogger(__name__)
+
+# Tipo de broker y número máximo de trabajos cuyo último estado se recuerda
+PROGRESS_BROKER = os.environ.get("PROGRESS_BROKER", "memory")
+PROGRESS_HISTORY = int(os.environ.get("EXCEL_JOB_HISTORY", "200"))
+
+# Canal de PostgreSQL y tamaño máximo de un payload de NOTIFY
+PG_CHANNEL = "excel_progress"
+PG_MAX_PAYLOAD = 7900
+
+
+class Subscription:
+    """
+    Suscripción de un cliente a uno o a todos los trabajos.
+
+    Si el cliente es más lento que el productor, solo conserva el último
+    estado de cada trabajo: la barra de progreso no necesita los intermedios.
+    """
+
+    def __init__(self, broker: "ProgressBroker", job_id: Optional[str]):
+        self.broker = broker
+        self.job_id = job_id
+        self.loop = asyncio.get_running_loop()
+        self._pending: Dict[str, Dict] = {}
+        self._event = asyncio.Event()
+
+    def _push(self, payload: Dict):
+        """Se ejecuta en el event loop del suscriptor."""
+        self._pending[payload["job_id"]] = payload
+        self._event.set()
+
+    def deliver(self, payload: Dict):
+        """Entrego un mensaje desde cualquier hilo."""
+        self.loop.call_soon_threadsafe(self._push, payload)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Espero el próximo cambio (None si se agota el tiempo)."""
+        if not self._pending:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        self._event.clear()
+        job_id = next(iter(self._pending))
+        return self._pending.pop(job_id)
+
+    def __aiter__(self) -> AsyncIterator[Dict]:
+        return self
+
+    async def __anext__(self) -> Dict:
+        return await self.get()
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ProgressBroker:
+    """Broker en memoria: publica y reparte los mensajes dentro del proceso."""
+
+    def __init__(self, max_history: int = PROGRESS_HISTORY):
+        self.max_history = max_history
+        self._latest: "OrderedDict[str, Dict]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._subscribers: Dict[Optional[str], Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, job_id: str, payload: Dict):
+        """Publico el nuevo estado de un trabajo (se puede llamar desde cualquier hilo)."""
+        with self._lock:
+            version = self._versions.get(job_id, 0) + 1
+            self._versions[job_id] = version
+        self._dispatch({**payload, "job_id": job_id, "version": version})
+
+    def _dispatch(self, payload: Dict):
+        """Guardo el último estado y lo entrego a los suscriptores interesados."""
+        job_id = payload["job_id"]
+        with self._lock:
+            self._latest[job_id] = payload
+            self._latest.move_to_end(job_id)
+            while len(self._latest) > self.max_history:
+                old_job_id, _ = self._latest.popitem(last=False)
+                self._versions.pop(old_job_id, None)
+
+            subscribers = list(self._subscribers.get(job_id, ())) + list(self._subscribers.get(None, ()))
+
+        for subscription in subscribers:
+            subscription.deliver(payload)
+
+    def subscribe(self, job_id: Optional[str] = None) -> Subscription:
+        """Me suscribo a un trabajo (o a todos si job_id es None). Debe llamarse desde el event loop."""
+        subscription = Subscription(self, job_id)
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.job_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.job_id]
+
+    def latest(self, job_id: Optional[str] = None) -> Optional[Dict]:
+        """Último estado publicado de un trabajo (o del trabajo más reciente)."""
+        with self._lock:
+            if job_id is not None:
+                return self._latest.get(job_id)
+            if not self._latest:
+                return None
+            return next(reversed(self._latest.values()))
+
+    def version(self, job_id: str) -> int:
+        """Última versión publicada de un trabajo (0 si aún no hay ninguna)."""
+        with self._lock:
+            return self._versions.get(job_id, 0)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class PostgresProgressBroker(ProgressBroker):
+    """
+    Broker para varios workers: publica con NOTIFY y cada proceso escucha
+    el canal con LISTEN en un hilo propio, repartiendo los mensajes a sus
+    suscriptores locales.
+    """
+
+    def __init__(self, dsn: str, max_history: int = PROGRESS_HISTORY):
+        super().__init__(max_history)
+        import psycopg2  # Solo se necesita con este broker
+
+        self._psycopg2 = psycopg2
+        self._dsn = dsn
+        self._publish_conn = None
+        self._publish_lock = threading.Lock()
+        self._listener = threading.Thread(target=self._listen, name="progress-listener", daemon=True)
+        self._listener.start()
+
+    def _connect(self):
+        conn = self._psycopg2.connect(self._dsn)
+        conn.autocommit = True
+        return conn
+
+    def publish(self, job_id: str, payload: Dict):
+        with self._lock:
+            version = self._versions.get(job_id, 0) + 1
+            self._versions[job_id] = version
+
+        message = {**payload, "job_id": job_id, "version": version}
+        data = json.dumps(message, default=str)
+        if len(data) > PG_MAX_PAYLOAD:
+            # NOTIFY admite como máximo 8000 bytes; las columnas no son imprescindibles
+            data = json.dumps({**message, "columns": []}, default=str)
+
+        try:
+            with self._publish_lock:
+                if self._publish_conn is None or self._publish_conn.closed:
+                    self._publish_conn = self._connect()
+                with self._publish_conn.cursor() as cursor:
+                    cursor.execute("SELECT pg_notify(%s, %s)", (PG_CHANNEL, data))
+        except Exception as e:
+            # Si PostgreSQL no está disponible, al menos entrego el mensaje localmente
+            logger.error(f"Error al publicar progreso en PostgreSQL: {str(e)}")
+            self._publish_conn = None
+            self._dispatch(message)
+
+    def _listen(self):
+        """Hilo que recibe las notificaciones del canal y las reparte."""
+        while True:
+            try:
+                conn = self._connect()
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {PG_CHANNEL}")
+
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        message = json.loads(notify.payload)
+                        # Mantengo la versión local al día con la de otros workers
+                        with self._lock:
+                            job_id = message["job_id"]
+                            self._versions[job_id] = max(self._versions.get(job_id, 0), message["version"])
+                        self._dispatch(message)
+
+            except Exception as e:
+                logger.error(f"Error escuchando el canal de progreso: {str(e)}")
+                threading.Event().wait(5)
+
+
+def create_broker() -> ProgressBroker:
+    """Creo el broker configurado en PROGRESS_BROKER."""
+    if PROGRESS_BROKER == "postgres":
+        from sqlalchemy.engine import make_url
+
+        # psycopg2 necesita la URL sin el sufijo del driver (postgresql+psycopg2://)
+        url = make_url(os.environ["DATABASE_URL"]).set(drivername="postgresql")
+        return PostgresProgressBroker(url.render_as_string(hide_password=False))
+    return ProgressBroker()
+
+
+# Instancia compartida por todo el proceso
+progress_broker = create_broker()
@@ -0,0 +1,175 @@
+"""
+Escritura masiva de registros de hábitos.
+
+Los clientes que sincronizan check-ins hechos sin conexión envían muchos
+registros a la vez. En lugar de tres consultas por registro, valido los
+hábitos y busco los registros existentes con una consulta cada uno, y
+escribo todo con un único INSERT ... ON CONFLICT (habit_id, date) DO UPDATE
+dentro de una sola transacción.
+"""
+
+from datetime import datetime  # Para el sello de creación
+from typing import Dict, List, Optional, Tuple  # Para anotaciones de tipos
+
+from sqlalchemy import func  # Para conservar las notas si no se envían
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models import models  # Modelos (tablas)
+from app.schemas import schemas  # Esquemas de validación
+from app.services.calendar_bitmaps import apply_day_changes  # Calendario de bits por año
+from app.services.rollups import apply_record_deltas  # Totales de cumplimiento por periodo
+from app.services.schedule import refresh_due_dates  # Próxima fecha de los hábitos
+from app.services.streaks import apply_bulk_changes, lock_habits  # Rachas (y candado) de los hábitos afectados
+from app.services.sync import next_change_seq  # Número de cambio para /sync
+from app.services.upsert import dialect_insert  # INSERT ... ON CONFLICT del motor
+
+# Máximo de registros aceptados en una sola petición
+MAX_BULK_RECORDS = 1000
+
+# Estados posibles de cada elemento
+RECORD_CREATED = "created"
+RECORD_UPDATED = "updated"
+RECORD_SUPERSEDED = "superseded"
+RECORD_ERROR = "error"
+
+
+def _upsert(db: Session, rows: List[Dict], owners: Dict[int, int]) -> List[models.Record]:
+    """
+    Inserto o actualizo las filas y devuelvo los registros resultantes.
+
+    `owners` indica el usuario dueño de cada hábito, para numerar el cambio.
+    """
+    insert = dialect_insert(db)
+    if insert is not None:
+        # El upsert no pasa por el flush del ORM, así que numero el cambio de cada usuario aquí
+        # (en orden de usuario, igual que el listener de sync)
+        change_seqs = {
+            user_id: next_change_seq(db, user_id)
+            for user_id in sorted({owners[row["habit_id"]] for row in rows})
+        }
+        stmt = insert(models.Record).values([
+            dict(row, change_seq=change_seqs[owners[row["habit_id"]]]) for row in rows
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.Record.habit_id, models.Record.date],
+            set_={
+                "completed": stmt.excluded.completed,
+                # Igual que en PUT /records/{id}: las notas solo cambian si se envían
+                "notes": func.coalesce(stmt.excluded.notes, models.Record.notes),
+                "change_seq": stmt.excluded.change_seq,
+            },
+        )
+        return list(db.scalars(stmt.returning(models.Record), execution_options={"populate_existing": True}))
+
+    # Motores sin ON CONFLICT: actualizo o inserto uno por uno en la misma transacción
+    records = []
+    for row in rows:
+        record = db.query(models.Record).filter(
+            models.Record.habit_id == row["habit_id"],
+            models.Record.date == row["date"],
+        ).first()
+        if record is None:
+            record = models.Record(**row)
+            db.add(record)
+        else:
+            record.completed = row["completed"]
+            if row["notes"] is not None:
+                record.notes = row["notes"]
+        records.append(record)
+    db.flush()
+    return records
+
+
+def bulk_upsert_records(db: Session, items: List[schemas.RecordCreate], user_id: Optional[int] = None) -> List[Dict]:
+    """
+    Creo o actualizo muchos registros en una sola transacción.
+
+    Si la petición trae varios registros para el mismo hábito y fecha,
+    se aplica el último y los anteriores se marcan como "superseded".
+    Con `user_id`, los hábitos de otros usuarios se tratan como no encontrados.
+
+    Returns:
+        Un resultado por elemento, en el mismo orden que la petición
+    """
+    results: List[Dict] = [
+        {"index": index, "habit_id": item.habit_id, "date": item.date, "status": None, "record": None, "error": None}
+        for index, item in enumerate(items)
+    ]
+
+    # Verifico todos los hábitos con una sola consulta
+    habit_ids = {item.habit_id for item in items}
+    habits_query = db.query(models.Habit).filter(models.Habit.id.in_(habit_ids))
+    if user_id is not None:
+        habits_query = habits_query.filter(models.Habit.user_id == user_id)
+    existing_habits = {habit.id: habit for habit in habits_query}
+
+    # Me quedo con el último elemento de cada (habit_id, date)
+    latest: Dict[Tuple[int, object], int] = {}
+    for index, item in enumerate(items):
+        if item.habit_id not in existing_habits:
+            results[index].update(status=RECORD_ERROR, error="Hábito no encontrado")
+            continue
+        key = (item.habit_id, item.date)
+        if key in latest:
+            results[latest[key]].update(status=RECORD_SUPERSEDED)
+        latest[key] = index
+
+    if not latest:
+        return results
+
+    # Bloqueo los hábitos antes de leer o escribir nada, en el mismo orden que
+    # POST y PUT /records (la racha primero, el contador de /sync al final)
+    lock_habits(db, [habit_id for habit_id, _ in latest])
+
+    # Busco los registros que ya existen para distinguir creados de actualizados
+    # (y saber si estaban completados, para las rachas)
+    keys = set(latest)
+    existing_keys = {
+        (habit_id, record_date): completed
+        for habit_id, record_date, completed in db.query(
+            models.Record.habit_id, models.Record.date, models.Record.completed
+        ).filter(
+            models.Record.habit_id.in_({habit_id for habit_id, _ in keys}),
+            models.Record.date.in_({record_date for _, record_date in keys}),
+        )
+        if (habit_id, record_date) in keys
+    }
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "habit_id": items[index].habit_id,
+            "date": items[index].date,
+            "completed": items[index].completed,
+            "notes": items[index].notes,
+            "created_at": now,
+        }
+        for index in latest.values()
+    ]
+
+    changes = []
+    deltas = []
+    owners = {habit.id: habit.user_id for habit in existing_habits.values()}
+    for record in _upsert(db, rows, owners):
+        key = (record.habit_id, record.date)
+        status = RECORD_UPDATED if key in existing_keys else RECORD_CREATED
+        results[latest[key]].update(status=status, record=record)
+
+        habit = existing_habits[record.habit_id]
+        was_completed = bool(existing_keys.get(key))
+        changes.append((habit, record.date, was_completed, record.completed))
+        deltas.append((habit, record.date, int(status == RECORD_CREATED), int(record.completed) - int(was_completed)))
+
+    apply_bulk_changes(db, changes)
+    apply_record_deltas(db, deltas)
+    apply_day_changes(db, [
+        (habit.id, record_date, is_completed)
+        for habit, record_date, was_completed, is_completed in changes
+        if was_completed != is_completed
+    ])
+    refresh_due_dates(db, [
+        habit.id
+        for habit, record_date, was_completed, is_completed in changes
+        if was_completed != is_completed
+    ])
+    return results
@@ -0,0 +1,189 @@
+"""
+Caché de respuestas GET con ETag débil y respuestas 304.
+
+Cada respuesta cacheable se guarda ya serializada en un LRU en memoria,
+junto con su ETag (calculado a partir del change_seq de las filas, o de su
+fecha de creación si no lo tienen) y unas etiquetas que dicen de qué datos
+depende ("habit:3", "habits:user:1", ...). Las rutas que escriben invalidan
+esas etiquetas después del commit, así que una respuesta cacheada nunca
+sobrevive a un cambio hecho por este proceso; el TTL acota lo que pueda
+cambiar por otra vía.
+
+Si el cliente envía If-None-Match con el ETag vigente, se responde 304 sin
+cuerpo y, si la respuesta estaba en caché, sin consultar la base de datos.
+"""
+
+import os  # Para leer la configuración desde variables de entorno
+import json  # Para serializar las respuestas una sola vez
+import time  # Para el TTL de las entradas
+import hashlib  # Para derivar los ETag
+import threading  # Las rutas síncronas corren en el threadpool
+from collections import OrderedDict  # Para el orden LRU
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple  # Para anotaciones de tipos
+
+from fastapi import Request, Response  # Para leer la petición y armar la respuesta
+from fastapi.encoders import jsonable_encoder  # Para serializar modelos de Pydantic
+
+# Respuestas guardadas como máximo y segundos que vive cada una
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "300"))
+
+# Contenido, versión de las filas (para el ETag) y encabezados extra de una respuesta
+Loaded = Tuple[Any, str, Dict[str, str]]
+
+
+class CachedResponse:
+    """Respuesta serializada con su ETag y las etiquetas de las que depende."""
+
+    def __init__(self, etag: str, body: bytes, headers: Dict[str, str], tags: List[str], expires_at: float):
+        self.etag = etag
+        self.body = body
+        self.headers = headers
+        self.tags = tags
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """
+    LRU de respuestas con invalidación por etiquetas.
+
+    Cada etiqueta tiene una generación que aumenta al invalidarla; una
+    respuesta calculada mientras su etiqueta cambiaba no se guarda, así una
+    lectura lenta no puede volver a meter datos viejos tras una escritura.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._keys_by_tag: Dict[str, set] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def snapshot(self, tags: Iterable[str]) -> Dict[str, int]:
+        """Generación actual de cada etiqueta, tomada antes de leer los datos."""
+        with self._lock:
+            return {tag: self._generations.get(tag, 0) for tag in tags}
+
+    def put(self, key: str, entry: CachedResponse, snapshot: Dict[str, int]):
+        with self._lock:
+            if any(self._generations.get(tag, 0) != generation for tag, generation in snapshot.items()):
+                return
+            self._remove(key)
+            self._entries[key] = entry
+            for tag in entry.tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, *tags: str):
+        """Descarto las respuestas que dependen de alguna de las etiquetas."""
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in list(self._keys_by_tag.pop(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+# Caché compartida por todas las rutas del proceso
+cache = ResponseCache()
+
+
+def invalidate(*tags: str):
+    """Atajo para las rutas que escriben: llamar después del commit."""
+    cache.invalidate(*tags)
+
+
+def row_version(rows: Iterable[Any]) -> str:
+    """Versión de un conjunto de filas: su id y su change_seq (o su fecha de creación)."""
+    parts = []
+    for row in rows:
+        stamp = getattr(row, "change_seq", None)
+        if stamp is None:
+            stamp = getattr(row, "created_at", "")
+        parts.append(f"{row.id}:{stamp}")
+    return ",".join(parts)
+
+
+def _request_key(request: Request, scope: Optional[str]) -> str:
+    query = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+    key = f"{request.url.path}?{query}"
+    return f"{scope}|{key}" if scope else key
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match (admite lista y *)."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag.removeprefix("W/") for candidate in candidates)
+
+
+def _response(entry: CachedResponse, not_modified: bool) -> Response:
+    # no-cache: el navegador guarda la respuesta pero siempre la revalida con el ETag
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache", **entry.headers}
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+def conditional_get(request: Request, tags: List[str], load: Callable[[], Loaded], scope: Optional[str] = None) -> Response:
+    """
+    Respondo un GET desde la caché o calculándolo, con ETag y 304.
+
+    Args:
+        request: Petición (su ruta y parámetros forman la clave)
+        tags: Etiquetas de los datos de los que depende la respuesta
+        load: Función que consulta la base de datos y devuelve
+              (contenido, versión de las filas, encabezados extra);
+              puede lanzar HTTPException, que no se cachea
+        scope: Separa la caché por usuario cuando `load` comprueba permisos
+               (así una respuesta cacheada nunca se entrega a otro usuario)
+    """
+    key = _request_key(request, scope)
+    if_none_match = request.headers.get("if-none-match")
+
+    entry = cache.get(key)
+    if entry is None:
+        snapshot = cache.snapshot(tags)
+        content, version, headers = load()
+        etag = 'W/"' + hashlib.sha1(f"{key}|{version}".encode("utf-8")).hexdigest()[:20] + '"'
+        body = json.dumps(jsonable_encoder(content), separators=(",", ":")).encode("utf-8")
+        entry = CachedResponse(etag, body, headers, tags, time.monotonic() + cache.ttl)
+        cache.put(key, entry, snapshot)
+
+    return _response(entry, _etag_matches(if_none_match, entry.etag))
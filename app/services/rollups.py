@@ -0,0 +1,275 @@
+"""
+Totales de cumplimiento precalculados por hábito y periodo.
+
+Cada escritura de registros suma sus cambios en completion_rollups (por día,
+semana, mes y todo el historial) dentro de la misma transacción, así las
+estadísticas se leen con unas pocas consultas indexadas en lugar de agregar
+todos los registros del usuario.
+
+Para rellenar los totales a partir de los registros existentes:
+
+    python -m app.services.rollups [--user-id ID]
+"""
+
+import argparse  # Para el comando de reconstrucción
+import logging  # Para registrar la reconstrucción
+from collections import defaultdict  # Para acumular los cambios por periodo
+from datetime import date, datetime, timedelta  # Para calcular los inicios de periodo
+from typing import Dict, Iterable, List, Optional, Tuple  # Para anotaciones de tipos
+
+from sqlalchemy import and_, func, or_  # Para filtrar y sumar los totales
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models import models  # Modelos (tablas)
+from app.services.upsert import dialect_insert  # INSERT ... ON CONFLICT del motor
+
+logger = logging.getLogger(__name__)
+
+# Periodos que se mantienen; "all" es el total histórico de cada hábito
+PERIODS = ("day", "week", "month", "all")
+
+# Inicio del periodo "all" (un único total por hábito)
+ALL_TIME_START = date(1970, 1, 1)
+
+# Filas por INSERT al reconstruir
+REBUILD_BATCH_SIZE = 500
+
+# Cambio de un registro: (hábito, fecha, delta de registros, delta de completados)
+RollupDelta = Tuple[models.Habit, date, int, int]
+
+
+def period_start(period: str, day: date) -> date:
+    """Primer día del periodo que contiene la fecha."""
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    if period == "all":
+        return ALL_TIME_START
+    return day
+
+
+def _accumulate(totals: Dict[tuple, List[int]], user_id: int, habit_id: int, day: date, total: int, completed: int):
+    for period in PERIODS:
+        entry = totals[(habit_id, period, period_start(period, day), user_id)]
+        entry[0] += total
+        entry[1] += completed
+
+
+def _write(db: Session, totals: Dict[tuple, List[int]]):
+    """Sumo los totales acumulados a sus filas, creándolas si no existen."""
+    now = datetime.utcnow()
+    rows = [
+        {
+            "habit_id": habit_id,
+            "period": period,
+            "period_start": start,
+            "user_id": user_id,
+            "total_records": total,
+            "completed_records": completed,
+            "updated_at": now,
+        }
+        for (habit_id, period, start, user_id), (total, completed) in totals.items()
+        if total or completed
+    ]
+    if not rows:
+        return
+
+    insert = dialect_insert(db)
+    if insert is not None:
+        stmt = insert(models.CompletionRollup).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                models.CompletionRollup.habit_id,
+                models.CompletionRollup.period,
+                models.CompletionRollup.period_start,
+            ],
+            set_={
+                "total_records": models.CompletionRollup.total_records + stmt.excluded.total_records,
+                "completed_records": models.CompletionRollup.completed_records + stmt.excluded.completed_records,
+                "updated_at": now,
+            },
+        )
+        db.execute(stmt)
+        return
+
+    for row in rows:
+        updated = db.query(models.CompletionRollup).filter(
+            models.CompletionRollup.habit_id == row["habit_id"],
+            models.CompletionRollup.period == row["period"],
+            models.CompletionRollup.period_start == row["period_start"],
+        ).update(
+            {
+                "total_records": models.CompletionRollup.total_records + row["total_records"],
+                "completed_records": models.CompletionRollup.completed_records + row["completed_records"],
+                "updated_at": now,
+            },
+            synchronize_session=False,
+        )
+        if not updated:
+            db.add(models.CompletionRollup(**row))
+    db.flush()
+
+
+def apply_record_deltas(db: Session, deltas: Iterable[RollupDelta]):
+    """
+    Sumo a los totales los cambios de uno o varios registros, sin hacer commit.
+
+    Se llama en la transacción que escribe los registros, de modo que los
+    totales y los registros se confirman (o se descartan) juntos.
+
+    Args:
+        deltas: Tuplas (hábito, fecha, registros nuevos, cambio en completados)
+    """
+    totals: Dict[tuple, List[int]] = defaultdict(lambda: [0, 0])
+    for habit, day, total, completed in deltas:
+        if total or completed:
+            _accumulate(totals, habit.user_id, habit.id, day, total, completed)
+    _write(db, totals)
+
+
+def rebuild_rollups(db: Session, user_id: Optional[int] = None) -> int:
+    """
+    Recalculo los totales desde la tabla records (de un usuario o de todos).
+
+    Returns:
+        Número de registros procesados
+    """
+    rollups = db.query(models.CompletionRollup)
+    records = db.query(models.Habit.user_id, models.Record.habit_id, models.Record.date, models.Record.completed).join(
+        models.Habit, models.Habit.id == models.Record.habit_id
+    )
+    if user_id is not None:
+        rollups = rollups.filter(models.CompletionRollup.user_id == user_id)
+        records = records.filter(models.Habit.user_id == user_id)
+    rollups.delete(synchronize_session=False)
+
+    totals: Dict[tuple, List[int]] = defaultdict(lambda: [0, 0])
+    processed = 0
+    for owner_id, habit_id, day, completed in records.yield_per(REBUILD_BATCH_SIZE):
+        _accumulate(totals, owner_id, habit_id, day, 1, int(bool(completed)))
+        processed += 1
+
+    # Inserto por bloques para no superar el límite de parámetros del motor
+    items = list(totals.items())
+    for start in range(0, len(items), REBUILD_BATCH_SIZE):
+        _write(db, dict(items[start:start + REBUILD_BATCH_SIZE]))
+    db.commit()
+
+    logger.info(f"Totales reconstruidos: {processed} registros, {len(items)} filas")
+    return processed
+
+
+def _rate(total: int, completed: int) -> float:
+    return round(completed * 100.0 / total, 2) if total else 0.0
+
+
+def user_summary(db: Session, user_id: int, today: Optional[date] = None) -> Dict:
+    """
+    Resumen de cumplimiento de un usuario: total histórico, semana y mes actuales, y por hábito.
+
+    Lee solo las filas "all" y las del periodo actual, con el índice por usuario.
+    Solo cuentan los hábitos activos, igual que en el dashboard (active_habits
+    y completed_today): un hábito desactivado deja de sumar en todos los totales.
+    """
+    today = today or date.today()
+    week_start = period_start("week", today)
+    month_start = period_start("month", today)
+
+    rows = db.query(models.CompletionRollup).join(
+        models.Habit, models.Habit.id == models.CompletionRollup.habit_id
+    ).filter(
+        models.CompletionRollup.user_id == user_id,
+        models.Habit.is_active == True,
+        or_(
+            and_(models.CompletionRollup.period == "all", models.CompletionRollup.period_start == ALL_TIME_START),
+            and_(models.CompletionRollup.period == "week", models.CompletionRollup.period_start == week_start),
+            and_(models.CompletionRollup.period == "month", models.CompletionRollup.period_start == month_start),
+        ),
+    ).all()
+
+    sums = {period: [0, 0] for period in ("all", "week", "month")}
+    habits: Dict[int, Dict] = {}
+    for row in rows:
+        sums[row.period][0] += row.total_records
+        sums[row.period][1] += row.completed_records
+        habit = habits.setdefault(row.habit_id, {"habit_id": row.habit_id})
+        habit[f"{row.period}_rate"] = _rate(row.total_records, row.completed_records)
+        if row.period == "all":
+            habit["total_records"] = row.total_records
+            habit["completed_records"] = row.completed_records
+
+    def block(period: str, start: Optional[date] = None) -> Dict:
+        total, completed = sums[period]
+        return {"period_start": start, "total_records": total, "completed_records": completed, "completion_rate": _rate(total, completed)}
+
+    return {
+        "user_id": user_id,
+        "overall": block("all"),
+        "this_week": block("week", week_start),
+        "this_month": block("month", month_start),
+        "habits": [
+            {
+                "habit_id": habit["habit_id"],
+                "total_records": habit.get("total_records", 0),
+                "completed_records": habit.get("completed_records", 0),
+                "completion_rate": habit.get("all_rate", 0.0),
+                "week_rate": habit.get("week_rate", 0.0),
+                "month_rate": habit.get("month_rate", 0.0),
+            }
+            for habit in sorted(habits.values(), key=lambda habit: habit["habit_id"])
+        ],
+    }
+
+
+def user_series(
+    db: Session,
+    user_id: int,
+    period: str,
+    start: date,
+    end: date,
+    habit_id: Optional[int] = None,
+) -> List[Dict]:
+    """
+    Serie de cumplimiento de un usuario (o de uno de sus hábitos) por día, semana o mes.
+
+    Returns:
+        Un elemento por periodo con registros, ordenados por fecha
+    """
+    query = db.query(
+        models.CompletionRollup.period_start,
+        func.sum(models.CompletionRollup.total_records),
+        func.sum(models.CompletionRollup.completed_records),
+    ).filter(
+        models.CompletionRollup.user_id == user_id,
+        models.CompletionRollup.period == period,
+        models.CompletionRollup.period_start >= period_start(period, start),
+        models.CompletionRollup.period_start <= end,
+    )
+    if habit_id is not None:
+        query = query.filter(models.CompletionRollup.habit_id == habit_id)
+
+    return [
+        {"period_start": start_day, "total_records": int(total), "completed_records": int(completed), "completion_rate": _rate(total, completed)}
+        for start_day, total, completed in query.group_by(models.CompletionRollup.period_start).order_by(models.CompletionRollup.period_start)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruye los totales de cumplimiento desde la tabla records")
+    parser.add_argument("--user-id", type=int, default=None, help="Reconstruir solo los totales de este usuario")
+    args = parser.parse_args()
+
+    from app.database.config import Base, SessionLocal, engine
+
+    logging.basicConfig(level=logging.INFO)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rebuild_rollups(db, args.user_id)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
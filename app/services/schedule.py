@@ -0,0 +1,254 @@
+"""
+Programación de los hábitos según su frecuencia.
+
+`Habit.frequency` es texto libre; aquí se interpreta como una regla
+(unidad, intervalo y, opcionalmente, días de la semana) y con ella se
+calcula la próxima fecha en que el hábito toca, que se guarda indexada en
+`Habit.next_due_date`. Así "qué hábitos tocan hoy" es una sola consulta
+`next_due_date <= hoy` (los atrasados también aparecen).
+
+Formatos aceptados (en inglés o en español, sin distinguir mayúsculas):
+- daily / diario, weekly / semanal, monthly / mensual
+- every 3 days / cada 3 días (también weeks / semanas, months / meses)
+- weekdays / entre semana, weekends / fines de semana
+- una lista de días: "mon,wed,fri" o "lunes, miércoles, viernes"
+Cualquier otro valor se trata como diario.
+
+La fecha se recalcula al crear o editar un hábito y cuando cambia el estado
+de completado de alguno de sus registros. Para rellenarla en hábitos
+existentes:
+
+    python -m app.services.schedule
+"""
+
+import re  # Para interpretar las frecuencias
+import logging  # Para registrar el recálculo
+import unicodedata  # Para ignorar tildes en los nombres de los días
+from datetime import date, datetime, timedelta  # Para calcular las fechas
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional  # Para anotaciones de tipos
+
+from sqlalchemy import bindparam, func, update  # Para el recálculo por lotes
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models import models  # Modelos (tablas)
+
+logger = logging.getLogger(__name__)
+
+# Hábitos por lote al recalcular
+REFRESH_BATCH_SIZE = 500
+
+# Máximo de usuarios por consulta masiva de pendientes
+MAX_BULK_DUE_USERS = 1000
+
+UNIT_ALIASES = {
+    "day": "day", "days": "day", "dia": "day", "dias": "day",
+    "week": "week", "weeks": "week", "semana": "week", "semanas": "week",
+    "month": "month", "months": "month", "mes": "month", "meses": "month",
+}
+
+NAMED_RULES = {
+    "daily": ("day", None), "diario": ("day", None), "diaria": ("day", None), "every day": ("day", None),
+    "weekly": ("week", None), "semanal": ("week", None),
+    "monthly": ("month", None), "mensual": ("month", None),
+    "weekdays": ("week", frozenset(range(5))), "entre semana": ("week", frozenset(range(5))),
+    "weekends": ("week", frozenset({5, 6})), "fines de semana": ("week", frozenset({5, 6})),
+}
+
+WEEKDAY_ALIASES = {
+    "mon": 0, "monday": 0, "lun": 0, "lunes": 0,
+    "tue": 1, "tuesday": 1, "mar": 1, "martes": 1,
+    "wed": 2, "wednesday": 2, "mie": 2, "miercoles": 2,
+    "thu": 3, "thursday": 3, "jue": 3, "jueves": 3,
+    "fri": 4, "friday": 4, "vie": 4, "viernes": 4,
+    "sat": 5, "saturday": 5, "sab": 5, "sabado": 5,
+    "sun": 6, "sunday": 6, "dom": 6, "domingo": 6,
+}
+
+EVERY_PATTERN = re.compile(r"^(?:every|cada)\s+(\d+)\s+(\w+)$")
+
+
+class ScheduleRule(NamedTuple):
+    """Regla de repetición: cada `interval` días, semanas o meses, o ciertos días de la semana."""
+    unit: str
+    interval: int = 1
+    weekdays: Optional[FrozenSet[int]] = None
+
+
+DAILY = ScheduleRule("day")
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.strip().lower())
+    return " ".join("".join(char for char in text if not unicodedata.combining(char)).split())
+
+
+def parse_frequency(frequency: Optional[str]) -> ScheduleRule:
+    """Convierto el texto de la frecuencia en una regla (diaria si no se reconoce)."""
+    text = _normalize(frequency or "")
+    if not text:
+        return DAILY
+
+    if text in NAMED_RULES:
+        unit, weekdays = NAMED_RULES[text]
+        return ScheduleRule(unit, 1, weekdays)
+
+    match = EVERY_PATTERN.match(text)
+    if match and match.group(2) in UNIT_ALIASES and int(match.group(1)) > 0:
+        return ScheduleRule(UNIT_ALIASES[match.group(2)], int(match.group(1)))
+
+    days = [part.strip() for part in re.split(r"[,;/]|\s+y\s+|\s+and\s+|\s+", text) if part.strip()]
+    if days and all(day in WEEKDAY_ALIASES for day in days):
+        return ScheduleRule("week", 1, frozenset(WEEKDAY_ALIASES[day] for day in days))
+
+    return DAILY
+
+
+def _monday(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _ceil_div(numerator: int, denominator: int) -> int:
+    return -(-numerator // denominator)
+
+
+def next_due_date(rule: ScheduleRule, anchor: date, last_completed: Optional[date]) -> date:
+    """
+    Próxima fecha en que el hábito toca.
+
+    Args:
+        rule: Regla de la frecuencia
+        anchor: Fecha desde la que cuenta el intervalo (creación del hábito)
+        last_completed: Último día completado (None si nunca se completó)
+
+    Para las reglas por periodo (semanal o mensual sin días concretos),
+    completar cualquier día del periodo lo cubre entero y el hábito vuelve
+    a tocar al empezar el siguiente periodo del intervalo.
+    """
+    if rule.unit == "day":
+        start = last_completed + timedelta(days=1) if last_completed else anchor
+        if start <= anchor:
+            return anchor
+        return anchor + timedelta(days=_ceil_div((start - anchor).days, rule.interval) * rule.interval)
+
+    if rule.unit == "week" and rule.weekdays:
+        start = max(last_completed + timedelta(days=1), anchor) if last_completed else anchor
+        anchor_week = _monday(anchor)
+        # Como mucho hay que mirar un intervalo completo de semanas
+        for offset in range(7 * rule.interval + 7):
+            day = start + timedelta(days=offset)
+            if day.weekday() in rule.weekdays and ((_monday(day) - anchor_week).days // 7) % rule.interval == 0:
+                return day
+        return start
+
+    if rule.unit == "week":
+        anchor_week = _monday(anchor)
+        start_week = _monday(last_completed) + timedelta(weeks=1) if last_completed else anchor_week
+        weeks = max(_ceil_div((start_week - anchor_week).days // 7, rule.interval), 0) * rule.interval
+        return max(anchor_week + timedelta(weeks=weeks), anchor)
+
+    # Mensual
+    anchor_month = anchor.year * 12 + anchor.month - 1
+    start_month = last_completed.year * 12 + last_completed.month if last_completed else anchor_month
+    months = anchor_month + max(_ceil_div(start_month - anchor_month, rule.interval), 0) * rule.interval
+    return max(date(months // 12, months % 12 + 1, 1), anchor)
+
+
+def initial_due_date(frequency: Optional[str], created: Optional[date] = None) -> date:
+    """Fecha en que toca por primera vez un hábito recién creado."""
+    created = created or datetime.utcnow().date()
+    return next_due_date(parse_frequency(frequency), created, None)
+
+
+def refresh_due_dates(db: Session, habit_ids: Iterable[int]):
+    """
+    Recalculo next_due_date de varios hábitos (sin hacer commit).
+
+    Usa una consulta para las frecuencias, otra para el último día completado
+    de cada hábito y un UPDATE por lotes. El UPDATE es de Core a propósito:
+    es un dato derivado y no debe contar como un cambio del hábito en /sync.
+    """
+    ids = list(dict.fromkeys(habit_ids))
+    if not ids:
+        return
+    # Los registros pendientes de la sesión tienen que estar en la base de datos
+    db.flush()
+
+    habits_table = models.Habit.__table__
+    stmt = update(habits_table).where(habits_table.c.id == bindparam("habit_id")).values(next_due_date=bindparam("due"))
+    for start in range(0, len(ids), REFRESH_BATCH_SIZE):
+        chunk = ids[start:start + REFRESH_BATCH_SIZE]
+        habits = db.query(models.Habit.id, models.Habit.frequency, models.Habit.created_at).filter(models.Habit.id.in_(chunk)).all()
+        last_completed: Dict[int, date] = dict(
+            db.query(models.Record.habit_id, func.max(models.Record.date)).filter(
+                models.Record.habit_id.in_(chunk),
+                models.Record.completed == True,
+            ).group_by(models.Record.habit_id).all()
+        )
+        values = [
+            {
+                "habit_id": habit_id,
+                "due": next_due_date(parse_frequency(frequency), created_at.date(), last_completed.get(habit_id)),
+            }
+            for habit_id, frequency, created_at in habits
+        ]
+        if values:
+            db.connection().execute(stmt, values)
+
+
+def due_habits(db: Session, user_ids: List[int], day: date) -> List[models.Habit]:
+    """
+    Hábitos activos de uno o varios usuarios que tocan en `day` (o están atrasados).
+
+    Los hábitos sin fecha calculada (creados antes de existir la columna) se
+    calculan aquí una vez.
+    """
+    pending = [
+        habit_id for (habit_id,) in db.query(models.Habit.id).filter(
+            models.Habit.user_id.in_(user_ids),
+            models.Habit.is_active == True,
+            models.Habit.next_due_date.is_(None),
+        )
+    ]
+    if pending:
+        refresh_due_dates(db, pending)
+        db.commit()
+
+    return db.query(models.Habit).filter(
+        models.Habit.user_id.in_(user_ids),
+        models.Habit.is_active == True,
+        models.Habit.next_due_date <= day,
+    ).order_by(models.Habit.user_id, models.Habit.next_due_date, models.Habit.id).all()
+
+
+def due_view(habit: models.Habit, day: date) -> Dict:
+    """Hábito pendiente con su próxima fecha, listo para la respuesta."""
+    return {
+        "id": habit.id,
+        "name": habit.name,
+        "description": habit.description,
+        "frequency": habit.frequency,
+        "user_id": habit.user_id,
+        "is_active": habit.is_active,
+        "created_at": habit.created_at,
+        "next_due_date": habit.next_due_date,
+        "overdue": habit.next_due_date < day,
+    }
+
+
+def main():
+    from app.database.config import Base, SessionLocal, engine
+
+    logging.basicConfig(level=logging.INFO)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        habit_ids = [habit_id for (habit_id,) in db.query(models.Habit.id).filter(models.Habit.is_active == True)]
+        refresh_due_dates(db, habit_ids)
+        db.commit()
+        logger.info(f"Próxima fecha recalculada para {len(habit_ids)} hábitos")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Motor de rachas de los hábitos.
+
+La racha actual y la mejor racha de cada hábito se guardan en la tabla
+habit_streaks y se actualizan dentro de la misma transacción que el
+registro que las cambia:
+- Un check-in en el periodo siguiente al último extiende la racha (O(1)).
+- Un check-in atrasado (backfill) o un registro que deja de estar completado
+  obliga a recalcular la racha recorriendo el historial del hábito.
+
+La racha se cuenta en periodos de la regla de la frecuencia del hábito, la
+misma que usa app/services/schedule.py para la próxima fecha: días, semanas o
+meses (cada N, contados desde la creación del hábito) o, con días concretos
+("mon,wed,fri"), cada uno de esos días. Un check-in en un día que no toca
+cubre el último día que tocaba.
+Leer una racha es O(1): si el último periodo completado ya quedó atrás, la
+racha actual se reporta como 0 sin tocar el historial.
+
+La fila de habit_streaks es además el candado de cada hábito: toda escritura
+de registros empieza con lock_habits, antes de tocar registros, totales,
+bitmaps o el contador global de /sync, así todas toman los bloqueos en el
+mismo orden y no pueden quedar esperándose entre sí en PostgreSQL.
+"""
+
+from datetime import date, datetime  # Para calcular periodos y sellos de tiempo
+from typing import Dict, Iterable, List, Optional  # Para anotaciones de tipos
+
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models import models  # Modelos (tablas)
+from app.services.schedule import ScheduleRule, parse_frequency  # Regla de la frecuencia
+from app.services.upsert import dialect_insert  # INSERT ... ON CONFLICT del motor
+
+
+def streak_unit(frequency: Optional[str]) -> str:
+    """
+    Clave de la regla con la que se guarda la racha (si cambia, se recalcula).
+
+    Las reglas simples conservan "day", "week" o "month"; las demás llevan el
+    intervalo y los días como máscara de bits, por ejemplo "d3" o "w1-21".
+    """
+    rule = parse_frequency(frequency)
+    if rule.interval == 1 and not rule.weekdays:
+        return rule.unit
+    key = f"{rule.unit[0]}{rule.interval}"
+    if rule.weekdays:
+        key += f"-{sum(1 << weekday for weekday in rule.weekdays)}"
+    return key[:10]
+
+
+def _week(day: date) -> int:
+    # Las semanas empiezan en lunes, como en ISO 8601
+    return (day.toordinal() - day.weekday()) // 7
+
+
+def period_index(rule: ScheduleRule, anchor: date, day: date) -> int:
+    """
+    Convierto una fecha en un número de periodo consecutivo de la regla.
+
+    Args:
+        rule: Regla de la frecuencia
+        anchor: Fecha desde la que cuenta el intervalo (creación del hábito)
+        day: Fecha a convertir
+    """
+    if rule.unit == "week" and rule.weekdays:
+        # Cada día que toca es un periodo; un día que no toca cuenta como el último que tocaba
+        weekdays = sorted(rule.weekdays)
+        weeks = _week(day) - _week(anchor)
+        cycle = weeks // rule.interval
+        if weeks % rule.interval:
+            return cycle * len(weekdays) + len(weekdays) - 1
+        return cycle * len(weekdays) + sum(1 for weekday in weekdays if weekday <= day.weekday()) - 1
+    if rule.unit == "week":
+        base, current = _week(anchor), _week(day)
+    elif rule.unit == "month":
+        base, current = anchor.year * 12 + anchor.month - 1, day.year * 12 + day.month - 1
+    else:
+        base, current = anchor.toordinal(), day.toordinal()
+    # Con intervalo 1 es el número absoluto del día, semana o mes (el de las rachas ya guardadas)
+    return base + (current - base) // rule.interval
+
+
+def habit_period(habit: models.Habit, day: date) -> int:
+    """Periodo de la racha de un hábito en el que cae la fecha."""
+    return period_index(parse_frequency(habit.frequency), habit.created_at.date(), day)
+
+
+def _get_state(db: Session, habit_id: int, lock: bool = False) -> Optional[models.HabitStreak]:
+    query = db.query(models.HabitStreak).filter(models.HabitStreak.habit_id == habit_id)
+    if lock:
+        # Evito que dos check-ins simultáneos del mismo hábito se pisen (solo aplica en PostgreSQL)
+        query = query.with_for_update()
+    return query.first()
+
+
+def lock_habits(db: Session, habit_ids: Iterable[int]):
+    """
+    Bloqueo la racha de varios hábitos hasta el commit, en orden de id.
+
+    Si la fila no existe se crea vacía (unit = "", que obliga a recalcular
+    la racha la próxima vez), así siempre hay una fila que bloquear y dos
+    escrituras del mismo hábito nunca avanzan a la vez.
+    """
+    ids = sorted(set(habit_ids))
+    if not ids:
+        return
+
+    insert = dialect_insert(db)
+    if insert is not None:
+        now = datetime.utcnow()
+        db.execute(
+            insert(models.HabitStreak).values([
+                {"habit_id": habit_id, "unit": "", "current_streak": 0, "longest_streak": 0, "updated_at": now}
+                for habit_id in ids
+            ]).on_conflict_do_nothing()
+        )
+    db.query(models.HabitStreak.habit_id).filter(
+        models.HabitStreak.habit_id.in_(ids)
+    ).order_by(models.HabitStreak.habit_id).with_for_update().all()
+
+
+def recompute_streak(db: Session, habit: models.Habit) -> models.HabitStreak:
+    """
+    Recalculo la racha de un hábito recorriendo sus registros completados.
+
+    Usa el índice (habit_id, date) y solo se necesita tras un backfill o
+    cuando un registro deja de estar completado.
+    """
+    unit = streak_unit(habit.frequency)
+    current = longest = 0
+    last_period = None
+    last_date = None
+
+    completed_dates = db.query(models.Record.date).filter(
+        models.Record.habit_id == habit.id,
+        models.Record.completed == True,
+    ).order_by(models.Record.date)
+
+    for (record_date,) in completed_dates:
+        period = habit_period(habit, record_date)
+        if period == last_period:
+            last_date = record_date
+            continue
+        current = current + 1 if last_period is not None and period == last_period + 1 else 1
+        longest = max(longest, current)
+        last_period = period
+        last_date = record_date
+
+    state = _get_state(db, habit.id, lock=True)
+    if state is None:
+        state = models.HabitStreak(habit_id=habit.id)
+        db.add(state)
+    state.unit = unit
+    state.current_streak = current
+    state.longest_streak = longest
+    state.last_period = last_period
+    state.last_completed_date = last_date
+    state.updated_at = datetime.utcnow()
+    db.flush()
+    return state
+
+
+def apply_record_change(
+    db: Session,
+    habit: models.Habit,
+    record_date: date,
+    was_completed: bool,
+    is_completed: bool,
+):
+    """
+    Actualizo la racha de un hábito después de crear o actualizar un registro.
+
+    Debe llamarse antes del commit del registro, con el registro ya agregado
+    a la sesión, para que la racha y el registro se confirmen juntos.
+    """
+    if was_completed == is_completed:
+        return
+
+    state = _get_state(db, habit.id, lock=True)
+    unit = streak_unit(habit.frequency)
+
+    # Un registro que deja de estar completado, un backfill o un cambio de frecuencia: recalculo
+    if not is_completed or state is None or state.unit != unit:
+        db.flush()
+        recompute_streak(db, habit)
+        return
+
+    period = habit_period(habit, record_date)
+    if state.last_period is None or period > state.last_period + 1:
+        state.current_streak = 1
+    elif period == state.last_period + 1:
+        state.current_streak += 1
+    elif period == state.last_period:
+        state.last_completed_date = max(state.last_completed_date, record_date)
+        state.updated_at = datetime.utcnow()
+        return
+    else:
+        # Check-in atrasado: puede unir dos rachas, así que recalculo
+        db.flush()
+        recompute_streak(db, habit)
+        return
+
+    state.last_period = period
+    state.last_completed_date = record_date
+    state.longest_streak = max(state.longest_streak, state.current_streak)
+    state.updated_at = datetime.utcnow()
+
+
+def apply_bulk_changes(db: Session, changes: Iterable[tuple]):
+    """
+    Actualizo las rachas después de una escritura masiva de registros.
+
+    Args:
+        changes: Tuplas (hábito, fecha, estaba_completado, está_completado)
+    """
+    by_habit: Dict[int, List[tuple]] = {}
+    habits: Dict[int, models.Habit] = {}
+    for habit, record_date, was_completed, is_completed in changes:
+        if was_completed != is_completed:
+            habits[habit.id] = habit
+            by_habit.setdefault(habit.id, []).append((record_date, was_completed, is_completed))
+
+    for habit_id, habit_changes in by_habit.items():
+        # Aplico los cambios en orden de fecha; si alguno obliga a recalcular, los siguientes se extienden sobre ese resultado
+        for record_date, was_completed, is_completed in sorted(habit_changes, key=lambda change: change[0]):
+            apply_record_change(db, habits[habit_id], record_date, was_completed, is_completed)
+
+
+def streak_view(habit: models.Habit, state: Optional[models.HabitStreak], today: Optional[date] = None) -> Dict:
+    """
+    Armo la respuesta de la racha de un hábito.
+
+    La racha actual sigue viva si el último periodo completado es el actual
+    o el anterior (todavía hay tiempo de completar el de hoy).
+    """
+    current = longest = 0
+    last_completed = None
+
+    if state is not None:
+        today_period = habit_period(habit, today or date.today())
+        longest = state.longest_streak
+        last_completed = state.last_completed_date
+        if state.last_period is not None and state.last_period >= today_period - 1:
+            current = state.current_streak
+
+    return {
+        "habit_id": habit.id,
+        "unit": parse_frequency(habit.frequency).unit,
+        "current_streak": current,
+        "longest_streak": longest,
+        "last_completed_date": last_completed,
+    }
+
+
+def get_streaks(db: Session, habits: List[models.Habit]) -> List[Dict]:
+    """
+    Devuelvo la racha de varios hábitos con una sola consulta.
+
+    Los hábitos sin racha guardada (por ejemplo, con registros anteriores a
+    este módulo) o cuya frecuencia cambió se calculan una vez y se guardan.
+    """
+    states = {
+        state.habit_id: state
+        for state in db.query(models.HabitStreak).filter(
+            models.HabitStreak.habit_id.in_([habit.id for habit in habits])
+        )
+    }
+
+    computed = False
+    for habit in habits:
+        state = states.get(habit.id)
+        if state is None or state.unit != streak_unit(habit.frequency):
+            states[habit.id] = recompute_streak(db, habit)
+            computed = True
+    if computed:
+        db.commit()
+
+    return [streak_view(habit, states[habit.id]) for habit in habits]
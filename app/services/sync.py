@@ -0,0 +1,164 @@
+"""
+Secuencia de cambios de hábitos y registros para la sincronización incremental.
+
+Cada usuario tiene su propio contador ("user:<id>"). Cada flush que crea o
+modifica hábitos o registros (incluida la desactivación de un hábito) toma
+el siguiente valor del contador de su dueño y lo guarda en su columna
+change_seq. Incrementar el contador bloquea su fila hasta el commit, así
+los valores de un usuario se confirman en orden: un cliente que pide los
+cambios posteriores a su último token nunca se salta una transacción que
+terminó más tarde con un número menor. Las escrituras de usuarios distintos
+no se esperan entre sí.
+
+Las escrituras que no pasan por el ORM (el upsert de /records/bulk) toman
+el número con next_change_seq y lo incluyen en la sentencia.
+
+Antes había un único contador global ("changes"). El contador de cada
+usuario empieza después de su último valor, así los tokens ya entregados
+siguen siendo válidos.
+"""
+
+from collections import defaultdict  # Para agrupar los cambios por usuario
+from typing import Dict, Optional  # Para anotaciones de tipos
+
+from sqlalchemy import event, func, select, update  # Para el contador y el listener
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models import models  # Modelos (tablas)
+from app.services.upsert import dialect_insert  # INSERT ... ON CONFLICT del motor
+
+# Nombre del antiguo contador global de cambios
+CHANGES_COUNTER = "changes"
+
+# Modelos que llevan change_seq
+SYNCED_MODELS = (models.Habit, models.Record)
+
+# Máximo de registros por respuesta de /sync
+MAX_SYNC_LIMIT = 5000
+
+
+def _counter_name(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def next_change_seq(db: Session, user_id: int) -> int:
+    """Incremento el contador de cambios del usuario y devuelvo su nuevo valor (sin hacer commit)."""
+    counter = models.SyncCounter.__table__
+    connection = db.connection()
+    name = _counter_name(user_id)
+
+    # Un contador nuevo continúa después del antiguo contador global
+    legacy = select(func.coalesce(func.max(counter.c.value), 0)).where(counter.c.name == CHANGES_COUNTER)
+
+    insert = dialect_insert(db)
+    if insert is not None:
+        stmt = insert(counter).values(name=name, value=legacy.scalar_subquery() + 1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[counter.c.name],
+            set_={"value": counter.c.value + 1},
+        ).returning(counter.c.value)
+        return connection.execute(stmt).scalar_one()
+
+    updated = connection.execute(
+        update(counter).where(counter.c.name == name).values(value=counter.c.value + 1)
+    )
+    if not updated.rowcount:
+        connection.execute(counter.insert().values(name=name, value=connection.execute(legacy).scalar_one() + 1))
+    return connection.execute(select(counter.c.value).where(counter.c.name == name)).scalar_one()
+
+
+def current_change_seq(db: Session, user_id: int) -> int:
+    """Último número de cambio confirmado del usuario (0 si todavía no hubo cambios)."""
+    values = dict(
+        db.query(models.SyncCounter.name, models.SyncCounter.value).filter(
+            models.SyncCounter.name.in_([_counter_name(user_id), CHANGES_COUNTER])
+        )
+    )
+    # Sin contador propio, sus cambios (si los hay) se numeraron con el contador global
+    return values.get(_counter_name(user_id), values.get(CHANGES_COUNTER)) or 0
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_changes(session: Session, flush_context, instances):
+    """Numero los hábitos y registros nuevos o modificados de cada flush con el contador de su dueño."""
+    changed = [obj for obj in session.new if isinstance(obj, SYNCED_MODELS)]
+    changed += [
+        obj for obj in session.dirty
+        if isinstance(obj, SYNCED_MODELS) and session.is_modified(obj, include_collections=False)
+    ]
+    if not changed:
+        return
+
+    # Los registros no guardan el usuario: lo busco en sus hábitos con una sola consulta
+    habit_ids = {
+        obj.habit_id for obj in changed
+        if isinstance(obj, models.Record) and obj.habit_id is not None
+    }
+    habit_owners = {}
+    if habit_ids:
+        habit_owners = dict(session.connection().execute(
+            select(models.Habit.id, models.Habit.user_id).where(models.Habit.id.in_(habit_ids))
+        ).all())
+
+    by_user = defaultdict(list)
+    for obj in changed:
+        if isinstance(obj, models.Habit):
+            user_id = obj.user_id
+        elif obj.habit_id is not None:
+            user_id = habit_owners.get(obj.habit_id)
+        else:
+            # Registro creado junto con su hábito en el mismo flush
+            user_id = obj.habit.user_id
+        if user_id is not None:
+            by_user[user_id].append(obj)
+
+    # Siempre en el mismo orden, para que dos transacciones no se bloqueen entre sí
+    for user_id in sorted(by_user):
+        change_seq = next_change_seq(session, user_id)
+        for obj in by_user[user_id]:
+            obj.change_seq = change_seq
+
+
+def changes_since(db: Session, user_id: int, since: Optional[int], limit: int) -> Dict:
+    """
+    Devuelvo los hábitos y registros de un usuario que cambiaron después de `since`.
+
+    Sin `since` se devuelve todo (sincronización inicial). Si hay más de
+    `limit` registros, se corta en un límite entre números de cambio y
+    `has_more` indica que hay que volver a pedir con el nuevo token.
+
+    Returns:
+        Diccionario con habits, records, next_token y has_more
+    """
+    # Solo se leen cambios ya confirmados del usuario: ningún commit posterior puede tener un número menor
+    head = current_change_seq(db, user_id)
+
+    records = db.query(models.Record).join(models.Habit, models.Habit.id == models.Record.habit_id).filter(
+        models.Habit.user_id == user_id,
+        models.Record.change_seq <= head,
+    )
+    habits = db.query(models.Habit).filter(models.Habit.user_id == user_id, models.Habit.change_seq <= head)
+    if since is not None:
+        records = records.filter(models.Record.change_seq > since)
+        habits = habits.filter(models.Habit.change_seq > since)
+
+    page = records.order_by(models.Record.change_seq, models.Record.id).limit(limit + 1).all()
+    upto = head
+    has_more = len(page) > limit
+    if has_more:
+        # Corto antes del último número de la página para no partir un cambio en dos respuestas
+        first_seq = page[0].change_seq
+        upto = page[limit].change_seq - 1
+        page = [record for record in page if record.change_seq <= upto]
+        if not page:
+            # Un solo cambio con más registros que el límite: lo envío completo
+            upto = first_seq
+            page = records.filter(models.Record.change_seq == first_seq).order_by(models.Record.id).all()
+        has_more = upto < head
+
+    return {
+        "habits": habits.filter(models.Habit.change_seq <= upto).order_by(models.Habit.id).all(),
+        "records": page,
+        "next_token": upto,
+        "has_more": has_more,
+    }
@@ -0,0 +1,235 @@
+"""
+Límite de intentos de login y de registro con cubetas de tokens.
+
+Cada intento de login con un correo existente cuesta un bcrypt completo;
+una ráfaga de credential stuffing puede ocupar todos los procesos de hash
+y dejar sin CPU al resto. Antes de tocar la base de datos o bcrypt, cada
+intento toma un token de su cubeta por IP y, en el login, también de la
+cubeta de la cuenta. Sin tokens se responde 429 con Retry-After.
+
+Una cubeta tiene capacidad C (la ráfaga permitida) y se recarga a R tokens
+por minuto. Se configuran con "C,R":
+- THROTTLE_LOGIN_IP (por defecto "20,20")
+- THROTTLE_LOGIN_ACCOUNT (por defecto "5,2")
+- THROTTLE_SIGNUP_IP (por defecto "10,5")
+
+Hay dos almacenes, elegidos con la variable THROTTLE_BACKEND:
+- "memory" (por defecto): LRU en el proceso, acotado a THROTTLE_MAX_KEYS
+  cubetas (una cubeta desalojada vuelve a estar llena).
+- "database": tabla throttle_buckets, compartida por varios workers; cada
+  intento es un único INSERT ... ON CONFLICT DO UPDATE atómico y las
+  cubetas inactivas se borran de vez en cuando.
+"""
+
+import os  # Para leer la configuración desde variables de entorno
+import time  # Para la recarga de las cubetas
+import logging  # Para registrar los rechazos
+import threading  # Las rutas síncronas corren en el threadpool
+from collections import OrderedDict  # Para el orden LRU
+from typing import Dict, NamedTuple, Optional, Tuple  # Para anotaciones de tipos
+
+from fastapi import HTTPException, Request  # Para leer la IP y responder 429
+from sqlalchemy import case, delete, select  # Para la recarga atómica en SQL
+from starlette.concurrency import run_in_threadpool  # El almacén en base de datos bloquea
+
+from app.database.config import SessionLocal  # Sesiones propias, fuera de la transacción de la ruta
+from app.models import models  # Modelos (tablas)
+from app.services.upsert import dialect_insert  # INSERT ... ON CONFLICT del motor
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_BACKEND = os.environ.get("THROTTLE_BACKEND", "memory")
+THROTTLE_MAX_KEYS = int(os.environ.get("THROTTLE_MAX_KEYS") or "100000")
+
+# Cada cuántos intentos se borran las cubetas inactivas de la base de datos
+DB_CLEANUP_EVERY = 1000
+
+
+class BucketRule(NamedTuple):
+    """Capacidad de la cubeta y tokens que recupera por segundo."""
+    capacity: float
+    refill_per_second: float
+
+
+def _rule(variable: str, default: str) -> BucketRule:
+    capacity, per_minute = (float(part) for part in (os.environ.get(variable) or default).split(","))
+    return BucketRule(max(capacity, 1.0), max(per_minute, 0.001) / 60.0)
+
+
+RULES: Dict[str, BucketRule] = {
+    "login_ip": _rule("THROTTLE_LOGIN_IP", "20,20"),
+    "login_account": _rule("THROTTLE_LOGIN_ACCOUNT", "5,2"),
+    "signup_ip": _rule("THROTTLE_SIGNUP_IP", "10,5"),
+}
+
+# Tiempo tras el cual cualquier cubeta está llena otra vez y se puede descartar
+IDLE_SECONDS = max(rule.capacity / rule.refill_per_second for rule in RULES.values())
+
+
+class MemoryThrottleStore:
+    """Cubetas en un LRU del proceso: dos números por clave."""
+
+    blocking = False
+    name = "memory"
+
+    def __init__(self, max_keys: int = THROTTLE_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def take(self, key: str, rule: BucketRule, now: float) -> float:
+        """
+        Tomo un token de la cubeta.
+
+        Returns:
+            0 si había token, o los segundos hasta que haya uno
+        """
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (rule.capacity, now))
+            tokens = min(rule.capacity, tokens + (now - updated_at) * rule.refill_per_second)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rule.refill_per_second
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+            return wait
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"backend": self.name, "keys": len(self._buckets), "evictions": self.evictions}
+
+
+class DatabaseThrottleStore(MemoryThrottleStore):
+    """Cubetas en la tabla throttle_buckets, compartidas por todos los workers."""
+
+    blocking = True
+    name = "database"
+
+    def __init__(self):
+        super().__init__()
+        self._attempts = 0
+
+    def take(self, key: str, rule: BucketRule, now: float) -> float:
+        table = models.ThrottleBucket.__table__
+        refilled = table.c.tokens + (now - table.c.updated_at) * rule.refill_per_second
+        available = case((refilled > rule.capacity, rule.capacity), else_=refilled)
+
+        db = SessionLocal()
+        try:
+            insert = dialect_insert(db)
+            if insert is None:
+                raise RuntimeError("THROTTLE_BACKEND=database necesita PostgreSQL o SQLite")
+            # Recargo y tomo el token en una sola sentencia; si no alcanza, la fila no cambia
+            stmt = insert(table).values(key=key, tokens=rule.capacity - 1, updated_at=now)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.key],
+                set_={"tokens": available - 1, "updated_at": now},
+                where=available >= 1,
+            ).returning(table.c.tokens)
+            wait = 0.0
+            if db.execute(stmt).first() is None:
+                tokens = db.execute(select(available).where(table.c.key == key)).scalar_one()
+                wait = (1 - tokens) / rule.refill_per_second
+            db.commit()
+
+            with self._lock:
+                self._attempts += 1
+                cleanup = self._attempts % DB_CLEANUP_EVERY == 0
+            if cleanup:
+                result = db.execute(delete(table).where(table.c.updated_at < now - IDLE_SECONDS))
+                db.commit()
+                with self._lock:
+                    self.evictions += result.rowcount
+            return wait
+        finally:
+            db.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"backend": self.name, "evictions": self.evictions}
+
+
+class Throttle:
+    """Aplica las reglas sobre el almacén y cuenta los intentos permitidos y rechazados."""
+
+    def __init__(self, store: MemoryThrottleStore, rules: Dict[str, BucketRule] = RULES):
+        self.store = store
+        self.rules = rules
+        self._lock = threading.Lock()
+        self.allowed = {scope: 0 for scope in rules}
+        self.rejected = {scope: 0 for scope in rules}
+
+    def check(self, *checks: Tuple[str, str]) -> Optional[Tuple[str, float]]:
+        """
+        Tomo un token de cada cubeta, en orden, hasta la primera sin tokens.
+
+        Args:
+            checks: Pares (ámbito, identidad), por ejemplo ("login_ip", "10.0.0.1")
+
+        Returns:
+            None si se permite, o (ámbito, segundos de espera) del primer rechazo
+        """
+        now = time.time()
+        for scope, identity in checks:
+            wait = self.store.take(f"{scope}:{identity}", self.rules[scope], now)
+            with self._lock:
+                if wait > 0:
+                    self.rejected[scope] += 1
+                    return scope, wait
+                self.allowed[scope] += 1
+        return None
+
+    async def enforce(self, *checks: Tuple[str, str]):
+        """
+        Rechazo la petición con 429 si alguna cubeta está vacía.
+
+        Raises:
+            HTTPException: 429 con Retry-After
+        """
+        if self.store.blocking:
+            limited = await run_in_threadpool(self.check, *checks)
+        else:
+            limited = self.check(*checks)
+        if limited is None:
+            return
+
+        scope, wait = limited
+        retry_after = max(int(wait + 0.999), 1)
+        logger.warning(f"Límite de intentos alcanzado ({scope}), reintentar en {retry_after} s")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Demasiados intentos, intenta de nuevo en {retry_after} segundos",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = {
+                scope: {"allowed": self.allowed[scope], "rejected": self.rejected[scope]}
+                for scope in self.rules
+            }
+        return {**self.store.stats(), "scopes": counters}
+
+
+def client_ip(request: Request) -> str:
+    """
+    IP del cliente. Detrás de un proxy, uvicorn debe arrancar con
+    --proxy-headers para que sea la del cliente y no la del proxy.
+    """
+    return request.client.host if request.client else "unknown"
+
+
+def create_throttle() -> Throttle:
+    """Creo el límite con el almacén configurado en THROTTLE_BACKEND."""
+    if THROTTLE_BACKEND == "database":
+        return Throttle(DatabaseThrottleStore())
+    return Throttle(MemoryThrottleStore())
+
+
+# Instancia compartida por todo el proceso
+login_throttle = create_throttle()
@@ -0,0 +1,130 @@
+"""
+Índice de los archivos guardados en la carpeta uploads.
+
+La tabla uploaded_files se actualiza al guardar y al eliminar cada archivo,
+así /excel/list-files puede paginar y ordenar con una consulta en lugar de
+recorrer el directorio y pedir el tamaño y la fecha de cada archivo. Al
+arrancar se reconcilia una vez con el contenido real de la carpeta.
+"""
+
+import os  # Para recorrer la carpeta de subidas
+import logging  # Para registrar la reconciliación
+from datetime import datetime  # Para las fechas de modificación
+from typing import Dict, List, Optional, Tuple  # Para anotaciones de tipos
+
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models.models import ExcelUpload, UploadedFile  # Registro de subidas e índice de archivos
+
+logger = logging.getLogger(__name__)
+
+# Columnas por las que se puede ordenar el listado
+SORT_COLUMNS = {
+    "name": UploadedFile.file_name,
+    "size": UploadedFile.size_bytes,
+    "modified": UploadedFile.modified_at,
+}
+
+
+def register_file(
+    db: Session,
+    file_path: str,
+    file_name: Optional[str] = None,
+    content_hash: Optional[str] = None,
+):
+    """
+    Anoto (o actualizo) un archivo recién guardado en la carpeta uploads.
+
+    Llama a os.stat, así que desde código asíncrono debe ejecutarse en el threadpool.
+    """
+    stored_name = os.path.basename(file_path)
+    stat = os.stat(file_path)
+    db.merge(UploadedFile(
+        stored_name=stored_name,
+        file_name=file_name or stored_name,
+        content_hash=content_hash,
+        size_bytes=stat.st_size,
+        modified_at=datetime.fromtimestamp(stat.st_mtime),
+    ))
+    db.commit()
+
+
+def unregister_files(db: Session, stored_names: List[str]):
+    """Quito del índice los archivos eliminados de la carpeta uploads."""
+    if not stored_names:
+        return
+    db.query(UploadedFile).filter(UploadedFile.stored_name.in_(stored_names)).delete(synchronize_session=False)
+    db.commit()
+
+
+def list_files(
+    db: Session,
+    limit: int = 100,
+    offset: int = 0,
+    sort: str = "modified",
+    order: str = "desc",
+) -> Tuple[List[UploadedFile], int]:
+    """
+    Devuelvo una página del índice de archivos.
+
+    Returns:
+        Tupla (archivos de la página, total de archivos)
+    """
+    column = SORT_COLUMNS[sort]
+    ordering = column.desc() if order == "desc" else column.asc()
+    files = db.query(UploadedFile).order_by(ordering, UploadedFile.stored_name).offset(offset).limit(limit).all()
+    total = db.query(UploadedFile).count()
+    return files, total
+
+
+def reconcile_upload_dir(db: Session, upload_dir: str) -> Dict[str, int]:
+    """
+    Sincronizo el índice con el contenido real de la carpeta uploads.
+
+    Agrega los archivos que no figuraban (por ejemplo, subidos antes de
+    existir el índice) y quita los que ya no están en disco. Usa os.scandir,
+    que obtiene tamaño y fecha sin una llamada extra por archivo.
+
+    Returns:
+        Diccionario con los archivos agregados y quitados
+    """
+    indexed = {stored_name for (stored_name,) in db.query(UploadedFile.stored_name)}
+    originals = {
+        stored_name: (file_name, content_hash)
+        for stored_name, file_name, content_hash in db.query(
+            ExcelUpload.stored_name, ExcelUpload.file_name, ExcelUpload.content_hash
+        )
+    }
+
+    on_disk = set()
+    added = 0
+    if os.path.isdir(upload_dir):
+        with os.scandir(upload_dir) as entries:
+            for entry in entries:
+                # Las subidas temporales en curso (.incoming-*) no se indexan
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                on_disk.add(entry.name)
+                if entry.name in indexed:
+                    continue
+                stat = entry.stat()
+                file_name, content_hash = originals.get(entry.name, (entry.name, None))
+                db.add(UploadedFile(
+                    stored_name=entry.name,
+                    file_name=file_name,
+                    content_hash=content_hash,
+                    size_bytes=stat.st_size,
+                    modified_at=datetime.fromtimestamp(stat.st_mtime),
+                ))
+                added += 1
+
+    # Quito los que faltan por bloques para no superar el límite de parámetros del motor
+    missing = list(indexed - on_disk)
+    for start in range(0, len(missing), 500):
+        chunk = missing[start:start + 500]
+        db.query(UploadedFile).filter(UploadedFile.stored_name.in_(chunk)).delete(synchronize_session=False)
+    db.commit()
+
+    if added or missing:
+        logger.info(f"Índice de uploads reconciliado: {added} agregados, {len(missing)} quitados")
+    return {"added": added, "removed": len(missing)}
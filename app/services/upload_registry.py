@@ -0,0 +1,165 @@
+"""
+Registro de archivos cargados por el hash de su contenido.
+
+Cada subida se guarda en disco como <hash><extensión> y se anota en la
+tabla excel_uploads. Si llega otra vez el mismo contenido (por ejemplo,
+un reintento del cliente) no se vuelve a leer ni a insertar: se devuelve
+el resultado de la carga anterior o el trabajo que aún la está procesando.
+"""
+
+import os  # Para construir las rutas en disco
+from datetime import datetime  # Para el sello de tiempo del resultado
+from typing import Dict, List, Optional, Tuple  # Para anotaciones de tipos
+
+from sqlalchemy.exc import IntegrityError  # Para detectar subidas simultáneas del mismo archivo
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models.models import ExcelUpload  # Registro de archivos cargados
+from app.services.excel_parallel import ALL_SHEETS
+
+
+def normalize_sheets(sheets: Optional[str]) -> str:
+    """
+    Convierto el parámetro "sheets" en una clave estable.
+
+    Returns:
+        "" para la primera hoja, "*" para todas, o los nombres ordenados
+    """
+    if sheets is None:
+        return ""
+    if sheets.strip().lower() in ALL_SHEETS:
+        return "*"
+    return ",".join(sorted({name.strip() for name in sheets.split(",") if name.strip()}))
+
+
+def stored_name_for(content_hash: str, file_name: str) -> str:
+    """Nombre en disco: el hash del contenido con la extensión original."""
+    return content_hash + os.path.splitext(file_name)[1].lower()
+
+
+def find_upload(db: Session, content_hash: str, sheets: str) -> Optional[ExcelUpload]:
+    return db.query(ExcelUpload).filter(
+        ExcelUpload.content_hash == content_hash,
+        ExcelUpload.sheets == sheets,
+    ).first()
+
+
+def claim_upload(
+    db: Session,
+    content_hash: str,
+    sheets: str,
+    file_name: str,
+    size_bytes: int,
+    status: str,
+) -> Tuple[ExcelUpload, bool]:
+    """
+    Registro una subida nueva, o devuelvo la que ya existe con el mismo contenido.
+
+    Si dos peticiones suben el mismo archivo a la vez, la restricción única
+    decide cuál lo registra; la otra recibe el registro ya creado.
+
+    Returns:
+        Tupla (registro, True si lo acabo de crear)
+    """
+    upload = find_upload(db, content_hash, sheets)
+    if upload is not None:
+        return upload, False
+
+    upload = ExcelUpload(
+        content_hash=content_hash,
+        sheets=sheets,
+        file_name=file_name,
+        stored_name=stored_name_for(content_hash, file_name),
+        size_bytes=size_bytes,
+        status=status,
+    )
+    db.add(upload)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return find_upload(db, content_hash, sheets), False
+    db.refresh(upload)
+    return upload, True
+
+
+def reclaim_upload(db: Session, upload: ExcelUpload, file_name: str, status: str) -> bool:
+    """
+    Vuelvo a poner en cola una subida fallida o abandonada.
+
+    La actualización solo se aplica si el registro sigue como lo leí, así
+    dos reintentos simultáneos no procesan el mismo archivo dos veces.
+
+    Returns:
+        True si esta petición se quedó con la subida
+    """
+    claimed = db.query(ExcelUpload).filter(
+        ExcelUpload.id == upload.id,
+        ExcelUpload.status == upload.status,
+        ExcelUpload.job_id == upload.job_id,
+    ).update(
+        {"status": status, "file_name": file_name, "job_id": None, "error": None, "finished_at": None},
+        synchronize_session=False,
+    )
+    db.commit()
+    db.refresh(upload)
+    return claimed == 1
+
+
+def attach_job(db: Session, uploads: List[ExcelUpload], job_id: str):
+    """Asocio las subidas al trabajo que las va a procesar."""
+    for upload in uploads:
+        upload.job_id = job_id
+    db.commit()
+
+
+def record_job_result(
+    db: Session,
+    job_id: str,
+    status: str,
+    rows_by_file: Optional[Dict[str, int]] = None,
+    columns_by_file: Optional[Dict[str, List[str]]] = None,
+    error: Optional[str] = None,
+):
+    """
+    Guardo el resultado de un trabajo en las subidas que procesó.
+
+    Args:
+        db: Sesión de base de datos
+        job_id: Id del trabajo
+        status: Estado final del trabajo
+        rows_by_file: Filas insertadas por nombre original de archivo
+        columns_by_file: Columnas por nombre original de archivo
+        error: Mensaje de error si el trabajo falló
+    """
+    rows_by_file = rows_by_file or {}
+    columns_by_file = columns_by_file or {}
+    finished_at = datetime.utcnow()
+
+    for upload in db.query(ExcelUpload).filter(ExcelUpload.job_id == job_id):
+        upload.status = status
+        upload.rows_inserted = rows_by_file.get(upload.file_name)
+        upload.columns = columns_by_file.get(upload.file_name)
+        upload.error = error
+        upload.finished_at = finished_at
+    db.commit()
+
+
+def upload_result(upload: ExcelUpload) -> Dict:
+    """Armo el resultado de una carga anterior con el mismo formato que un trabajo."""
+    finished = upload.finished_at.isoformat() if upload.finished_at else None
+    return {
+        "job_id": upload.job_id,
+        "filename": upload.file_name,
+        "status": upload.status,
+        "progress": 100.0 if upload.rows_inserted is not None else 0.0,
+        "rows_processed": upload.rows_inserted or 0,
+        "total_rows": upload.rows_inserted,
+        "columns": upload.columns or [],
+        "sheets": [],
+        "error": upload.error,
+        "created_at": upload.created_at.isoformat() if upload.created_at else None,
+        "started_at": None,
+        "finished_at": finished,
+        "content_hash": upload.content_hash,
+    }
@@ -0,0 +1,23 @@
+"""
+Inserciones con ON CONFLICT según el motor de base de datos.
+
+PostgreSQL y SQLite comparten la sintaxis INSERT ... ON CONFLICT, pero
+SQLAlchemy la expone desde el dialecto de cada motor.
+"""
+
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+
+def dialect_insert(db: Session):
+    """
+    Devuelvo la función insert del dialecto (con on_conflict_do_update),
+    o None si el motor no soporta ON CONFLICT.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
@@ -0,0 +1,175 @@
+"""
+Alta masiva de usuarios.
+
+Dar de alta una organización con POST /users/ cuesta dos consultas de
+unicidad, un hash y un commit por usuario. Aquí se validan todas las filas
+en memoria, se buscan los correos y nombres de usuario ya registrados con
+una consulta por bloque y se insertan por lotes, cada lote en su propia
+transacción. Los hashes (lo más caro) se reparten entre los procesos del
+pool de app/services/hashing.py; de eso se encarga la ruta.
+"""
+
+import csv  # Para leer las altas desde CSV
+import io  # Para leer el CSV desde memoria
+from typing import Dict, List, Optional, Set, Tuple  # Para anotaciones de tipos
+
+from pydantic import ValidationError  # Errores de validación por fila
+from sqlalchemy import or_  # Para buscar por correo o por usuario a la vez
+from sqlalchemy.orm import Session  # Para manejar sesiones de base de datos
+
+from app.models import models  # Modelos (tablas)
+from app.schemas import schemas  # Esquemas de validación
+from app.services.upsert import dialect_insert  # INSERT ... ON CONFLICT del motor
+
+# Máximo de usuarios por petición
+MAX_BULK_USERS = 10000
+
+# Usuarios por transacción y valores por consulta de unicidad
+USER_BATCH_SIZE = 500
+USER_CHECK_CHUNK_SIZE = 1000
+
+# Estados posibles de cada fila
+USER_CREATED = "created"
+USER_ERROR = "error"
+
+# Columnas obligatorias del CSV
+CSV_COLUMNS = ("username", "email", "password")
+
+# Longitud mínima de la contraseña (igual que en POST /users/)
+MIN_PASSWORD_LENGTH = 8
+
+
+def parse_csv(content: bytes) -> List[Dict[str, Optional[str]]]:
+    """
+    Leo las filas de un CSV con encabezado username,email,password.
+
+    Raises:
+        ValueError: si el archivo no es UTF-8 o le faltan columnas
+    """
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("El archivo debe estar en UTF-8")
+
+    reader = csv.DictReader(io.StringIO(text))
+    header = [name.strip().lower() for name in reader.fieldnames or []]
+    missing = [column for column in CSV_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"Faltan columnas en el CSV: {', '.join(missing)}")
+    reader.fieldnames = header
+
+    return [
+        {column: (row.get(column) or "").strip() or None for column in CSV_COLUMNS}
+        for row in reader
+        if any((value or "").strip() for value in row.values() if isinstance(value, str))
+    ]
+
+
+def validate_rows(rows: List[Dict]) -> Tuple[List[Dict], List[Tuple[int, schemas.UserCreate]]]:
+    """
+    Valido cada fila y descarto los correos y usuarios repetidos dentro de la petición.
+
+    Returns:
+        Tupla (un resultado por fila, filas válidas como (índice, UserCreate))
+    """
+    results = [
+        {
+            "index": index,
+            "username": row.get("username"),
+            "email": row.get("email"),
+            "status": None,
+            "id": None,
+            "error": None,
+        }
+        for index, row in enumerate(rows)
+    ]
+
+    valid = []
+    seen_emails: Set[str] = set()
+    seen_usernames: Set[str] = set()
+    for index, row in enumerate(rows):
+        try:
+            user = schemas.UserCreate.model_validate(row)
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            results[index].update(status=USER_ERROR, error=f"Dato no válido en {field}: {error['msg']}")
+            continue
+
+        if len(user.password) < MIN_PASSWORD_LENGTH:
+            results[index].update(status=USER_ERROR, error="La contraseña debe tener al menos 8 caracteres")
+        elif user.email in seen_emails:
+            results[index].update(status=USER_ERROR, error="Correo repetido en la petición")
+        elif user.username in seen_usernames:
+            results[index].update(status=USER_ERROR, error="Usuario repetido en la petición")
+        else:
+            seen_emails.add(user.email)
+            seen_usernames.add(user.username)
+            results[index]["email"] = user.email
+            valid.append((index, user))
+
+    return results, valid
+
+
+def find_taken(db: Session, users: List[schemas.UserCreate]) -> Tuple[Set[str], Set[str]]:
+    """
+    Busco los correos y nombres de usuario que ya están registrados.
+
+    Una consulta por bloque de USER_CHECK_CHUNK_SIZE usuarios, por los dos
+    campos a la vez (ambos tienen índice único).
+
+    Returns:
+        Tupla (correos ya registrados, usuarios ya registrados)
+    """
+    taken_emails: Set[str] = set()
+    taken_usernames: Set[str] = set()
+    for start in range(0, len(users), USER_CHECK_CHUNK_SIZE):
+        chunk = users[start:start + USER_CHECK_CHUNK_SIZE]
+        emails = [user.email for user in chunk]
+        usernames = [user.username for user in chunk]
+        for email, username in db.query(models.User.email, models.User.username).filter(
+            or_(models.User.email.in_(emails), models.User.username.in_(usernames))
+        ):
+            taken_emails.add(email)
+            taken_usernames.add(username)
+    return taken_emails, taken_usernames
+
+
+def insert_users(db: Session, users: List[Tuple[int, schemas.UserCreate, str]], results: List[Dict]):
+    """
+    Inserto un lote de usuarios ya hasheados y hago commit.
+
+    Con ON CONFLICT DO NOTHING, un usuario registrado por otra petición
+    entre la comprobación y el INSERT no tumba el lote: simplemente no
+    vuelve en el RETURNING y se informa como ya registrado.
+
+    Args:
+        users: Lista de (índice de la fila, datos, hash de la contraseña)
+        results: Resultados por fila, que se actualizan aquí
+    """
+    if not users:
+        return
+    rows = [
+        {"username": user.username, "email": user.email, "hashed_password": hashed_password}
+        for _, user, hashed_password in users
+    ]
+
+    insert = dialect_insert(db)
+    if insert is not None:
+        table = models.User.__table__
+        stmt = insert(table).values(rows).on_conflict_do_nothing().returning(table.c.id, table.c.email)
+        ids = dict((email, user_id) for user_id, email in db.execute(stmt))
+    else:
+        # Motores sin ON CONFLICT: la comprobación previa ya descartó los registrados
+        db_users = [models.User(**row) for row in rows]
+        db.add_all(db_users)
+        db.flush()
+        ids = {db_user.email: db_user.id for db_user in db_users}
+    db.commit()
+
+    for index, user, _ in users:
+        user_id = ids.get(user.email)
+        if user_id is None:
+            results[index].update(status=USER_ERROR, error="Correo o usuario ya registrado")
+        else:
+            results[index].update(status=USER_CREATED, id=user_id)
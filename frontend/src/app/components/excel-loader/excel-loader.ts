@@ -2,8 +2,8 @@ import { Component, OnInit, OnDestroy } from '@angular/core';
 import { CommonModule } from '@angular/common';
 import { FormsModule } from '@angular/forms';
 import { ExcelService } from '../../services/excel';
-import { Subject } from 'rxjs';
-import { takeUntil } from 'rxjs/operators';
+import { Subject, of } from 'rxjs';
+import { switchMap, takeUntil } from 'rxjs/operators';
 
 @Component({
   selector: 'app-excel-loader',
@@ -112,26 +112,30 @@ export class ExcelLoader implements OnInit, OnDestroy {
     this.progress = 0;
     this.errorMessage = '';
 
-    // Conectar WebSocket para monitorear progreso
-    this.excelService.connectProgressWebSocket();
-
-    // Escuchar actualizaciones de progreso
-    this.excelService.progress$
-      .pipe(takeUntil(this.destroy$))
-      .subscribe(progress => {
-        this.progress = progress;
-      });
-
-    // Subir archivo
+    // Subir archivo; el backend responde con el id del trabajo en segundo plano
+    // (o con el resultado anterior si el mismo archivo ya se había cargado)
     this.excelService.uploadExcel(this.selectedFile!)
-      .pipe(takeUntil(this.destroy$))
+      .pipe(
+        switchMap((response) => response.duplicate && response.status === 'completed'
+          ? of(response)
+          : this.excelService.watchJob(response.job_id)),
+        takeUntil(this.destroy$)
+      )
       .subscribe({
-        next: (response) => {
-          this.uploadStatus = 'success';
-          this.successMessage = `Archivo procesado exitosamente. ${response.rows_processed} filas procesadas.`;
-          this.rowsProcessed = response.rows_processed;
-          this.isUploading = false;
-          this.resetForm();
+        next: (job) => {
+          this.progress = job.progress;
+
+          if (job.status === 'completed') {
+            this.uploadStatus = 'success';
+            this.successMessage = `Archivo procesado exitosamente. ${job.rows_processed} filas procesadas.`;
+            this.rowsProcessed = job.rows_processed;
+            this.isUploading = false;
+            this.resetForm();
+          } else if (job.status === 'failed') {
+            this.uploadStatus = 'error';
+            this.errorMessage = job.error || 'Error al cargar el archivo';
+            this.isUploading = false;
+          }
         },
         error: (error) => {
           this.uploadStatus = 'error';
@@ -216,10 +220,17 @@ export class ExcelLoader implements OnInit, OnDestroy {
    */
   deleteAllData(): void {
     if (confirm('¿Seguro que deseas eliminar TODOS los datos? Esta acción no se puede deshacer.')) {
+      // Los datos se borran en segundo plano: espero a que termine el trabajo
       this.excelService.deleteAllData()
-        .pipe(takeUntil(this.destroy$))
+        .pipe(
+          switchMap((response) => this.excelService.watchJob(response.job_id)),
+          takeUntil(this.destroy$)
+        )
         .subscribe({
-          next: () => {
+          next: (job) => {
+            if (job.status !== 'completed') {
+              return;
+            }
             this.files = [];
             this.excelData = [];
             this.totalRecords = 0;
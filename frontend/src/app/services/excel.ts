@@ -1,6 +1,7 @@
 import { Injectable } from '@angular/core';
 import { HttpClient, HttpErrorResponse } from '@angular/common/http';
 import { Observable, Subject } from 'rxjs';
+import { AuthService } from './auth';
 
 @Injectable({
   providedIn: 'root'
@@ -11,7 +12,19 @@ export class ExcelService {
   public progress$ = this.progressSubject.asObservable();
   private websocket: WebSocket | null = null;
 
-  constructor(private http: HttpClient) { }
+  constructor(private http: HttpClient, private authService: AuthService) { }
+
+  /**
+   * URL del WebSocket de progreso: el navegador no permite encabezados en
+   * un WebSocket, así que el token va en ?token=
+   */
+  private progressUrl(jobId?: string): string {
+    const params = new URLSearchParams({ token: this.authService.getToken() ?? '' });
+    if (jobId) {
+      params.set('job_id', jobId);
+    }
+    return `ws://localhost:8000/excel/ws/progress?${params}`;
+  }
 
   /**
    * Subir archivo Excel
@@ -22,11 +35,46 @@ export class ExcelService {
     return this.http.post(`${this.apiUrl}/excel/upload_excel`, formData);
   }
 
+  /**
+   * Consultar el estado de un trabajo de carga
+   */
+  getJob(jobId: string): Observable<any> {
+    return this.http.get(`${this.apiUrl}/excel/jobs/${jobId}`);
+  }
+
+  /**
+   * Seguir un trabajo por WebSocket: el servidor solo envía mensajes
+   * cuando el estado cambia y cierra la conexión cuando el trabajo termina
+   */
+  watchJob(jobId: string): Observable<any> {
+    return new Observable(observer => {
+      const websocket = new WebSocket(this.progressUrl(jobId));
+
+      websocket.onmessage = (event) => {
+        try {
+          const job = JSON.parse(event.data);
+          this.progressSubject.next(job.progress);
+          observer.next(job);
+          if (job.status === 'completed' || job.status === 'failed') {
+            observer.complete();
+          }
+        } catch (error) {
+          console.error('Error parsing WebSocket message:', error);
+        }
+      };
+
+      websocket.onerror = (error) => observer.error(error);
+      websocket.onclose = () => observer.complete();
+
+      return () => websocket.close();
+    });
+  }
+
   /**
    * Conectar al WebSocket para monitorear progreso en tiempo real
    */
   connectProgressWebSocket(): void {
-    const wsUrl = `ws://localhost:8000/excel/ws/progress`;
+    const wsUrl = this.progressUrl();
     
     this.websocket = new WebSocket(wsUrl);
 
@@ -34,4 +34,28 @@ export class HabitService {
   deleteHabit(id: number): Observable<any> {
     return this.http.delete(`${this.apiUrl}/habits/${id}`);
   }
+
+  // Obtener el dashboard completo de un usuario (hábitos, registros recientes, rachas y resumen)
+  getDashboard(userId: number, days: number = 7): Observable<any> {
+    return this.http.get(`${this.apiUrl}/users/${userId}/dashboard`, { params: { days } });
+  }
+
+  // Obtener solo los hábitos y registros que cambiaron desde el último token
+  // (sin token se recibe todo; guardar next_token para la siguiente llamada)
+  getChanges(userId: number, since?: number): Observable<any> {
+    const params: any = { user_id: userId };
+    if (since !== undefined) {
+      params.since = since;
+    }
+    return this.http.get(`${this.apiUrl}/sync`, { params });
+  }
+
+  // Obtener los hábitos que tocan en una fecha (por defecto, hoy), incluidos los atrasados
+  getDueHabits(userId: number, date?: string): Observable<any> {
+    const params: any = { user_id: userId };
+    if (date) {
+      params.date = date;
+    }
+    return this.http.get(`${this.apiUrl}/habits/due`, { params });
+  }
 }